@@ -77,10 +77,10 @@ class RemoteOdroid(Odroid):
     def copy_parameter_file(self):
         # Copy parameter file to remote Odroid
         parameter_filepath = self.source_folder + '/data/skimage_parameters.xlsx'
-        parameter_pickle_filepath = self.source_folder + '/data/skimage_parameters.pickle'
+        parameter_cache_filepath = self.source_folder + '/data/skimage_parameters.cache'
         try:
             logging.info('Removing old versions of the parameter file . . . ')
-            self.send_ssh_command('rm -f ' + parameter_filepath + ' ' + parameter_pickle_filepath)
+            self.send_ssh_command('rm -f ' + parameter_filepath + ' ' + parameter_cache_filepath)
         except:
             logging.warning('Error in deleting old versions of the parameter file on the remote Odroid')
         
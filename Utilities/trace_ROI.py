@@ -4,6 +4,7 @@ import time
 from tkinter import messagebox
 import pandas
 import fnmatch
+import parameter_parser
 
 def trace_ROI(App):
     global parameters, i, drawingROI, drawingCL, selectedLine, ROImask, ROI, cut_lines
@@ -16,9 +17,8 @@ def trace_ROI(App):
     def initialize_mask(parameters):
         # global parameters
         # Compute the ROI mask once to keep it in memory
-        roi_norm_str = eval(str(parameters['ROI']))
-        if roi_norm_str:
-            roi_norm = np.asarray(roi_norm_str)
+        roi_norm = parameter_parser.parse_list_of_points(parameters['ROI'])
+        if len(roi_norm):
             roi = (roi_norm * [parameters['Width_Image'], parameters['Height_Image']]).astype(int)  # scale ROI with image size, round to nearest pixel
             roi_mask = np.zeros((parameters['Height_Image'], parameters['Width_Image']), dtype=np.uint8)
             ROI_mask = cv2.drawContours(image=roi_mask, contours=[roi], contourIdx=0, color=(255, 255, 255),
@@ -38,9 +38,8 @@ def trace_ROI(App):
         cutline_keys = fnmatch.filter(parameters.keys(), 'Cut_Line*')
         cut_lines = []
         for key in cutline_keys:
-            cutLine_norm_str = eval(str(parameters[key]))
-            if cutLine_norm_str:
-                cutLine_norm = np.asarray(cutLine_norm_str)
+            cutLine_norm = parameter_parser.parse_list_of_points(parameters[key])
+            if len(cutLine_norm):
                 cutLine = (cutLine_norm * [parameters['Width_Image'], parameters['Height_Image']]).astype(int)  # scale cut line with image size, round to nearest pixel
             else:
                 cutLine = np.array([[0, 0]], dtype=np.int32)  # default cut line
@@ -300,9 +299,9 @@ def trace_ROI(App):
                 if answer == 'yes':
                     App.parameters = parameters # Ecraser les anciens paramètres avec les nouveaux
                     df = pandas.read_excel(excelPath, header=None)
-                    df.loc[App.comboBoxID.current()+1, 9] = parameters['ROI']
+                    df.loc[App.comboBoxID.current()+1, 9] = parameter_parser.format_list_of_points(parameters['ROI'])
                     for ii in range(1,5):
-                            df.loc[App.comboBoxID.current()+1, 9+ii]  = parameters['Cut_Line' + str(ii)]                   
+                            df.loc[App.comboBoxID.current()+1, 9+ii]  = parameter_parser.format_list_of_points(parameters['Cut_Line' + str(ii)])                   
                     try:
                         with pandas.ExcelWriter(excelPath) as writer:
                             df.to_excel(writer, header=None, index=False, sheet_name='All')
@@ -0,0 +1,60 @@
+# -*- encoding: utf-8 -*-
+# Registry of the detection/tracking backends.
+#
+# A backend is a class implementing the DetectAndTrack interface used by CameraCore.
+# The backend is chosen with the optional 'Backend' parameter:
+#   'auto' (default): the compiled module matching the machine, Detect_and_Track_ARM or _x86
+#                     (the other one if it is not found)
+#   'ARM', 'x86': the compiled modules, only found in the Skimage docker image
+#   'numpy': the pure NumPy reference implementation, see numpy_backend
+#   'replay': replays trajectories instead of processing video, see replay_backend
+#   'tracks': replays the tracks recorded by Skimage (Camera_Path is the recording), see track_recording
+# Modules are only imported when their backend is selected.
+
+import importlib
+import logging
+import os
+import parameter_parser
+
+backend_logger = logging.getLogger('skimage.backends')
+
+# Backend name -> (module, class)
+BACKENDS = {'ARM': ('Detect_and_Track_ARM', 'DetectAndTrack'),
+            'x86': ('Detect_and_Track_x86', 'DetectAndTrack'),
+            'numpy': ('numpy_backend', 'NumpyDetectAndTrack'),
+            'replay': ('replay_backend', 'ReplayDetectAndTrack'),
+            'tracks': ('track_recording', 'TrackReplay')}
+
+
+def register_backend(name, module_name, class_name):
+    BACKENDS[name] = (module_name, class_name)
+
+
+def default_backend_names():
+    # Compiled modules, the one matching the machine first
+    if os.uname().machine == 'armv71':
+        return ['ARM', 'x86']
+    return ['x86', 'ARM']
+
+
+def get_backend_class(name):
+    if name == 'auto':
+        for name in default_backend_names():
+            try:
+                return get_backend_class(name)
+            except ImportError:
+                pass
+        raise ImportError('No compiled Detect_and_Track module found')
+    if name not in BACKENDS:
+        raise ValueError('Unknown backend "' + str(name) + '", valid backends are: '
+                         + ', '.join(['auto'] + list(BACKENDS)))
+    module_name, class_name = BACKENDS[name]
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+def create_backend(parameters):
+    # Instantiates the backend selected by the parameters
+    name = parameter_parser.get_optional(parameters, 'Backend', 'auto')
+    backend_class = get_backend_class(name)
+    backend_logger.info('Using the ' + backend_class.__module__ + ' detection and tracking backend')
+    return backend_class(parameters)
@@ -0,0 +1,193 @@
+# -*- encoding: utf-8 -*-
+# Offline reprocessing of recorded videos, e.g. to recount archived footage after an incident.
+#
+# Usage (from the Skimage directory, with data/skimage_parameters.xlsx):
+#   python python_src/batch_reprocess.py --id 3 /videos/2021_02_*.mp4 /videos/march/
+# Every video is counted by its own CameraCore (offline: no FTP upload, no RESET of the
+# dockers) in a pool of worker processes, one per core by default. The crossings of all
+# the videos are then merged into SKIMAGE logs aligned on the Period_Skimage_Log of the
+# sensor, one file per cut line and period, written to Logs_SKIMAGE/reprocessed/sensorID_<id>.
+#
+# The crossings are timestamped by the clock of each video (see CameraCore.make_clock), as
+# when the video is processed by skimage_edge: from the start known by the backend (e.g. a
+# track recording), else the video is assumed to end at its modification time, its start
+# is found from its number of frames and the FPS of the parameter file. The Stream_Start of
+# the sensor is not used, it cannot be the start of every video of the batch.
+
+import argparse
+import logging
+import multiprocessing
+import os
+import time
+from datetime import datetime
+from pathlib import Path
+import numpy as np
+
+import parameter_parser
+import crossing_log
+
+batch_logger = logging.getLogger('skimage.batch_reprocess')
+
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mkv', '.mov', '.mjpeg', '.h264')
+
+
+def find_videos(paths):
+    # Video files given directly, or found (sorted) in the given directories
+    videos = []
+    for path in map(Path, paths):
+        if path.is_dir():
+            videos += sorted(p for p in path.iterdir() if p.suffix.lower() in VIDEO_EXTENSIONS)
+        elif path.is_file():
+            videos.append(path)
+        else:
+            batch_logger.warning(str(path) + ' not found, skipped')
+    return videos
+
+
+def video_parameters(sensor_parameters, video):
+    # Parameters of the sensor, applied to one video file
+    parameters = dict(sensor_parameters)
+    parameters['Camera_Path'] = str(video)
+    parameters.pop('Stream_Start', None)
+    parameters = parameter_parser.compose_camera_url(parameters)
+    parameters = parameter_parser.dimensionalize_parameters(parameters)
+    # The whole video is one period, the SKIMAGE logs are written after the merge
+    parameters['Period_Skimage_Log'] = 10**9
+    return parameters
+
+
+def count_video(parameters):
+    # Worker: counts the crossings of one video, returns the frame index and cut line of
+    # every crossing, or the error if the video cannot be counted, so that one bad video
+    # does not stop the batch. Runs in its own process, so core (and the backend) is imported here.
+    try:
+        return count_crossings(parameters)
+    except (Exception, SystemExit) as error:
+        # CameraCore quits (SystemExit) when the backend or the video cannot be opened
+        batch_logger.exception('Counting ' + parameters['Camera_Path'] + ' failed')
+        return {'video': parameters['Camera_Path'], 'error': repr(error)}
+
+
+def count_crossings(parameters):
+    import core
+
+    start_time = time.perf_counter()
+    camera_core = core.CameraCore(parameters, offline=True)
+    n_frames = 0
+    while not camera_core.detect_and_track.process_frame():
+        camera_core.clock.advance(camera_core.detect_and_track)
+        camera_core.parse_cpp_tracks()
+        camera_core.do_recording()
+        n_frames += 1
+    camera_core.close()
+
+    # Timestamps (microseconds) of the crossings, and span of the video, from its clock
+    events = camera_core.list_of_crossings
+    stream_clock = camera_core.clock
+    return {'video': parameters['Camera_Path'],
+            'n_frames': n_frames,
+            'n_cut_lines': len(camera_core.cut_lines),
+            'timestamps': events.timestamps[:events.size].copy(),
+            'cut_lines': events.cut_lines[:events.size].copy(),
+            'start': crossing_log.to_timestamp(datetime.fromtimestamp(stream_clock.start_time)),
+            'end': crossing_log.to_timestamp(stream_clock.now()),
+            'elapsed': time.perf_counter() - start_time}
+
+
+def write_period_logs(output_dir, sensor_id, period, n_cut_lines, timestamps, cut_lines, spans):
+    # Writes one SKIMAGE log per cut line for every period covered by a video, even without crossings.
+    #   period: length of the periods in seconds, periods are aligned on multiples of it
+    #   spans: (start, end) timestamps of the videos
+    period_us = period * 1000000
+    covered = set()
+    for start, end in spans:
+        covered.update(range(start // period_us, end // period_us + 1))
+
+    event_periods = timestamps // period_us
+    written = []
+    for period_idx in sorted(covered):
+        in_period = event_periods == period_idx
+        period_end = crossing_log.from_timestamp((period_idx + 1) * period_us)
+        total_row = {'date': crossing_log.format_date(period_end),
+                     'time': crossing_log.format_time(period_end),
+                     'cut_period': period * 1000}
+        for ii in range(n_cut_lines):
+            line_timestamps = timestamps[in_period & (cut_lines == ii)]
+            total_row['skiers_passed'] = line_timestamps.size
+            filename = output_dir / (period_end.strftime("%Y%m%d_%H%M") + '_' + str(sensor_id) + str(ii) + '.csv')
+            crossing_log.write_skimage_log(filename, sensor_id, line_timestamps, total_row)
+            written.append(filename)
+    return written
+
+
+def main():
+    ap = argparse.ArgumentParser(description='Recount the crossings of recorded videos into SKIMAGE logs')
+    ap.add_argument('videos', nargs='+', help='Video files, or directories of video files')
+    ap.add_argument('--id', type=int, required=True, help='Sensor_ID whose parameters are used')
+    ap.add_argument('--output', help='Directory of the SKIMAGE logs (default Logs_SKIMAGE/reprocessed/sensorID_<id>)')
+    ap.add_argument('--workers', type=int, default=os.cpu_count(), help='Number of worker processes')
+    ap.add_argument('--backend', help='Detection and tracking backend, overrides the Backend parameter')
+    ap.add_argument('--param-file', default='data/skimage_parameters.xlsx')
+    args = ap.parse_args()
+
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    logging.getLogger('skimage').setLevel(logging.WARNING)
+    batch_logger.setLevel(logging.INFO)
+
+    sensor_parameters = None
+    for params in parameter_parser.get_parameters(args.param_file, get_all_params=True):
+        if params['Sensor_ID'] == args.id:
+            sensor_parameters = params
+            break
+    if sensor_parameters is None:
+        raise SystemExit('No parameters found for Sensor_ID ' + str(args.id) + ' in ' + args.param_file)
+    if args.backend:
+        sensor_parameters['Backend'] = args.backend
+    period = int(sensor_parameters['Period_Skimage_Log'])
+
+    videos = find_videos(args.videos)
+    if not videos:
+        raise SystemExit('No video to reprocess')
+    output_dir = Path(args.output) if args.output else Path('Logs_SKIMAGE') / 'reprocessed' / ('sensorID_' + str(args.id))
+    os.makedirs(output_dir, exist_ok=True)
+
+    batch_logger.info('Reprocessing ' + str(len(videos)) + ' videos of sensor ' + str(args.id)
+                      + ' with ' + str(args.workers) + ' workers')
+    start_time = time.perf_counter()
+    all_timestamps = []
+    all_cut_lines = []
+    spans = []
+    n_cut_lines = 0
+    failed = []
+    # One task per process: the state of the compiled backends is not reused between videos
+    with multiprocessing.Pool(args.workers, maxtasksperchild=1) as pool:
+        tasks = [video_parameters(sensor_parameters, video) for video in videos]
+        for result in pool.imap_unordered(count_video, tasks):
+            if 'error' in result:
+                batch_logger.error(result['video'] + ' skipped: ' + result['error'])
+                failed.append(result['video'])
+                continue
+            if result['n_frames'] == 0:
+                batch_logger.warning('No frame read from ' + result['video'])
+                continue
+            all_timestamps.append(result['timestamps'])
+            all_cut_lines.append(result['cut_lines'])
+            spans.append((result['start'], result['end']))
+            n_cut_lines = max(n_cut_lines, result['n_cut_lines'])
+            batch_logger.info(result['video'] + ': ' + str(result['n_frames']) + ' frames in '
+                              + format(result['elapsed'], '.1f') + ' s, crossings per cut line: '
+                              + '/'.join(str(x) for x in np.bincount(result['cut_lines'], minlength=result['n_cut_lines'])))
+
+    if failed:
+        batch_logger.warning(str(len(failed)) + ' videos could not be counted, their periods have no SKIMAGE logs: '
+                             + ', '.join(failed))
+    if not spans:
+        raise SystemExit('No video could be read')
+    written = write_period_logs(output_dir, args.id, period, n_cut_lines,
+                                np.concatenate(all_timestamps), np.concatenate(all_cut_lines), spans)
+    batch_logger.info(str(len(written)) + ' SKIMAGE logs written to ' + str(output_dir)
+                      + ' in ' + format(time.perf_counter() - start_time, '.1f') + ' s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+# -*- encoding: utf-8 -*-
+# Benchmark of the Python counting path (parse_cpp_tracks + do_recording) on replayed
+# tracks, without camera nor compiled Detect_and_Track module.
+#
+# Usage (from the repository root):
+#   python python_src/benchmark_counting.py --tracks 10 30 60 --cut-lines 1 4 --segments 1 8 32
+# Reports the frames per second achieved for every combination of number of concurrent
+# tracks, number of cut lines and number of segments per cut line, with the bulk export of
+# the tracks (get_multitracker_export, as the Python backends) and with the per-track lists
+# of get_multitracker_states/valids/uuids (as the compiled Detect_and_Track module).
+# The best of --repeats runs is reported, the runs of both exports alternate.
+
+import argparse
+import logging
+import os
+import tempfile
+import time
+from pathlib import Path
+
+import core
+import replay_backend
+
+
+def zigzag_cut_line(n_segments, height):
+    # Cut line across the whole image width at the normalized height, zig-zagging by +/- 5%
+    xs = [ii / n_segments for ii in range(n_segments + 1)]
+    return [[x, height + (0.05 if ii % 2 else -0.05)] for ii, x in enumerate(xs)]
+
+
+def benchmark_parameters(n_cut_lines, n_segments):
+    parameters = {'Sensor_ID': 0,
+                  'Debug_Mode': False,
+                  'Camera_Path': 'replay',
+                  'Local_File': 0,
+                  'FTP_Path': '127.0.0.1',
+                  'Width_Image': 640,
+                  'Height_Image': 360,
+                  'FPS': 16,
+                  'ROI': [[0, 0], [0, 1], [1, 1], [1, 0]],
+                  'Tracking_Start_Daily': 0,
+                  'Tracking_Stop_Daily': 25,
+                  'Period_Skimage_Log': 10**9,  # No SKIMAGE log during the benchmark
+                  'Valid_Min_Frames': 8,
+                  'Still_Valid_Max_Frames': 8}
+    for ii in range(n_cut_lines):
+        parameters['Cut_Line' + str(ii + 1)] = zigzag_cut_line(n_segments, (ii + 1) / (n_cut_lines + 1))
+    return parameters
+
+
+class ListExport:
+    # The backend without its bulk export, read through the per-track lists like the compiled module
+    def __init__(self, backend):
+        self.backend = backend
+
+    def __getattr__(self, name):
+        if name == 'get_multitracker_export':
+            raise AttributeError(name)
+        return getattr(self.backend, name)
+
+
+def run_benchmark(n_tracks, n_cut_lines, n_segments, n_frames, seed=0, bulk_export=True):
+    # Returns the frames per second through parse_cpp_tracks + do_recording, and the number of crossings
+    parameters = benchmark_parameters(n_cut_lines, n_segments)
+    backend = replay_backend.ReplayDetectAndTrack(parameters, n_frames=n_frames, n_tracks=n_tracks, seed=seed)
+    if not bulk_export:
+        backend = ListExport(backend)
+    camera_core = core.CameraCore(parameters, backend, offline=True)
+
+    elapsed = 0.0
+    while not backend.process_frame():
+        start_time = time.perf_counter()
+        camera_core.parse_cpp_tracks()
+        camera_core.do_recording()
+        elapsed += time.perf_counter() - start_time
+
+    camera_core.close()
+    return n_frames / elapsed, sum(camera_core.skiers_passed)
+
+
+def main():
+    ap = argparse.ArgumentParser(description='Benchmark of the Skimage counting path on replayed tracks')
+    ap.add_argument('--tracks', type=int, nargs='+', default=[10, 30, 60], help='Number of concurrent tracks')
+    ap.add_argument('--cut-lines', type=int, nargs='+', default=[1, 4], help='Number of cut lines')
+    ap.add_argument('--segments', type=int, nargs='+', default=[1, 8, 32], help='Number of segments per cut line')
+    ap.add_argument('--frames', type=int, default=2000, help='Number of frames replayed per run')
+    ap.add_argument('--repeats', type=int, default=3,
+                    help='Runs per combination, alternating bulk and lists, the best FPS is reported')
+    ap.add_argument('--seed', type=int, default=0)
+    args = ap.parse_args()
+
+    logging.getLogger('skimage').setLevel(logging.WARNING)
+
+    # CameraCore expects the Skimage directory tree, use a scratch one
+    with tempfile.TemporaryDirectory() as scratch_dir:
+        cwd = os.getcwd()
+        os.chdir(scratch_dir)
+        (Path(scratch_dir) / 'data').mkdir()
+        try:
+            print('{:>8} {:>10} {:>10} {:>12} {:>12} {:>10}'.format('tracks', 'cut_lines', 'segments',
+                                                                   'FPS bulk', 'FPS lists', 'crossings'))
+            for n_tracks in args.tracks:
+                for n_cut_lines in args.cut_lines:
+                    for n_segments in args.segments:
+                        fps = fps_lists = 0.0
+                        for _ in range(args.repeats):
+                            fps_run, n_crossings = run_benchmark(n_tracks, n_cut_lines, n_segments,
+                                                                 args.frames, args.seed)
+                            fps = max(fps, fps_run)
+                            fps_run, _ = run_benchmark(n_tracks, n_cut_lines, n_segments, args.frames, args.seed,
+                                                       bulk_export=False)
+                            fps_lists = max(fps_lists, fps_run)
+                        print('{:>8} {:>10} {:>10} {:>12.1f} {:>12.1f} {:>10}'.format(n_tracks, n_cut_lines, n_segments,
+                                                                                  fps, fps_lists, n_crossings))
+        finally:
+            os.chdir(cwd)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+# -*- encoding: utf-8 -*-
+# Benchmark of the per-frame savings of ROI_Crop on the NumPy detection backend.
+#
+# Usage (from the repository root):
+#   python python_src/benchmark_detection.py --roi-heights 1 0.5 0.33 --frames 200
+# Synthetic frames (noise and moving blobs) are processed with a ROI band covering a part
+# of the image height, on the full frames and on the frames cropped to the bounding box of
+# the ROI. Reports the time per frame of both, and checks that the tracks are identical.
+
+import argparse
+import time
+import numpy as np
+
+import numpy_backend
+import parameter_parser
+
+
+def synthetic_frames(width, height, n_frames, n_blobs=8, seed=0):
+    # Grey frames with noise and bright squares moving across the image
+    rng = np.random.default_rng(seed)
+    starts = rng.random((n_blobs, 2)) * [width, height]
+    velocities = rng.normal(0, 3, (n_blobs, 2))
+    for frame_idx in range(n_frames):
+        frame = rng.normal(100, 3, (height, width)).astype(np.float32)
+        for x, y in (starts + velocities * frame_idx) % [width, height]:
+            frame[int(y):int(y) + 12, int(x):int(x) + 12] = 220
+        yield frame
+
+
+def detection_parameters(width, height, roi_height):
+    top = (1 - roi_height) / 2
+    return {'Width_Image': width,
+            'Height_Image': height,
+            'FPS': 16,
+            'ROI': [[0, top], [0, top + roi_height], [1, top + roi_height], [1, top]],
+            'Background_History': 50,
+            'Background_Contrast': 16,
+            'Filter_Size': 3,
+            'Min_Blob_Size': 20,
+            'Max_Blob_Size': 2000,
+            'Max_Distance': 30,
+            'Still_Valid_Max_Frames': 8}
+
+
+def run_detection(parameters, frames, crop):
+    # Returns the time per frame in ms and the final tracks
+    backend = numpy_backend.NumpyDetectAndTrack(parameters, frames)
+    backend.setup_RoI(parameters['ROI'])
+    if crop:
+        backend.setup_crop(parameter_parser.get_roi_bounding_box(parameters))
+    backend.initialize_camera()
+    n_frames = 0
+    start_time = time.perf_counter()
+    while not backend.process_frame():
+        n_frames += 1
+    elapsed = time.perf_counter() - start_time
+    return 1000 * elapsed / max(n_frames, 1), backend.get_multitracker_states()
+
+
+def main():
+    ap = argparse.ArgumentParser(description='Per-frame savings of ROI_Crop on the NumPy detection backend')
+    ap.add_argument('--width', type=int, default=640)
+    ap.add_argument('--height', type=int, default=360)
+    ap.add_argument('--frames', type=int, default=200, help='Number of frames per run')
+    ap.add_argument('--roi-heights', type=float, nargs='+', default=[1, 0.5, 0.33],
+                    help='Height of the ROI band, as a fraction of the image height')
+    args = ap.parse_args()
+
+    print('{:>10} {:>14} {:>14} {:>8} {:>10}'.format('roi_height', 'full (ms)', 'cropped (ms)', 'saving', 'identical'))
+    for roi_height in args.roi_heights:
+        parameters = detection_parameters(args.width, args.height, roi_height)
+        frames = list(synthetic_frames(args.width, args.height, args.frames))
+        full_ms, full_tracks = run_detection(parameters, frames, crop=False)
+        crop_ms, crop_tracks = run_detection(parameters, frames, crop=True)
+        identical = (len(full_tracks) == len(crop_tracks)
+                     and all(np.array_equal(a, b) for a, b in zip(full_tracks, crop_tracks)))
+        print('{:>10g} {:>14.2f} {:>14.2f} {:>7.0f}% {:>10}'.format(roi_height, full_ms, crop_ms,
+                                                                  100 * (1 - crop_ms / full_ms), str(identical)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+# -*- encoding: utf-8 -*-
+# Host mode: one Odroid serving several cameras.
+#
+# When data/my_id.txt lists several sensor IDs (e.g. "212, 213"), one CameraCore runs per
+# sensor, each in its own process, so that the detection of the cameras runs in parallel.
+# The CPUs available to Skimage are split evenly between the sensors (CPU affinity), so a
+# busy camera cannot starve the others; with more sensors than CPUs, every sensor may use
+# every CPU and the kernel shares them equally between the processes.
+# Each process is named after its sensor and the name is added to every log line, so the
+# FPS reported every Period_Skimage_Log is per sensor. The SKIMAGE logs are unchanged,
+# in Logs_SKIMAGE/sensorID_<id>.
+
+import logging
+import multiprocessing
+import os
+import core
+import parameter_parser
+
+host_logger = logging.getLogger('skimage.camera_host')
+
+
+def available_cpus():
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count()))
+
+
+def cpu_shares(n_sensors, cpus):
+    # Splits the CPUs evenly between the sensors
+    if len(cpus) < n_sensors:
+        return [set(cpus)] * n_sensors
+    return [set(cpus[ii::n_sensors]) for ii in range(n_sensors)]
+
+
+def run_camera(parameters, cpus):
+    # Entry point of the process of one sensor
+    if hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cpus)
+    camera_core = core.CameraCore(parameters,
+                                  parameter_watcher=parameter_parser.ParameterWatcher(parameters['Sensor_ID']))
+    camera_core.camera_tracking_loop()
+
+
+class CameraHost:
+    def __init__(self, parameters_list):
+        self.parameters_list = parameters_list
+        self.processes = []
+
+    def start(self):
+        # Name the sensor in the log lines of every process
+        formatter = logging.Formatter('%(asctime)s - %(processName)s - %(name)s - %(levelname)s - %(message)s')
+        for handler in logging.getLogger('skimage').handlers:
+            handler.setFormatter(formatter)
+
+        shares = cpu_shares(len(self.parameters_list), available_cpus())
+        for parameters, cpus in zip(self.parameters_list, shares):
+            sensor_id = str(parameters['Sensor_ID'])
+            process = multiprocessing.Process(target=run_camera,
+                                              args=(parameters, cpus),
+                                              name='sensor_' + sensor_id)
+            process.start()
+            self.processes.append(process)
+            host_logger.info('Sensor ' + sensor_id + ' started on CPUs ' + ','.join(str(cpu) for cpu in sorted(cpus)))
+
+    def run(self):
+        host_logger.info('Host mode, serving sensors ' + ', '.join(str(p['Sensor_ID']) for p in self.parameters_list))
+        self.start()
+        # A sensor that stops (station closed, end of the video) does not stop the others
+        for process in self.processes:
+            process.join()
+            host_logger.info('Process ' + process.name + ' exited with code ' + str(process.exitcode))
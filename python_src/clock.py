@@ -0,0 +1,59 @@
+# -*- encoding: utf-8 -*-
+# Clocks of the tracking loop: the time used for the crossings, the SKIMAGE log periods
+# and the business hours.
+#   -SystemClock: wall clock time, for live camera streams
+#   -StreamClock: time of the frame being counted, for recorded video. The frames are
+#    timestamped from the start of the stream and the FPS (or by the backend if it knows
+#    the time of its frames), so a video processed faster than real time gets the SKIMAGE
+#    logs that the live system would have written.
+# Times are in seconds since the epoch, datetimes are naive local times as datetime.now().
+#
+# The tracking loop calls advance() after each processed frame, or next_frame_time() in
+# the producer thread of the pipelined loop and set_current() when the frame is counted.
+
+import time
+from datetime import datetime
+
+
+class SystemClock:
+    def time(self):
+        return time.time()
+
+    def now(self):
+        return datetime.now()
+
+    def next_frame_time(self, detect_and_track):
+        return None
+
+    def advance(self, detect_and_track):
+        pass
+
+    def set_current(self, frame_time):
+        pass
+
+
+class StreamClock:
+    def __init__(self, start_time, fps):
+        self.start_time = start_time
+        self.fps = fps
+        self.n_frames = 0
+        self.current = start_time
+
+    def time(self):
+        return self.current
+
+    def now(self):
+        return datetime.fromtimestamp(self.current)
+
+    def next_frame_time(self, detect_and_track):
+        # Time of the next frame of the stream (processed or skipped)
+        self.n_frames += 1
+        if hasattr(detect_and_track, 'frame_timestamp'):
+            return detect_and_track.frame_timestamp()
+        return self.start_time + (self.n_frames - 1) / self.fps
+
+    def advance(self, detect_and_track):
+        self.current = self.next_frame_time(detect_and_track)
+
+    def set_current(self, frame_time):
+        self.current = frame_time
@@ -2,27 +2,32 @@
 # Import skimage modules
 import parameter_parser
 import startup_checks
+import crossings
+import crossing_log
+import tracks
+import log_writer
+import ftp_spool
+import perf_stats
+import backends
+import track_recording
+import clock
+import heartbeat
 
 # import cv2
 
 # Import external modules
 import logging
 import pickle
-import pandas as pd
 import numpy as np
-from datetime import datetime
+from datetime import datetime, timedelta
 import time
 from collections import namedtuple
 import shutil
 import random
 import os
 import fnmatch
-import ftplib
-
-if os.uname().machine == 'armv71':
-    import Detect_and_Track_ARM as cpp_fun
-else:
-    import Detect_and_Track_x86 as cpp_fun
+import queue
+import threading
 
 # Core program:
 #   -Does object detection
@@ -31,17 +36,21 @@ else:
 
 core_logger = logging.getLogger('skimage.core')
 
-class Tracker:
-    def __init__(self,track_id, x, y, size, valids, color):
-        self.UUID = track_id
-        self.Pos = np.array([x, y], np.float32)
-        self.Vit = np.array([0, 0], np.float32)
-        self.Size = np.array(size, np.int32)
-        self.Valid = np.array(valids)
-        self.color = color 
+# Parameters that a running CameraCore applies when the parameter file changes, see
+# reload_parameters. The other changes are applied at the next start of Skimage.
+LIVE_PARAMETERS = ('ROI', 'Cut_Line1', 'Cut_Line2', 'Cut_Line3', 'Cut_Line4',
+                   'Valid_Min_Frames_Norm', 'Valid_Min_Frames',
+                   'Still_Valid_Max_Frames_Norm', 'Still_Valid_Max_Frames',
+                   'Tracking_Start_Daily', 'Tracking_Stop_Daily')
 
 class CameraCore:
-    def __init__(self, parameters):
+    def __init__(self, parameters, detect_and_track=None, offline=False, clock=None, parameter_watcher=None):
+        # detect_and_track: backend instance, created from the parameters if not given
+        # offline: reprocessing of recorded video, nothing is sent to FTP and the other
+        #          Skimage containers are not stopped at the end of the video
+        # clock: time of the crossings, SKIMAGE log periods and business hours, see make_clock
+        # parameter_watcher: parameter_parser.ParameterWatcher of the parameter file, whose
+        #                    changes are applied without restarting, see reload_parameters
 
         # Set parameters for this camera
         self.parameters = parameters
@@ -55,33 +64,115 @@ class CameraCore:
         # Basic attributes
         self.sensor_id = self.parameters['Sensor_ID']
         self.debug_mode = self.parameters['Debug_Mode']
+        self.offline = offline
 
         # Initialize trackers and counters
-        self.multi_tracker = []
-        self.list_of_crossings = pd.DataFrame()
-        self.lists_of_trackers_counted = []
+        self.track_table = tracks.TrackTable()
+        self.tracker_registry = tracks.TrackRegistry()
+        self.list_of_crossings = crossing_log.CrossingEvents()
+        # Cut lines already crossed by each live tracker: UUID -> bitmask of cut line indices,
+        # a tracker is removed when it ends
+        self.trackers_counted = {}
         self.skiers_passed = []
 
         self.station_is_open = True
-        self.check_business_hours()
 
-        # Initialize logging timers
-        self.time_last_skimage_log = time.time()
+        # Pipelined tracking loop, see camera_tracking_loop
+        self.pipeline = None
+        # Tables produced and last table consumed, the difference counts the dropped tables
+        self.n_tables_produced = 0
+        self.last_table_consumed = 0
+        self.skiers_passed_changed = False
+        self.backend_updates = []
+
+        self.parameter_watcher = parameter_watcher
+
+        # Frame decimation when the processing cannot keep up with the stream, see decimate_frames
+        self.decimator = None
+        self.valid_min_frames = self.parameters['Valid_Min_Frames']
+
+        # Initialize logging counters, the timer is set once the clock is known
         self.nb_processed_frames = 0
 
-        # Set up logging directory structure
-        self.skimage_logDir = startup_checks.skimage_log_filepaths(self.parameters['Sensor_ID'])
+        # Latency histograms of the stages of the tracking loop, summarized every period
+        # (Logs_program/latency_sensorID_<id>_YYYYMMDD.bin)
+        latency_dir = None
+        if not self.offline:
+            latency_dir = startup_checks.check_filesystem()['logs_program']
+        self.stage_timers = perf_stats.StageTimers(['process_frame', 'parse_cpp_tracks', 'do_recording', 'save_skimage_log'],
+                                                   latency_dir, 'latency_sensorID_' + str(self.sensor_id))
+
         self.infoStr = ''
+        # SKIMAGE logs are written in the background, then spooled for the FTP upload.
+        # The logs of a recorded video (Local_File) carry the times of the recording: they are
+        # written to Logs_SKIMAGE/reprocessed and never sent, not to overwrite the live counts
+        if self.offline:
+            self.ftp_spool = None
+            self.log_writer = log_writer.LogWriter(lambda filenames: ' (offline, not sent to FTP)')
+        elif self.parameters['Local_File']:
+            self.ftp_spool = None
+            self.log_writer = log_writer.LogWriter(lambda filenames: ' (recorded video, not sent to FTP)')
+        else:
+            spool_dir = startup_checks.skimage_log_filepaths('ftp') / ('sensorID_' + str(self.sensor_id))
+            self.ftp_spool = ftp_spool.FtpSpool(spool_dir,
+                                                server=self.parameters['FTP_Path'],
+                                                username='skiflux',
+                                                password='Sk1Flux.')
+            self.log_writer = log_writer.LogWriter(self.ftp_spool.enqueue)
+
+        # Frame progress read by the watchdog, which restarts a stalled Skimage within seconds
+        self.heartbeat = None
+        if not self.offline:
+            self.heartbeat = heartbeat.Heartbeat(heartbeat.heartbeat_filename(startup_checks.check_filesystem()['params'],
+                                                                              self.sensor_id))
+
+        # Optional recording of the tracks, to recount the crossings later without detection
+        self.track_recorder = None
+        if parameter_parser.checkvalid_boolean(parameter_parser.get_optional(self.parameters, 'Record_Tracks', False)):
+            recording_dir = startup_checks.check_filesystem()['logs_tracks']
+            os.makedirs(recording_dir, exist_ok=True)
+            self.track_recorder = track_recording.TrackRecorder(recording_dir / ('sensorID_' + str(self.sensor_id) + '_'
+                                                                                + datetime.now().strftime('%Y%m%d_%H%M%S')
+                                                                                + '.trk'))
 
         # Initialize cut lines, created named tuples
         self.cut_lines = []
+        self.cut_line_grid = crossings.SegmentGrid([], self.parameters['Width_Image'], self.parameters['Height_Image'])
         self.Point = namedtuple('Point', ['x', 'y'])
         self.initialize_cut_line()
         for cut_line in self.cut_lines:
-            self.lists_of_trackers_counted.append([])
             self.skiers_passed.append(0)
-        self.detect_and_track = cpp_fun.DetectAndTrack(parameters)
-        self.detect_and_track.setup_RoI(parameters['ROI'])
+        self.detect_and_track = None
+        self.start_backend(detect_and_track)
+
+        # Initialize logging timer and directory structure, at the time of the stream
+        self.clock = clock if clock is not None else self.make_clock()
+        self.time_last_skimage_log = self.clock.time()
+        # The folder of the day is created with its first SKIMAGE log, see save_skimage_log
+        # (none for the offline counts, which write their own logs)
+        self.skimage_log_date = None
+        self.skimage_logDir = None
+        self.check_business_hours()
+
+        max_decimation = int(parameter_parser.get_optional(self.parameters, 'Max_Frame_Decimation', 1))
+        if max_decimation > 1:
+            if hasattr(self.detect_and_track, 'skip_frame'):
+                self.decimator = FrameDecimator(self.parameters['FPS'], max_decimation)
+            else:
+                core_logger.warning('The detection and tracking backend cannot skip frames: frame decimation is disabled, '
+                                    'Max_Frame_Decimation is ignored')
+
+    def start_backend(self, detect_and_track=None):
+        # Creates the detection and tracking backend (if not given) and opens the camera
+        if detect_and_track is None:
+            try:
+                detect_and_track = backends.create_backend(self.parameters)
+            except (ImportError, ValueError) as error:
+                core_logger.critical('Detection and tracking backend not available: ' + str(error) + ', quitting Skimage')
+                raise SystemExit
+        self.detect_and_track = detect_and_track
+        self.crop = None
+        self.setup_RoI()
         self.detect_and_track.set_skiers_passed(self.skiers_passed)
         video_dims = self.detect_and_track.initialize_camera()
         success = video_dims[0]
@@ -102,6 +193,43 @@ class CameraCore:
             core_logger.info("Hardware validation successful")
         else:
             core_logger.critical("Hardware validation failed. Counting disabled.")
+        return success
+
+    def setup_RoI(self):
+        # Applies the ROI of the parameters to the backend, plain lists of points for the compiled backend
+        self.detect_and_track.setup_RoI(np.asarray(self.parameters['ROI']).tolist())
+        # Detection restricted to the bounding box of the ROI, the backend reports the tracks in
+        # full frame coordinates
+        if parameter_parser.checkvalid_boolean(parameter_parser.get_optional(self.parameters, 'ROI_Crop', False)):
+            if hasattr(self.detect_and_track, 'setup_crop'):
+                crop = parameter_parser.get_roi_bounding_box(self.parameters)
+                # A new crop restarts the learning of the background
+                if crop != self.crop:
+                    self.crop = crop
+                    self.detect_and_track.setup_crop(crop)
+                    core_logger.info('Detection cropped to the bounding box of the ROI: ' + str(crop))
+            else:
+                core_logger.warning('The detection and tracking backend cannot crop frames, ROI_Crop is ignored')
+
+    def make_clock(self):
+        # Wall clock for a camera. The frames of a video file are timestamped from the start
+        # of the recording, so that it can be processed faster than real time: Stream_Start
+        # if given, else the start known by the backend, else the modification time of the
+        # file (end of the recording) minus its duration
+        if not self.parameters['Local_File']:
+            return clock.SystemClock()
+        stream_start = parameter_parser.get_optional(self.parameters, 'Stream_Start', None)
+        if stream_start is not None:
+            start_time = datetime.strptime(str(stream_start), '%Y-%m-%d %H:%M:%S').timestamp()
+        elif hasattr(self.detect_and_track, 'stream_start'):
+            start_time = self.detect_and_track.stream_start()
+        else:
+            start_time = os.path.getmtime(self.parameters['Camera_Path'])
+            n_frames = self.detect_and_track.frame_count() if hasattr(self.detect_and_track, 'frame_count') else None
+            if n_frames:
+                start_time -= n_frames / self.parameters['FPS']
+        core_logger.info('Frames of the video timestamped from ' + datetime.fromtimestamp(start_time).strftime('%Y-%m-%d %H:%M:%S'))
+        return clock.StreamClock(start_time, self.parameters['FPS'])
 
     def initialize_cut_line(self):
         # Builds the cut_lines array from the parameters
@@ -112,108 +240,115 @@ class CameraCore:
         # (x1,y1), (x2,y2), ... read in and scale into image coordinates
         for key in cutline_keys:
             cutLine = self.parameters[key]
-            if cutLine:
+            if len(cutLine):
                 cut_line_rel = np.array(cutLine, np.float32)
                 cut_line_rel[:,0] = cut_line_rel[:,0]*self.parameters['Width_Image']
                 cut_line_rel[:,1] = cut_line_rel[:,1]*self.parameters['Height_Image']
                 self.cut_lines.append(cut_line_rel)
 
+        # Precompute the segments of all the cut lines and their spatial index for the batched crossing test
+        self.cut_line_grid = crossings.SegmentGrid(self.cut_lines, self.parameters['Width_Image'], self.parameters['Height_Image'])
+
+    def next_opening(self, nowish):
+        # Start of the next business hours after nowish
+        opening = nowish.replace(hour=self.parameters['Tracking_Start_Daily'], minute=0, second=0, microsecond=0)
+        if opening <= nowish:
+            opening += timedelta(days=1)
+        return opening
+
     def check_business_hours(self):
         # Check to see that we are within business hours
-        nowish = datetime.now()
+        nowish = self.clock.now()
         if nowish.hour >= self.parameters['Tracking_Start_Daily'] and nowish.hour < self.parameters['Tracking_Stop_Daily']:
             self.station_is_open = True
         else:
             self.station_is_open = False
 
     def count_crossings(self, idx):
-        # Generate a line in the SKIMAGE log when a skier crosses the line
-        date_string = datetime.now().strftime('%d/%m/%Y')
-        time_string = datetime.now().strftime('%H:%M:%S:%f')[:-3]
-
-        log_dict = {'sensorID': str(self.sensor_id),
-                    'date': date_string,
-                    'time': time_string,
-                    'cut_period': 0,  # Milliseconds barrier was cut, not relevant for us so set to zero
-                    'voltage1': '',
-                    'voltage2': '',
-                    'voltage3': ''
-                    }
-        for i in range(len(self.cut_lines)):
-            key = 'skiers_passed_cutline_' + str(i)
-            if i == idx:
-                log_dict[key] = 1
-                self.skiers_passed[i] += 1
-            else:
-                log_dict[key] = 0
+        # Record a line in the SKIMAGE log when a skier crosses the line,
+        # the date and time are formatted when the log is saved
+        self.list_of_crossings.append(crossing_log.to_timestamp(self.clock.now()), idx)
+        self.skiers_passed[idx] += 1
 
         # Update pour l'affichage dans le C
-        self.detect_and_track.set_skiers_passed(self.skiers_passed)
-        new_row = pd.Series(log_dict)
+        self.publish_skiers_passed()
 
-        self.list_of_crossings = self.list_of_crossings.append(new_row, ignore_index=True)
+    def call_backend(self, update):
+        # The backend is only called from the thread processing the frames: in the pipelined
+        # loop, the update is made by the producer thread before processing the next frame
+        if self.pipeline is None:
+            update()
+        else:
+            self.backend_updates.append(update)
+
+    def reload_parameters(self):
+        # Applies the changes of the ROI, cut lines and thresholds found in the parameter file.
+        # Called at a period boundary, when the SKIMAGE log of the period was just handed off
+        new_parameters = self.parameter_watcher.take()
+        if new_parameters is None:
+            return
+        changed = [key for key in sorted(set(self.parameters) | set(new_parameters))
+                   if not parameter_parser.same_value(self.parameters.get(key), new_parameters.get(key))]
+        restart = [key for key in changed if key not in LIVE_PARAMETERS]
+        if restart:
+            core_logger.warning('Parameters changed, applied at the next start of Skimage: ' + ', '.join(restart))
+        live = [key for key in changed if key in LIVE_PARAMETERS]
+        if not live:
+            return
+        core_logger.info('Parameters changed, applied now: ' + ', '.join(live))
+        for key in live:
+            self.parameters[key] = new_parameters[key]
+
+        if any(key.startswith('Cut_Line') for key in live):
+            old_cut_lines = self.cut_lines
+            self.cut_lines = []
+            self.initialize_cut_line()
+            # The trackers already counted on a cut line that did not change are not counted again
+            kept = 0
+            for idx, cut_line in enumerate(self.cut_lines):
+                if idx < len(old_cut_lines) and np.array_equal(old_cut_lines[idx], cut_line):
+                    kept |= 1 << idx
+            self.trackers_counted = {track_id: counted & kept
+                                     for track_id, counted in self.trackers_counted.items() if counted & kept}
+            self.skiers_passed = [0]*len(self.cut_lines)
+            self.publish_skiers_passed()
+        if 'ROI' in live:
+            self.call_backend(self.setup_RoI)
+        if 'Still_Valid_Max_Frames' in live and not hasattr(self.detect_and_track, 'set_still_valid_max_frames'):
+            core_logger.warning('The detection and tracking backend cannot change Still_Valid_Max_Frames while running')
+        if 'Valid_Min_Frames' in live or 'Still_Valid_Max_Frames' in live:
+            self.call_backend(lambda: self.set_frame_decimation(1 if self.decimator is None else self.decimator.factor))
+
+    def publish_skiers_passed(self):
+        # In the pipelined loop the backend is only called from the producer thread,
+        # which sends the counters before processing the next frame
+        if self.pipeline is None:
+            self.detect_and_track.set_skiers_passed(self.skiers_passed)
+        else:
+            self.skiers_passed_changed = True
 
     def has_crossed(self, a1, b1, cut_line):
-        """ Returns True if line segments a1b1 and a2b2 intersect. """
+        """ Returns True if the line segment a1b1 intersects one of the segments of cut_line. """
         'https://www.toptal.com/python/computational-geometry-in-python-from-theory-to-implementation'
-        # If a radar instance calls this works because pol2cart is a valid method, else continue
-        def ccw(A, B, C):
-            """ Returns True if orientation is counter clockwise
-            Tests whether the turn formed by A, B, and C is ccw by computing cross product
-            If cross product is positive orientation is counter clockwise, if negative then clockwise """
-            if (B.x - A.x) * (C.y - A.y) > (B.y - A.y) * (C.x - A.x):
-                counter_clockwise = True
-            else:
-                counter_clockwise = False
-            return counter_clockwise
-
-        crossed_segment = []
-        for ii in range(len(cut_line)-1):
-            a2 = self.Point(cut_line[ii][0],cut_line[ii][1])
-            b2 = self.Point(cut_line[ii+1][0],cut_line[ii+1][1])
-            crossed_segment.append(ccw(a1, b1, a2) != ccw(a1, b1, b2) and ccw(a2, b2, a1) != ccw(a2, b2, b1))        
-        return any(crossed_segment)
+        # Scalar version of the batched test used in do_recording
+        segments = crossings.stack_segments([cut_line])
+        return bool(crossings.find_crossings([[a1.x, a1.y]], [[b1.x, b1.y]], segments)[0, 0])
 
     def save_skimage_log(self):
-        # Write SKIMAGE log
-        nowish = datetime.now()
-        datestr = datetime.now().strftime('%d/%m/%Y')
-        timestr = datetime.now().strftime('%H:%M:%S:%f')[:-3]
+        # Hand off the SKIMAGE log of this period to the background writer
+        nowish = self.clock.now()
+        total_row = {'date': crossing_log.format_date(nowish),
+                     'time': crossing_log.format_time(nowish),
+                     'cut_period': int((self.clock.time() - self.time_last_skimage_log) * 1000)}  # millisecs since last log
+
+        # One folder per day, Skimage may run for several days (Warm_Up_Minutes, idling while closed)
+        if nowish.date() != self.skimage_log_date:
+            self.skimage_log_date = nowish.date()
+            self.skimage_logDir = startup_checks.skimage_log_filepaths(self.parameters['Sensor_ID'], nowish,
+                                                                       reprocessed=bool(self.parameters['Local_File']))
 
         skimage_log_names = []
-        keys = []
-        for ii in range(len(self.cut_lines)):
-            keys.append('skiers_passed_cutline_' + str(ii))
-            
         for ii in range(len(self.cut_lines)):
-            if len(self.list_of_crossings) == 0:
-                total = 0
-                cutline_list_of_crossings = pd.DataFrame()
-            else:
-                key = 'skiers_passed_cutline_' + str(ii)
-                # Add the standard column for counting
-                self.list_of_crossings['skiers_passed'] = self.list_of_crossings[key]
-                # Only keep the lines corresponding to this cutline
-                cutline_list_of_crossings = self.list_of_crossings[self.list_of_crossings[key] != 0]
-                # Drop the specific columns
-                cutline_list_of_crossings = cutline_list_of_crossings.drop(columns=keys)
-                total = self.list_of_crossings[key].sum()
-            
-            total_row = pd.Series(
-                {'sensorID': str(self.sensor_id),
-                'date': datestr,
-                'time': timestr,
-                'cut_period': int((time.time() - self.time_last_skimage_log) * 1000),  # millisecs since last log
-                'voltage1': '',
-                'voltage2': '',
-                'voltage3': '',
-                'skiers_passed': total
-                })
-
-            cutline_list_of_crossings = cutline_list_of_crossings.append(total_row, ignore_index=True)
-            cutline_list_of_crossings.skiers_passed.astype(int)
-            cutline_list_of_crossings.cut_period.astype(int)
-
             skimage_log_name = self.skimage_logDir / (nowish.strftime("%Y%m%d_%H%M")
                                                     + '_'
                                                     + str(self.parameters['Sensor_ID'])
@@ -222,111 +357,184 @@ class CameraCore:
 
             skimage_log_names.append(skimage_log_name)
 
-            cutline_list_of_crossings.to_csv(skimage_log_name,
-                                        header=0,
-                                        index=False,
-                                        columns=['sensorID',
-                                                'date',
-                                                'time',
-                                                'cut_period',
-                                                'voltage1',
-                                                'voltage2',
-                                                'voltage3',
-                                                'skiers_passed'])
-
-            # # Create copy of skimage log in folder that is scanned by the send to ftp function 'monitor_logging'
-            # shutil.copy(skimage_log_name, self.skimage_logToFTP)
-            # core_logger.info('SKIMAGE log written from sensor: ' + str(self.sensor_id))
-            
         self.infoStr += ': ' + '/'.join(str(int(x)) for x in self.skiers_passed)  + ' skiers passed'
-        
-        # Send the local to remote FTP server
-        self.sendToFTP(skimage_log_names)
-        # Reset SKIMAGE dataframe
-        self.list_of_crossings = pd.DataFrame()
-        self.skiers_passed = [0]*len(self.cut_lines)
-        self.detect_and_track.set_skiers_passed(self.skiers_passed)
 
-    def sendToFTP(self,filenames):
-        server = self.parameters['FTP_Path']
-        username = 'skiflux'
-        password = 'Sk1Flux.'
-        try:
-            with ftplib.FTP(server, username, password, timeout=1) as ftp:
-                ftp.cwd('/')
-                for filename in filenames:
-                    fh = open(filename, 'rb')
-                    ftp.storbinary('STOR ' + filename.name, fh)
-                    fh.close()
-                self.infoStr += ' and logs has been successfully uploaded to FTP.'
-        except Exception as error:
-            self.infoStr += ' but FTP server cannot be reached: ' + str(error)
-        return
+        # Swap the SKIMAGE event store, the writer recycles the old one once written and spooled for FTP
+        snapshot = log_writer.PeriodSnapshot(self.sensor_id, skimage_log_names, total_row, self.list_of_crossings)
+        self.list_of_crossings = self.log_writer.new_buffer()
+        self.log_writer.submit(snapshot)
+
+        self.skiers_passed = [0]*len(self.cut_lines)
+        self.publish_skiers_passed()
 
     def do_recording(self):
-        # List of all existing trackers still in record
-        uuids_extant = [tracker.UUID for tracker in self.multi_tracker]
+        # Forget the trackers that ended, they cannot be counted again
+        trackers_counted = self.trackers_counted
+        for track_id in self.tracker_registry.ended:
+            trackers_counted.pop(track_id, None)
+
+        # Trackers that may cross a cut line on this frame:
+        # the track is longer than Valid_Min_Frames and its last two positions are valid
+        # Todo: Clean this up, allow tracks that are valid before, valid after, but for whatever reason NOT valid at the line to still be counted
+        # (more than one step per track if frames were dropped since the last call)
+        candidates, track_starts, track_stops = self.track_table.last_steps(self.valid_min_frames,
+                                                                            self.tracker_registry.steps)
+        candidates = self.track_table.uuids[candidates]
+
+        # Test the last steps of every candidate against every cut line in one pass
+        hits = self.cut_line_grid.find_crossings(track_starts, track_stops)
 
         # For each cut_line
-        for idx, cut_line in enumerate(self.cut_lines):
-            # Only keep exisiting trackers in the list of already counted trackers 
-            self.lists_of_trackers_counted[idx] = [x for x in self.lists_of_trackers_counted[idx] if x in uuids_extant]
-            # core_logger.info('trackers_counted : ' + str(self.lists_of_trackers_counted[idx]))
-            # Check every tracker
-            for tracker in self.multi_tracker:
-                # core_logger.info('tracker with ID' + str(tracker.UUID) + ' at ' + str(self.Point(tracker.Pos[0,-1], tracker.Pos[1, -1])))
-                # If the track is longer than Valid_Min_Frames
-                if tracker.Valid.size >= self.parameters['Valid_Min_Frames']:
-                    # If the last two positions of the track are valid
-                    # Todo: Clean this up, allow tracks that are valid before, valid after, but for whatever reason NOT valid at the line to still be counted
-                    if (tracker.Valid[-2:]).all():
-                        # If the track has not been already counted
-                        if tracker.UUID not in self.lists_of_trackers_counted[idx]:
-                            # Last 2 positions
-                            track_start = self.Point(tracker.Pos[0,-2], tracker.Pos[1, -2])
-                            track_stop = self.Point(tracker.Pos[0,-1], tracker.Pos[1, -1])
-                            # core_logger.info('Last 2 positions : ' + str(track_start) + ' and ' + str(track_stop))
-                            if self.has_crossed(track_start, track_stop, cut_line):
-                                # core_logger.info('CROSSED !')
-                                # Count crossing at given cut line (idx)
-                                self.count_crossings(idx)
-                                self.lists_of_trackers_counted[idx].append(tracker.UUID)
-                #         else:
-                #             core_logger.info('Already counted')                    
-                #     else:
-                #         core_logger.info('Last 2 points not valid')
-                        
-                # else:
-                #     core_logger.info('Not enough frames yet (' + str(tracker.Valid.size) + ')')
+        for idx in np.flatnonzero(hits.any(axis=0)).tolist():
+            line_bit = 1 << idx
+            # Check every tracker that crossed this cut line
+            for track_id in candidates[hits[:, idx]].tolist():
+                counted = trackers_counted.get(track_id, 0)
+                # If the track has not been already counted
+                if not counted & line_bit:
+                    # Count crossing at given cut line (idx)
+                    self.count_crossings(idx)
+                    trackers_counted[track_id] = counted | line_bit
+
+        if self.parameter_watcher is not None:
+            self.parameter_watcher.check()
 
         # If time period specified in parameter file has elapsed, write the skimage log file
-        if time.time() - self.time_last_skimage_log > self.parameters['Period_Skimage_Log']:
+        if self.clock.time() - self.time_last_skimage_log > self.parameters['Period_Skimage_Log']:
             self.time_last_skimage_log += self.parameters['Period_Skimage_Log'] # Reset timer
             avgFPS = round(self.nb_processed_frames/self.parameters['Period_Skimage_Log'],1)
             self.infoStr = str(avgFPS) + ' FPS'
+            if self.pipeline is not None:
+                self.infoStr += (' (queue ' + str(self.pipeline.queue.qsize()) + '/' + str(self.pipeline.queue.maxsize)
+                                 + ', ' + str(self.pipeline.take_drop_count()) + ' frames dropped)')
+            if self.decimator is not None:
+                self.infoStr += (' (' + str(self.decimator.take_skip_count()) + ' frames skipped, processing 1 frame in '
+                                 + str(self.decimator.factor) + ')')
+            start_time = time.perf_counter()
             self.save_skimage_log()
+            self.stage_timers.add('save_skimage_log', time.perf_counter() - start_time)
             core_logger.info(self.infoStr)
+            core_logger.info('Latencies: ' + self.stage_timers.summary())
+            self.stage_timers.end_period(self.clock.time())
+            if self.track_recorder is not None:
+                self.track_recorder.flush()
             self.nb_processed_frames = 0
 
+            if self.parameter_watcher is not None:
+                self.reload_parameters()
+
             # Check we are still in business
             self.check_business_hours()
 
-    def parse_cpp_tracks(self):
+    @property
+    def multi_tracker(self):
+        # Trackers currently alive, with their windowed history
+        return list(self.tracker_registry)
 
-        states = self.detect_and_track.get_multitracker_states()
-        valids = self.detect_and_track.get_multitracker_valids()
-        track_ids = self.detect_and_track.get_multitracker_uuids()
-        self.multi_tracker = []
-        
-        for idx, track_id in enumerate(track_ids):
-            track_state = states[idx]
-            x = track_state[:, 0]
-            y = track_state[:, 1]
-            size = track_state[:, 4]
-            valids_track = np.asarray(valids[idx]) 
-            color = [255,255,255]
-            track = Tracker(track_id, x, y , size, valids_track, color)
-            self.multi_tracker.append(track)
+    def parse_cpp_tracks(self):
+        # Bulk export of all the tracks into one contiguous table, reused from frame to frame
+        tracks.export_tracks(self.detect_and_track, self.track_table)
+        # Apply the changes of this frame to the persistent trackers
+        self.tracker_registry.update(self.track_table)
+        if self.track_recorder is not None:
+            self.track_recorder.record(self.track_table, self.tracker_registry,
+                                       crossing_log.to_timestamp(self.clock.now()))
+
+    def close(self):
+        # Make sure the last SKIMAGE logs are written before quitting,
+        # the files not uploaded yet stay in the FTP spool for the next session
+        self.log_writer.close()
+        if self.heartbeat is not None:
+            self.heartbeat.close()
+        if self.ftp_spool is not None:
+            self.ftp_spool.close()
+        if self.track_recorder is not None:
+            self.track_recorder.close()
+
+    def publish_heartbeat(self):
+        if self.heartbeat is None:
+            return
+        if self.pipeline is None:
+            self.heartbeat.beat()
+        else:
+            self.heartbeat.beat(self.pipeline.queue.qsize(), self.pipeline.queue.maxsize)
+
+    def decimate_frames(self, frame_time):
+        # Skips the frames that cannot be processed in real time, after a frame processed in frame_time seconds
+        decimator = self.decimator
+        decimator.add_processed(frame_time)
+        for _ in range(decimator.factor - 1):
+            start_time = time.perf_counter()
+            if self.detect_and_track.skip_frame():
+                break  # End of the stream, seen by the next process_frame
+            self.clock.next_frame_time(self.detect_and_track)
+            decimator.add_skipped(time.perf_counter() - start_time)
+        if decimator.update(self.clock.time()):
+            self.set_frame_decimation(decimator.factor)
+
+    def set_frame_decimation(self, factor):
+        # The tracks gain one position every `factor` frames: the thresholds in number of
+        # frames are rescaled to the effective frame rate. The steps between two positions
+        # are longer, which the crossing test handles as any other step, and the skiers move
+        # `factor` times further between two positions, so the association gate is widened.
+        self.valid_min_frames = int(self.parameters['Valid_Min_Frames'] / factor)
+        still_valid_max_frames = max(int(self.parameters['Still_Valid_Max_Frames'] / factor), 1)
+        if hasattr(self.detect_and_track, 'set_still_valid_max_frames'):
+            self.detect_and_track.set_still_valid_max_frames(still_valid_max_frames)
+        if hasattr(self.detect_and_track, 'set_max_distance'):
+            self.detect_and_track.set_max_distance(self.parameters['Max_Distance'] * factor)
+        core_logger.info('Processing 1 frame in ' + str(factor) + ': Valid_Min_Frames ' + str(self.valid_min_frames)
+                         + ', Still_Valid_Max_Frames ' + str(still_valid_max_frames))
+
+    def produce_tracks(self):
+        # Producer stage of the pipelined loop: processes the next frame and exports its tracks
+        while self.backend_updates:
+            self.backend_updates.pop(0)()
+        if self.skiers_passed_changed:
+            self.skiers_passed_changed = False
+            self.detect_and_track.set_skiers_passed(list(self.skiers_passed))
+
+        start_time = time.perf_counter()
+        ret = self.detect_and_track.process_frame()
+        if ret:
+            return None
+        export_time = time.perf_counter()
+        self.stage_timers.add('process_frame', export_time - start_time)
+
+        table = self.pipeline.reuse()
+        if table is None:
+            table = tracks.TrackTable()
+        # The table is queued, so it must not share buffers with the backend
+        tracks.export_tracks(self.detect_and_track, table, copy=True)
+        # Timed together with the registry update by the consumer
+        table.export_time = time.perf_counter() - export_time
+        table.frame_time = self.clock.next_frame_time(self.detect_and_track)
+        self.n_tables_produced += 1
+        table.sequence = self.n_tables_produced
+
+        if self.decimator is not None:
+            self.decimate_frames(time.perf_counter() - start_time)
+        return table
+
+    def consume_tracks(self, table):
+        # Consumer stage of the pipelined loop: counting and logging
+        start_time = time.perf_counter()
+        self.pipeline.recycle(self.track_table)
+        self.track_table = table
+        self.clock.set_current(table.frame_time)
+        # The tables dropped by the pipeline hold steps of the tracks started meanwhile
+        self.tracker_registry.update(self.track_table, table.sequence - self.last_table_consumed)
+        self.last_table_consumed = table.sequence
+        if self.track_recorder is not None:
+            self.track_recorder.record(self.track_table, self.tracker_registry,
+                                       crossing_log.to_timestamp(self.clock.now()))
+        recording_time = time.perf_counter()
+        self.stage_timers.add('parse_cpp_tracks', table.export_time + recording_time - start_time)
+
+        self.do_recording()
+        self.stage_timers.add('do_recording', time.perf_counter() - recording_time)
+        self.nb_processed_frames +=1
+        self.publish_heartbeat()
 
     def camera_tracking_loop(self):
         core_logger.info('Starting tracking on sensor ' + str(self.sensor_id))
@@ -341,33 +549,307 @@ class CameraCore:
         #                          ' the debugging feature.')
         #         self.debug_mode = False
 
+        # With Warm_Up_Minutes, Skimage idles while the station is closed instead of quitting,
+        # and reopens the camera that many minutes before the opening
+        warm_up_minutes = parameter_parser.get_optional(self.parameters, 'Warm_Up_Minutes', None)
+        while True:
+            end_of_stream = self.track_while_open()
+            if end_of_stream or warm_up_minutes is None:
+                break
+            self.wait_until_open(float(warm_up_minutes))
+
+        if end_of_stream:
+            core_logger.info('No more frames available, quitting skimage.')
+            if self.parameters["Local_File"]:
+                # The last period of a video file is logged as if it was complete, the live
+                # system names the SKIMAGE logs after the end of their period
+                self.time_last_skimage_log += self.parameters['Period_Skimage_Log']
+                self.clock.set_current(self.time_last_skimage_log)
+                self.infoStr = 'End of the video'
+                self.save_skimage_log()
+                core_logger.info(self.infoStr)
+            if self.parameters["Local_File"] and not self.offline:
+                os.system("touch data/semaphore/RESET") # exit skimage and watchdog dockers
+
+        self.close()
+
+        if not self.station_is_open:
+            core_logger.info('Station is closed, stopping tracking on sensor: ' 
+                                    + str(self.sensor_id)
+                                    + ' and quitting Skimage.\n\n')
+
+    def track_while_open(self):
+        # Counts until the station closes, returns True if the video stream ended before
+
+        # With a queue depth, frames are processed in a producer thread and counted in this
+        # one, so that logging or GC pauses do not stall the reading of the video stream
+        queue_depth = int(parameter_parser.get_optional(self.parameters, 'Pipeline_Queue_Depth', 0))
+        if queue_depth:
+            self.pipeline = FramePipeline(self.produce_tracks,
+                                          queue_depth,
+                                          parameter_parser.get_optional(self.parameters, 'Pipeline_Drop_Policy', 'oldest'))
+            core_logger.info('Pipelined tracking with a queue of ' + str(queue_depth)
+                             + ' frames, dropping ' + self.pipeline.drop_policy + ' frames when full')
+            self.pipeline.start()
+
+        end_of_stream = False
         while self.station_is_open:
-            start_time = datetime.now()
+            if self.pipeline is not None:
+                table = self.pipeline.get()
+                if table is None:
+                    end_of_stream = True
+                    break
+                self.consume_tracks(table)
+                continue
+
+            start_time = time.perf_counter()
             ret = self.detect_and_track.process_frame()
             if ret:
-                core_logger.info('No more frames available, quitting skimage.')
-                if self.parameters["Local_File"]:
-                    os.system("touch data/semaphore/RESET") # exit skimage and watchdog dockers
+                end_of_stream = True
                 break
+            parse_time = time.perf_counter()
+            self.stage_timers.add('process_frame', parse_time - start_time)
+            self.clock.advance(self.detect_and_track)
 
             self.parse_cpp_tracks()
+            recording_time = time.perf_counter()
+            self.stage_timers.add('parse_cpp_tracks', recording_time - parse_time)
 
             # if self.debug_mode:
             #     debugger.test()
 
             # # ****** Recording # ******
             self.do_recording()
+            end_time = time.perf_counter()
+            self.stage_timers.add('do_recording', end_time - recording_time)
 
             self.nb_processed_frames +=1
-            # core_logger.info('')
-            # core_logger.info('Processing frame ' + str(self.nb_processed_frames))
-            # proc_time = datetime.now() - start_time
-            # core_logger.info(str(1/proc_time.microseconds*1e6)[:4] + ' FPS')
+            self.publish_heartbeat()
+
+            if self.decimator is not None:
+                self.decimate_frames(end_time - start_time)
+
+        if self.pipeline is not None:
+            self.pipeline.stop()
+            self.pipeline = None
+        return end_of_stream
+
+    def reset_trackers(self):
+        # Forget the tracks of the previous backend, a new one may reuse their UUIDs
+        self.track_table = tracks.TrackTable()
+        self.tracker_registry = tracks.TrackRegistry()
+        self.trackers_counted = {}
+
+    def wait_until_open(self, warm_up_minutes):
+        # Releases the camera while the station is closed, then reopens it warm_up_minutes
+        # before the opening and runs the detection and tracking without counting, so that
+        # the background model is learned when counting starts
+        opening = self.next_opening(datetime.now())
+        warm_up_start = opening - timedelta(minutes=warm_up_minutes)
+        core_logger.info('Station is closed, sensor ' + str(self.sensor_id) + ' idles until '
+                         + warm_up_start.strftime('%Y-%m-%d %H:%M'))
+        self.detect_and_track = None
+        if self.heartbeat is not None:
+            self.heartbeat.idle()
+
+        # Short sleeps, in case the clock is changed while waiting
+        while datetime.now() < warm_up_start:
+            time.sleep(min(60, max((warm_up_start - datetime.now()).total_seconds(), 0)))
+
+        core_logger.info('Warming up sensor ' + str(self.sensor_id) + ' until the opening at '
+                         + opening.strftime('%H:%M'))
+        n_frames = 0
+        self.reset_trackers()
+        self.start_backend()
+        while datetime.now() < opening:
+            if self.detect_and_track.process_frame():
+                core_logger.warning('No frame available while warming up, reopening the camera in 10 seconds')
+                time.sleep(10)
+                self.reset_trackers()
+                self.start_backend()
+                continue
+            # Keep the trackers up to date, a skier already on the slope at the opening is counted
+            self.parse_cpp_tracks()
+            self.publish_heartbeat()
+            n_frames += 1
+        core_logger.info('Sensor ' + str(self.sensor_id) + ' warmed up on ' + str(n_frames) + ' frames')
 
-        if not self.station_is_open:
-            core_logger.info('Station is closed, stopping tracking on sensor: ' 
-                                    + str(self.sensor_id)
-                                    + ' and quitting Skimage.\n\n')
+        # Start a new SKIMAGE log period at the opening
+        self.skiers_passed = [0]*len(self.cut_lines)
+        self.publish_skiers_passed()
+        self.time_last_skimage_log = self.clock.time()
+        self.nb_processed_frames = 0
+        self.check_business_hours()
+
+
+class FrameDecimator:
+    # Chooses how many frames of the stream are consumed per processed frame (the factor),
+    # so that the processing holds real time: with processed frames taking t_p seconds and
+    # skipped frames t_s seconds, factor frames take t_p + (factor - 1) * t_s, which must not
+    # exceed factor / FPS. The times are smoothed, and the factor is updated once per second
+    # of the stream, whatever the factor.
+    SMOOTHING = 0.05
+    HEADROOM = 0.8
+    UPDATE_PERIOD = 1.0
+
+    def __init__(self, fps, max_factor):
+        self.frame_period = 1 / fps
+        self.next_update = None
+        self.max_factor = max_factor
+        self.factor = 1
+        self.processed_time = 0.0
+        self.skipped_time = 0.0
+        self.n_processed = 0
+        self.n_skipped = 0
+
+    def add_processed(self, seconds):
+        if self.n_processed == 0:
+            self.processed_time = seconds
+        self.processed_time += self.SMOOTHING * (seconds - self.processed_time)
+        self.n_processed += 1
+
+    def add_skipped(self, seconds):
+        self.skipped_time += self.SMOOTHING * (seconds - self.skipped_time)
+        self.n_skipped += 1
+
+    def take_skip_count(self):
+        n_skipped = self.n_skipped
+        self.n_skipped = 0
+        return n_skipped
+
+    def update(self, now):
+        # Returns True when the factor changed, now is the time of the clock of the stream
+        if self.next_update is None:
+            self.next_update = now + self.UPDATE_PERIOD
+        if now < self.next_update:
+            return False
+        self.next_update = now + self.UPDATE_PERIOD
+        spare_time = self.frame_period - self.skipped_time
+        if spare_time <= 0:
+            factor = self.max_factor
+        else:
+            factor = int(np.ceil((self.processed_time - self.skipped_time) / spare_time))
+        factor = min(max(factor, 1), self.max_factor)
+        # Only process more frames when there is some headroom, so the factor does not flap
+        if factor < self.factor:
+            frames_time = self.processed_time + (factor - 1) * self.skipped_time
+            if frames_time > self.HEADROOM * factor * self.frame_period:
+                factor += 1
+        if factor == self.factor:
+            return False
+        self.factor = factor
+        return True
+
+
+class FramePipeline:
+    # Runs the producer stage of the tracking loop in a background thread, feeding a bounded queue.
+    # When the queue is full the drop policy decides what happens to a new item:
+    #   'oldest': the oldest queued item is dropped to make room
+    #   'newest': the new item is dropped
+    #   'block': the producer waits for the consumer
+    DROP_POLICIES = ('oldest', 'newest', 'block')
+    END = object()
+
+    def __init__(self, produce, depth, drop_policy='oldest'):
+        if drop_policy not in self.DROP_POLICIES:
+            raise ValueError('Pipeline_Drop_Policy must be one of ' + ', '.join(self.DROP_POLICIES)
+                             + ', got ' + str(drop_policy))
+        self.produce = produce
+        self.drop_policy = drop_policy
+        self.queue = queue.Queue(maxsize=depth)
+        self.spare = queue.Queue()
+        self.n_dropped = 0
+        self.running = False
+        self.error = None
+        self.thread = threading.Thread(target=self.run, name='skimage_frame_producer', daemon=True)
+
+    def start(self):
+        self.running = True
+        self.thread.start()
+
+    def stop(self, timeout=10):
+        self.running = False
+        # Unblock the producer if it is waiting on a full queue. A producer blocked in the
+        # backend (e.g. a hung read of the stream) is left behind, it is a daemon thread
+        deadline = time.monotonic() + timeout
+        while self.thread.is_alive() and time.monotonic() < deadline:
+            try:
+                self.queue.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        self.thread.join(max(0, deadline - time.monotonic()))
+        if self.thread.is_alive():
+            core_logger.warning('Frame producer still running ' + str(timeout) + ' seconds after the stop, left behind')
+
+    def reuse(self):
+        # Returns an item recycled by the consumer, or None
+        try:
+            return self.spare.get_nowait()
+        except queue.Empty:
+            return None
+
+    def recycle(self, item):
+        self.spare.put(item)
+
+    def drop(self, item):
+        self.n_dropped += 1
+        self.recycle(item)
+
+    def take_drop_count(self):
+        n_dropped = self.n_dropped
+        self.n_dropped -= n_dropped
+        return n_dropped
+
+    def put(self, item):
+        if self.drop_policy == 'block':
+            while self.running:
+                try:
+                    self.queue.put(item, timeout=0.5)
+                    return
+                except queue.Full:
+                    pass
+        elif self.drop_policy == 'newest':
+            try:
+                self.queue.put_nowait(item)
+            except queue.Full:
+                self.drop(item)
+        else:
+            while True:
+                try:
+                    self.queue.put_nowait(item)
+                    return
+                except queue.Full:
+                    try:
+                        self.drop(self.queue.get_nowait())
+                    except queue.Empty:
+                        pass
+
+    def run(self):
+        try:
+            while self.running:
+                item = self.produce()
+                if item is None:
+                    break
+                self.put(item)
+        except Exception as error:
+            self.error = error
+        finally:
+            # The end of the stream is never dropped
+            while self.running:
+                try:
+                    self.queue.put(self.END, timeout=0.5)
+                    break
+                except queue.Full:
+                    pass
+
+    def get(self):
+        # Returns the next item, or None at the end of the stream
+        item = self.queue.get()
+        if item is self.END:
+            if self.error is not None:
+                raise self.error
+            return None
+        return item
 
 # To profile run:
 # python -B -m cProfile -o output.prof core.py
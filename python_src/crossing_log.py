@@ -0,0 +1,102 @@
+# -*- encoding: utf-8 -*-
+# In-memory store of the crossings counted during one logging period, and the writer
+# of the SKIMAGE log files built from it.
+#
+# Each crossing is stored as an integer timestamp (microseconds since the epoch, local
+# time) and the index of the cut line that was crossed, in preallocated arrays that
+# grow geometrically. The date and time strings of the SKIMAGE log are only formatted
+# when the log is written.
+
+import csv
+import os
+from datetime import datetime, timedelta
+import numpy as np
+
+EPOCH = datetime(1970, 1, 1)
+ONE_MICROSECOND = timedelta(microseconds=1)
+
+
+def to_timestamp(nowish):
+    # Converts a (naive, local) datetime to an integer number of microseconds
+    return (nowish - EPOCH) // ONE_MICROSECOND
+
+
+def from_timestamp(timestamp):
+    # Converts an integer number of microseconds back to a (naive, local) datetime
+    return EPOCH + timedelta(microseconds=int(timestamp))
+
+
+def format_date(nowish):
+    return nowish.strftime('%d/%m/%Y')
+
+
+def format_time(nowish):
+    # Milliseconds resolution
+    return nowish.strftime('%H:%M:%S:%f')[:-3]
+
+
+class CrossingEvents:
+    def __init__(self, capacity=256):
+        self.timestamps = np.zeros(capacity, np.int64)
+        self.cut_lines = np.zeros(capacity, np.int16)
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def _grow(self):
+        # Double the capacity, keeping the events already stored
+        capacity = 2 * self.timestamps.size
+        timestamps = np.zeros(capacity, np.int64)
+        cut_lines = np.zeros(capacity, np.int16)
+        timestamps[:self.size] = self.timestamps[:self.size]
+        cut_lines[:self.size] = self.cut_lines[:self.size]
+        self.timestamps = timestamps
+        self.cut_lines = cut_lines
+
+    def append(self, timestamp, cut_line):
+        if self.size == self.timestamps.size:
+            self._grow()
+        self.timestamps[self.size] = timestamp
+        self.cut_lines[self.size] = cut_line
+        self.size += 1
+
+    def clear(self):
+        # Keep the allocated arrays for the next period
+        self.size = 0
+
+    def timestamps_of(self, cut_line):
+        # Timestamps of the crossings of one cut line, in the order they were counted
+        timestamps = self.timestamps[:self.size]
+        return timestamps[self.cut_lines[:self.size] == cut_line]
+
+    def counts(self, n_cut_lines):
+        # Number of crossings of each cut line
+        return np.bincount(self.cut_lines[:self.size], minlength=n_cut_lines)
+
+
+def write_skimage_log(filename, sensor_id, timestamps, total_row):
+    # Writes one SKIMAGE log file: one line per crossing, followed by the total line.
+    #   timestamps: crossings of the cut line, see CrossingEvents.timestamps_of()
+    #   total_row: dict with the 'date', 'time', 'cut_period' and 'skiers_passed' of the total line
+    sensor_id = str(sensor_id)
+    with open(filename, 'w', newline='') as f:
+        writer = csv.writer(f, lineterminator=os.linesep)
+        for timestamp in timestamps:
+            nowish = from_timestamp(timestamp)
+            writer.writerow([sensor_id,
+                             format_date(nowish),
+                             format_time(nowish),
+                             0,  # Milliseconds barrier was cut, not relevant for us so set to zero
+                             '',
+                             '',
+                             '',
+                             1])
+        writer.writerow([sensor_id,
+                         total_row['date'],
+                         total_row['time'],
+                         int(total_row['cut_period']),
+                         '',
+                         '',
+                         '',
+                         int(total_row['skiers_passed'])])
@@ -0,0 +1,171 @@
+# -*- encoding: utf-8 -*-
+# Batched cut-line crossing engine:
+#   -Precomputes the segments of every cut line once
+#   -Tests many track steps against all the segments of all the cut lines in one NumPy pass
+#   -For cut lines with many segments, SegmentGrid only tests the segments that are close
+#    to each step, found with a uniform grid over the image
+#
+# The orientation test is the same as the scalar ccw() test that CameraCore.has_crossed
+# used to run in pure Python, evaluated in float32 so that the results are identical.
+
+import numpy as np
+
+
+def cut_line_segments(cut_line):
+    # Returns the start and end points of every segment of a cut line (in image
+    # coordinates) as two (n_segments, 2) float32 arrays
+    cut_line = np.asarray(cut_line, np.float32).reshape(-1, 2)
+    return cut_line[:-1].copy(), cut_line[1:].copy()
+
+
+def ccw(ax, ay, bx, by, cx, cy):
+    # Returns True where the turn formed by A, B and C is counter clockwise
+    # (positive cross product), broadcast over arrays
+    return (bx - ax) * (cy - ay) > (by - ay) * (cx - ax)
+
+
+def segments_cross(a1x, a1y, b1x, b1y, a2x, a2y, b2x, b2y):
+    # Returns True where the segment A1B1 intersects the segment A2B2, broadcast over arrays
+    return ((ccw(a1x, a1y, b1x, b1y, a2x, a2y) != ccw(a1x, a1y, b1x, b1y, b2x, b2y))
+            & (ccw(a2x, a2y, b2x, b2y, a1x, a1y) != ccw(a2x, a2y, b2x, b2y, b1x, b1y)))
+
+
+def steps_cross_segments(starts, stops, seg_starts, seg_stops):
+    # Returns a (n_steps, n_segments) boolean matrix, True where the track step
+    # starts[i] -> stops[i] intersects the segment seg_starts[j] -> seg_stops[j]
+    return segments_cross(starts[:, 0, np.newaxis], starts[:, 1, np.newaxis],
+                          stops[:, 0, np.newaxis], stops[:, 1, np.newaxis],
+                          seg_starts[np.newaxis, :, 0], seg_starts[np.newaxis, :, 1],
+                          seg_stops[np.newaxis, :, 0], seg_stops[np.newaxis, :, 1])
+
+
+def stack_segments(cut_lines):
+    # Precomputes the segments of all the cut lines (in image coordinates) as one
+    # table, so that find_crossings() can test them in a single pass
+    #   Returns (seg_starts, seg_stops, line_starts) where line_starts[i] is the index
+    #   of the first segment of cut line i in the table
+    seg_starts = []
+    seg_stops = []
+    line_starts = []
+    n_segments = 0
+    for cut_line in cut_lines:
+        starts, stops = cut_line_segments(cut_line)
+        seg_starts.append(starts)
+        seg_stops.append(stops)
+        line_starts.append(n_segments)
+        n_segments += starts.shape[0]
+
+    if n_segments == 0:
+        return np.zeros((0, 2), np.float32), np.zeros((0, 2), np.float32), np.array(line_starts, np.intp)
+    return np.concatenate(seg_starts), np.concatenate(seg_stops), np.array(line_starts, np.intp)
+
+
+def find_crossings(starts, stops, segments):
+    # Tests every track step against every cut line
+    #   starts, stops: (n_steps, 2) arrays with the two ends of each step
+    #   segments: the segment table of the cut lines, see stack_segments()
+    # Returns a (n_steps, n_cut_lines) boolean matrix, True where the step crosses the cut line
+    seg_starts, seg_stops, line_starts = segments
+    starts = np.asarray(starts, np.float32).reshape(-1, 2)
+    stops = np.asarray(stops, np.float32).reshape(-1, 2)
+    hits = np.zeros((starts.shape[0], line_starts.size), bool)
+    if starts.shape[0] == 0 or seg_starts.shape[0] == 0:
+        return hits
+
+    crossed = steps_cross_segments(starts, stops, seg_starts, seg_stops)
+    # Cut lines without any segment (a single point) can never be crossed
+    line_stops = np.append(line_starts[1:], seg_starts.shape[0])
+    has_segments = line_stops > line_starts
+    hits[:, has_segments] = np.logical_or.reduceat(crossed, line_starts[has_segments], axis=1)
+    return hits
+
+
+def expand_ranges(x0, y0, x1, y1, n_x):
+    # Cells of the inclusive ranges of cells [x0, x1] x [y0, y1] of each item
+    # Returns (item indices, cell indices), cells numbered row by row
+    nx = x1 - x0 + 1
+    n_cells = nx * (y1 - y0 + 1)
+    items = np.repeat(np.arange(n_cells.size), n_cells)
+    k = np.arange(items.size) - np.repeat(np.cumsum(n_cells) - n_cells, n_cells)
+    nx = nx[items]
+    return items, (y0[items] + k // nx) * n_x + x0[items] + k % nx
+
+
+class SegmentGrid:
+    # Spatial index of the segments of the cut lines: a uniform grid over the image, each
+    # cell listing the segments whose bounding box overlaps it. A track step is only tested
+    # against the segments of the cells touched by its bounding box (whose bounding box
+    # overlaps its own), so its cost does not grow with the number of segments of the cut
+    # lines. Points outside of the image are clamped to the border cells.
+    # Below DENSE_MAX_SEGMENTS segments, testing all the segments is faster.
+    DENSE_MAX_SEGMENTS = 64
+    # Bounding boxes are enlarged by PAD pixels, the exact test is left to segments_cross()
+    PAD = 1.0
+
+    def __init__(self, cut_lines, width, height, cell_size=None):
+        # cut_lines: in image coordinates, see stack_segments()
+        self.segments = stack_segments(cut_lines)
+        seg_starts, seg_stops, line_starts = self.segments
+        self.n_segments = seg_starts.shape[0]
+        self.n_cut_lines = line_starts.size
+        self.segment_lines = np.repeat(np.arange(self.n_cut_lines),
+                                       np.diff(np.append(line_starts, self.n_segments)))
+        self.seg_min = np.minimum(seg_starts, seg_stops) - self.PAD
+        self.seg_max = np.maximum(seg_starts, seg_stops) + self.PAD
+
+        # Cells about the size of a segment, but not smaller than 1/64 of the image
+        if cell_size is None:
+            extent = (self.seg_max - self.seg_min).max(axis=1).mean() if self.n_segments else 0
+            cell_size = max(extent, min(width, height) / 64, 1)
+        self.cell_size = np.float32(cell_size)
+        self.n_x = max(int(np.ceil(width / cell_size)), 1)
+        self.n_y = max(int(np.ceil(height / cell_size)), 1)
+
+        # Segments of each cell: cell_segments[cell_offsets[c]:cell_offsets[c + 1]]
+        segments, cells = expand_ranges(*self.cell_ranges(self.seg_min, self.seg_max), self.n_x)
+        order = np.argsort(cells, kind='stable')
+        self.cell_segments = segments[order]
+        self.cell_offsets = np.zeros(self.n_x * self.n_y + 1, np.intp)
+        np.cumsum(np.bincount(cells, minlength=self.n_x * self.n_y), out=self.cell_offsets[1:])
+
+    def cell_ranges(self, mins, maxs):
+        # Inclusive ranges of cells covered by the boxes [mins, maxs]
+        cells_min = np.floor(mins / self.cell_size).astype(np.intp)
+        cells_max = np.floor(maxs / self.cell_size).astype(np.intp)
+        return (np.clip(cells_min[:, 0], 0, self.n_x - 1), np.clip(cells_min[:, 1], 0, self.n_y - 1),
+                np.clip(cells_max[:, 0], 0, self.n_x - 1), np.clip(cells_max[:, 1], 0, self.n_y - 1))
+
+    def find_crossings(self, starts, stops):
+        # Same as find_crossings(starts, stops, self.segments)
+        if self.n_segments <= self.DENSE_MAX_SEGMENTS:
+            return find_crossings(starts, stops, self.segments)
+        starts = np.asarray(starts, np.float32).reshape(-1, 2)
+        stops = np.asarray(stops, np.float32).reshape(-1, 2)
+        hits = np.zeros((starts.shape[0], self.n_cut_lines), bool)
+        if starts.shape[0] == 0:
+            return hits
+
+        # Candidate (step, segment) pairs from the cells touched by each step
+        step_min = np.minimum(starts, stops)
+        step_max = np.maximum(starts, stops)
+        steps, cells = expand_ranges(*self.cell_ranges(step_min, step_max), self.n_x)
+        first = self.cell_offsets[cells]
+        n_pairs = self.cell_offsets[cells + 1] - first
+        pair_steps = np.repeat(steps, n_pairs)
+        pair_segments = self.cell_segments[np.repeat(first - np.cumsum(n_pairs) + n_pairs, n_pairs)
+                                           + np.arange(pair_steps.size)]
+
+        # Bounding box rejection
+        overlap = ((step_min[pair_steps] <= self.seg_max[pair_segments])
+                   & (self.seg_min[pair_segments] <= step_max[pair_steps])).all(axis=1)
+        pair_steps = pair_steps[overlap]
+        pair_segments = pair_segments[overlap]
+
+        seg_starts, seg_stops, _ = self.segments
+        a1 = starts[pair_steps]
+        b1 = stops[pair_steps]
+        a2 = seg_starts[pair_segments]
+        b2 = seg_stops[pair_segments]
+        crossed = segments_cross(a1[:, 0], a1[:, 1], b1[:, 0], b1[:, 1], a2[:, 0], a2[:, 1], b2[:, 0], b2[:, 1])
+        hits[pair_steps[crossed], self.segment_lines[pair_segments[crossed]]] = True
+        return hits
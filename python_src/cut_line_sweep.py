@@ -0,0 +1,191 @@
+# -*- encoding: utf-8 -*-
+# Sweep of candidate cut lines and Valid_Min_Frames_Norm thresholds over recorded tracks
+# (see track_recording), ranked against a ground truth count.
+#
+# The steps of the recording that could cross a cut line are extracted once, with the
+# semantics of CameraCore.do_recording (both ends valid, track length at the end of the
+# step, one count per track and cut line), and saved next to the recording as
+# <name>.steps.npy. The worker processes memory map this file, so the steps are shared
+# through the page cache instead of being copied to every worker.
+#
+# Usage (from the Skimage directory):
+#   python python_src/cut_line_sweep.py Logs_tracks/sensorID_3_20210214_080000.trk --id 3 \
+#       --candidates candidates.json --valid-min-frames-norm 0.25 0.5 1 --ground-truth 412
+# candidates.json holds a list of cut lines, or an object mapping names to cut lines, in
+# normalized image coordinates. The cut lines of the sensor are always evaluated, and
+# shifted vertically by each of the --shifts values.
+
+import argparse
+import csv
+import json
+import logging
+import multiprocessing
+import os
+import time
+import numpy as np
+
+import crossings
+import track_recording
+import tracks
+
+sweep_logger = logging.getLogger('skimage.cut_line_sweep')
+
+# One step that could cross a cut line: the track (one id per appearance of a UUID in the
+# registry, as each appearance is counted once), its length at the end of the step, the step
+STEP_DTYPE = np.dtype([('track', np.int64),
+                       ('length', np.int32),
+                       ('x0', np.float32),
+                       ('y0', np.float32),
+                       ('x1', np.float32),
+                       ('y1', np.float32)])
+
+# Number of steps tested against a cut line at once
+CHUNK_SIZE = 65536
+
+# Steps of the recording, memory mapped once in each worker
+_steps = None
+
+
+def extract_steps(recording):
+    # Replays the recording through a TrackRegistry, like CameraCore, and returns all the
+    # steps with both ends valid of tracks holding at least two positions
+    replay = track_recording.TrackReplay(None, recording)
+    registry = tracks.TrackRegistry()
+    appearances = {}
+    chunks = []
+    while not replay.process_frame():
+        registry.update(replay.table)
+        for track_id in registry.started:
+            appearances[track_id] = len(appearances)
+        candidates, starts, stops, lengths = replay.table.last_steps(2, registry.steps, return_lengths=True)
+        if candidates.size == 0:
+            continue
+        chunk = np.empty(candidates.size, STEP_DTYPE)
+        chunk['track'] = [appearances[track_id] for track_id in replay.table.uuids[candidates].tolist()]
+        chunk['length'] = lengths
+        chunk['x0'], chunk['y0'] = starts[:, 0], starts[:, 1]
+        chunk['x1'], chunk['y1'] = stops[:, 0], stops[:, 1]
+        chunks.append(chunk)
+    return np.concatenate(chunks) if chunks else np.zeros(0, STEP_DTYPE)
+
+
+def load_steps(filename):
+    # Steps of a recording, extracted on the first use and cached next to it
+    entries_filename = track_recording.recording_filenames(filename)[0]
+    steps_filename = entries_filename.with_suffix('.steps.npy')
+    if not steps_filename.is_file() or steps_filename.stat().st_mtime < entries_filename.stat().st_mtime:
+        sweep_logger.info('Extracting the steps of ' + str(entries_filename))
+        np.save(steps_filename, extract_steps(track_recording.TrackRecording(entries_filename)))
+    return steps_filename
+
+
+def init_worker(steps_filename):
+    global _steps
+    _steps = np.load(steps_filename, mmap_mode='r')
+
+
+def count_crossings(task):
+    # Worker: number of tracks crossing one cut line for each minimum number of frames
+    #   task: (name, cut line in image coordinates, image width and height, list of Valid_Min_Frames)
+    name, cut_line, width, height, min_frames = task
+    grid = crossings.SegmentGrid([cut_line], width, height)
+    # Longest length reached by each track on a step crossing the cut line
+    crossing_tracks = [np.zeros(0, np.int64)]
+    crossing_lengths = [np.zeros(0, np.int32)]
+    for start in range(0, _steps.size, CHUNK_SIZE):
+        steps = _steps[start:start + CHUNK_SIZE]
+        hits = grid.find_crossings(np.column_stack((steps['x0'], steps['y0'])),
+                                   np.column_stack((steps['x1'], steps['y1'])))[:, 0]
+        crossing_tracks.append(steps['track'][hits])
+        crossing_lengths.append(steps['length'][hits])
+    crossing_tracks = np.concatenate(crossing_tracks)
+    crossing_lengths = np.concatenate(crossing_lengths)
+    order = np.lexsort((crossing_lengths, crossing_tracks))
+    is_last = np.append(crossing_tracks[order][1:] != crossing_tracks[order][:-1], order.size > 0)
+    max_lengths = crossing_lengths[order][is_last]
+    # Tracks are counted once they hold max(Valid_Min_Frames, 2) positions (see TrackTable.last_steps)
+    return name, [int(np.count_nonzero(max_lengths >= max(n, 2))) for n in min_frames]
+
+
+def candidate_cut_lines(parameters, candidates_filename=None, shifts=()):
+    # Candidate cut lines in normalized image coordinates, by name
+    candidates = {}
+    for ii in range(1, 5):
+        cut_line = parameters.get('Cut_Line' + str(ii))
+        if cut_line is not None and len(cut_line):
+            for shift in [0] + list(shifts):
+                name = 'Cut_Line' + str(ii) + (format(shift, '+g') if shift else '')
+                candidates[name] = [[x, y + shift] for x, y in cut_line]
+    if candidates_filename:
+        with open(candidates_filename) as f:
+            loaded = json.load(f)
+        if isinstance(loaded, list):
+            loaded = {'candidate' + str(ii): cut_line for ii, cut_line in enumerate(loaded)}
+        candidates.update(loaded)
+    return candidates
+
+
+def main():
+    import parameter_parser
+
+    ap = argparse.ArgumentParser(description='Rank candidate cut lines on recorded tracks against a ground truth count')
+    ap.add_argument('recording', help='Track recording (.trk)')
+    ap.add_argument('--id', type=int, required=True, help='Sensor_ID whose parameters are used')
+    ap.add_argument('--ground-truth', type=int, required=True, help='Number of skiers that really passed')
+    ap.add_argument('--candidates', help='JSON file of candidate cut lines (normalized coordinates)')
+    ap.add_argument('--shifts', type=float, nargs='*', default=[],
+                    help='Vertical shifts (normalized) applied to the cut lines of the sensor')
+    ap.add_argument('--valid-min-frames-norm', type=float, nargs='+',
+                    help='Thresholds to evaluate (default: the one of the sensor)')
+    ap.add_argument('--workers', type=int, default=os.cpu_count(), help='Number of worker processes')
+    ap.add_argument('--output', help='Also write the ranked table to this CSV file')
+    ap.add_argument('--param-file', default='data/skimage_parameters.xlsx')
+    args = ap.parse_args()
+
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    sweep_logger.setLevel(logging.INFO)
+
+    parameters = None
+    for params in parameter_parser.get_parameters(args.param_file, get_all_params=True):
+        if params['Sensor_ID'] == args.id:
+            parameters = params
+            break
+    if parameters is None:
+        raise SystemExit('No parameters found for Sensor_ID ' + str(args.id) + ' in ' + args.param_file)
+    parameters = parameter_parser.dimensionalize_parameters(parameters)
+    width = parameters['Width_Image']
+    height = parameters['Height_Image']
+    norms = args.valid_min_frames_norm or [parameters['Valid_Min_Frames_Norm']]
+    min_frames = [int(norm * parameters['FPS']) for norm in norms]
+
+    candidates = candidate_cut_lines(parameters, args.candidates, args.shifts)
+    tasks = [(name, np.array(cut_line, np.float32) * [width, height], width, height, min_frames)
+             for name, cut_line in candidates.items()]
+
+    start_time = time.perf_counter()
+    steps_filename = load_steps(args.recording)
+    with multiprocessing.Pool(args.workers, initializer=init_worker, initargs=(steps_filename,)) as pool:
+        results = pool.map(count_crossings, tasks)
+    sweep_logger.info(str(len(tasks)) + ' cut lines x ' + str(len(norms)) + ' thresholds evaluated in '
+                      + format(time.perf_counter() - start_time, '.1f') + ' s')
+
+    rows = []
+    for name, counts in results:
+        for norm, count in zip(norms, counts):
+            rows.append([name, norm, count, count - args.ground_truth])
+    rows.sort(key=lambda row: (abs(row[3]), row[0], row[1]))
+
+    header = ['rank', 'cut_line', 'Valid_Min_Frames_Norm', 'count', 'error']
+    print('{:>5} {:<24} {:>22} {:>8} {:>8}'.format(*header))
+    for rank, row in enumerate(rows, 1):
+        print('{:>5} {:<24} {:>22g} {:>8} {:>+8}'.format(rank, *row))
+    if args.output:
+        with open(args.output, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(header + ['points'])
+            for rank, row in enumerate(rows, 1):
+                writer.writerow([rank] + row + [json.dumps(candidates[row[0]])])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,202 @@
+# -*- encoding: utf-8 -*-
+# Persistent outbound spool for the FTP uploads:
+#   -Files to send are linked into a spool directory and listed, in order, in a manifest
+#   -One uploader thread keeps a single FTP session open and drains the spool in order
+#   -After a failure the session is dropped and retried with an exponential backoff
+#   -The spool survives restarts, so nothing is lost during a network outage
+# ftplib is imported by the uploader side only, off the startup path of Skimage
+
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+
+spool_logger = logging.getLogger('skimage.ftp_spool')
+
+MANIFEST_NAME = 'manifest.json'
+MANIFEST_VERSION = 1
+
+
+class FtpSpool:
+    def __init__(self, spool_dir, server, username, password,
+                 timeout=5, min_backoff=1, max_backoff=300, idle_timeout=30):
+        self.spool_dir = Path(spool_dir)
+        self.spool_dir.mkdir(parents=True, exist_ok=True)
+        self.manifest_path = self.spool_dir / MANIFEST_NAME
+        self.server = server
+        self.username = username
+        self.password = password
+        self.timeout = timeout
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.idle_timeout = idle_timeout  # seconds after which an idle session is checked before use
+
+        self.ftp = None
+        self.last_used = 0
+        self.backoff = 0
+        self.retry_time = 0
+
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.stopping = False
+        self.pending = self.load_manifest()
+        if self.pending:
+            spool_logger.info(str(len(self.pending)) + ' files waiting in the FTP spool from a previous session')
+            self.wakeup.set()
+
+        self.thread = threading.Thread(target=self.run, name='skimage_ftp_spool', daemon=True)
+        self.thread.start()
+
+    # ****** Manifest ******
+    def load_manifest(self):
+        pending = []
+        if self.manifest_path.is_file():
+            try:
+                with open(self.manifest_path, 'r') as f:
+                    manifest = json.load(f)
+                if manifest.get('version') == MANIFEST_VERSION:
+                    pending = manifest['pending']
+            except (ValueError, KeyError, OSError):
+                spool_logger.exception('FTP spool manifest is corrupted, rebuilding it from the spool directory')
+
+        # Files spooled but not listed (e.g. power cut while saving the manifest) are sent last
+        listed = set(pending)
+        pending = [name for name in pending if (self.spool_dir / name).is_file()]
+        for path in sorted(self.spool_dir.iterdir()):
+            if path.name != MANIFEST_NAME and not path.name.endswith('.tmp') and path.name not in listed:
+                pending.append(path.name)
+        return pending
+
+    def save_manifest(self):
+        # Called with self.lock held. Atomic replace so the manifest is never half written
+        tmp_path = self.manifest_path.with_name(MANIFEST_NAME + '.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump({'version': MANIFEST_VERSION, 'pending': self.pending}, f)
+        os.replace(tmp_path, self.manifest_path)
+
+    # ****** Producer side ******
+    def enqueue(self, filenames):
+        # Adds files to the spool and wakes up the uploader, returns a short status message
+        with self.lock:
+            for filename in filenames:
+                filename = Path(filename)
+                spooled = self.spool_dir / filename.name
+                if spooled.exists():
+                    spooled.unlink()
+                try:
+                    os.link(filename, spooled)
+                except OSError:
+                    shutil.copy(filename, spooled)
+                if filename.name not in self.pending:
+                    self.pending.append(filename.name)
+            self.save_manifest()
+            n_pending = len(self.pending)
+        self.wakeup.set()
+
+        if self.backoff:
+            return ' and queued for FTP, server unreachable (' + str(n_pending) + ' files waiting)'
+        return ' and queued for FTP'
+
+    def close(self, timeout=5):
+        # Stops the uploader, files not sent yet stay in the spool for the next session
+        self.stopping = True
+        self.wakeup.set()
+        self.thread.join(timeout)
+        # The session belongs to the uploader until it exits
+        if self.thread.is_alive():
+            spool_logger.warning('FTP upload still running after ' + str(timeout) + ' seconds, left to finish in the background')
+        else:
+            self.disconnect()
+
+    # ****** Uploader side ******
+    def connect(self):
+        import ftplib
+        if self.ftp is not None and time.time() - self.last_used > self.idle_timeout:
+            # Make sure an idle session is still alive before using it
+            try:
+                self.ftp.voidcmd('NOOP')
+            except ftplib.all_errors:
+                self.disconnect()
+
+        if self.ftp is None:
+            self.ftp = ftplib.FTP(self.server, self.username, self.password, timeout=self.timeout)
+            self.ftp.cwd('/')
+        return self.ftp
+
+    def disconnect(self):
+        import ftplib
+        if self.ftp is not None:
+            try:
+                self.ftp.quit()
+            except ftplib.all_errors:
+                self.ftp.close()
+            self.ftp = None
+
+    def drain(self):
+        # Sends the spooled files in order over one session, returns the number of files sent
+        n_sent = 0
+        while not self.stopping:
+            with self.lock:
+                if not self.pending:
+                    break
+                name = self.pending[0]
+
+            spooled = self.spool_dir / name
+            sent = None
+            if spooled.is_file():
+                ftp = self.connect()
+                with open(spooled, 'rb') as fh:
+                    sent = os.fstat(fh.fileno())
+                    ftp.storbinary('STOR ' + name, fh)
+                self.last_used = time.time()
+                n_sent += 1
+
+            with self.lock:
+                # A newer file of the same name spooled during the upload stays pending
+                try:
+                    current = os.stat(spooled)
+                except FileNotFoundError:
+                    current = None
+                if (current is not None and sent is not None
+                        and (current.st_ino, current.st_mtime_ns) != (sent.st_ino, sent.st_mtime_ns)):
+                    continue
+                self.pending.remove(name)
+                self.save_manifest()
+                if current is not None:
+                    spooled.unlink()
+        return n_sent
+
+    def run(self):
+        import ftplib
+        while not self.stopping:
+            # Sleep until new files are spooled, or until the next retry after a failure
+            if self.backoff:
+                self.wakeup.wait(max(0, self.retry_time - time.time()))
+            else:
+                self.wakeup.wait(self.idle_timeout)
+            self.wakeup.clear()
+            if self.stopping:
+                break
+            if self.backoff and time.time() < self.retry_time:
+                continue
+
+            with self.lock:
+                has_pending = bool(self.pending)
+            if not has_pending:
+                continue
+
+            try:
+                n_sent = self.drain()
+                if self.backoff:
+                    spool_logger.info('FTP server reachable again, ' + str(n_sent) + ' spooled files uploaded')
+                self.backoff = 0
+            except ftplib.all_errors as error:
+                self.disconnect()
+                self.backoff = min(max(2 * self.backoff, self.min_backoff), self.max_backoff)
+                self.retry_time = time.time() + self.backoff
+                spool_logger.warning('FTP server cannot be reached: ' + str(error) + ', '
+                                     + str(len(self.pending)) + ' files waiting, retrying in '
+                                     + str(self.backoff) + ' seconds')
@@ -0,0 +1,117 @@
+# -*- encoding: utf-8 -*-
+# Heartbeat of a running CameraCore, published in a small memory mapped file of the data
+# directory (data/heartbeat_sensorID_<id>.bin) and read by the watchdog every second, so
+# that a stalled Skimage (e.g. a hung read of the RTSP stream) is detected within seconds,
+# without scanning the SKIMAGE logs.
+#
+# The file holds one fixed size record, rewritten after every processed frame:
+#   magic, version, state, pid, sequence, number of frames, start time of the process,
+#   time of the last frame (wall clock, seconds since the epoch), frames per second over
+#   the last second, depth and size of the frame queue of the pipelined loop.
+# The sequence is odd while the record is written: the reader retries until it reads the
+# same even sequence before and after the record. The file is never removed, a restarted
+# Skimage writes to the same file, so the watchdog can keep it mapped.
+
+import mmap
+import os
+import struct
+import time
+from collections import namedtuple
+
+HEARTBEAT_MAGIC = b'SKHB'
+HEARTBEAT_VERSION = 1
+RECORD = struct.Struct('<4sHHIQQdddII')
+SEQUENCE = struct.Struct('<Q')
+SEQUENCE_OFFSET = 12
+
+# States of Skimage
+STARTING = 0  # opening the camera, no frame processed yet
+RUNNING = 1   # processing frames
+IDLE = 2      # camera released while the station is closed, see CameraCore.wait_until_open
+STOPPED = 3   # quit
+
+# Period over which the frames per second are measured
+FPS_WINDOW = 1.0
+
+HeartbeatRecord = namedtuple('HeartbeatRecord', ['magic', 'version', 'state', 'pid', 'sequence',
+                                                 'n_frames', 'start_time', 'last_frame_time', 'fps',
+                                                 'queue_depth', 'queue_size'])
+
+
+def heartbeat_filename(data_dir, sensor_id):
+    return data_dir / ('heartbeat_sensorID_' + str(sensor_id) + '.bin')
+
+
+class Heartbeat:
+    # Writer side, in CameraCore
+    def __init__(self, filename):
+        fd = os.open(str(filename), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            os.ftruncate(fd, RECORD.size)
+            self.mm = mmap.mmap(fd, RECORD.size)
+        finally:
+            os.close(fd)
+        self.sequence = SEQUENCE.unpack_from(self.mm, SEQUENCE_OFFSET)[0] & ~1
+        self.start_time = time.time()
+        self.n_frames = 0
+        self.window_start = self.start_time
+        self.window_frames = 0
+        self.fps = 0.0
+        self.last_frame_time = self.start_time
+        self.write(STARTING)
+
+    def write(self, state, queue_depth=0, queue_size=0):
+        self.sequence += 1
+        SEQUENCE.pack_into(self.mm, SEQUENCE_OFFSET, self.sequence)
+        RECORD.pack_into(self.mm, 0, HEARTBEAT_MAGIC, HEARTBEAT_VERSION, state, os.getpid(), self.sequence,
+                         self.n_frames, self.start_time, self.last_frame_time, self.fps, queue_depth, queue_size)
+        self.sequence += 1
+        SEQUENCE.pack_into(self.mm, SEQUENCE_OFFSET, self.sequence)
+
+    def beat(self, queue_depth=0, queue_size=0):
+        # One more frame processed
+        now = time.time()
+        self.n_frames += 1
+        if now - self.window_start >= FPS_WINDOW:
+            self.fps = (self.n_frames - self.window_frames) / (now - self.window_start)
+            self.window_start = now
+            self.window_frames = self.n_frames
+        self.last_frame_time = now
+        self.write(RUNNING, queue_depth, queue_size)
+
+    def idle(self):
+        self.fps = 0.0
+        self.write(IDLE)
+
+    def close(self):
+        self.write(STOPPED)
+        self.mm.close()
+
+
+class HeartbeatReader:
+    # Reader side, in the watchdog
+    RETRIES = 100
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.mm = None
+
+    def read(self):
+        # Returns the last HeartbeatRecord, None if Skimage publishes no heartbeat (yet)
+        if self.mm is None:
+            try:
+                with open(str(self.filename), 'rb') as f:
+                    self.mm = mmap.mmap(f.fileno(), RECORD.size, access=mmap.ACCESS_READ)
+            except (OSError, ValueError):
+                return None
+
+        for _ in range(self.RETRIES):
+            sequence = SEQUENCE.unpack_from(self.mm, SEQUENCE_OFFSET)[0]
+            if sequence % 2:
+                continue
+            record = HeartbeatRecord._make(RECORD.unpack_from(self.mm, 0))
+            if SEQUENCE.unpack_from(self.mm, SEQUENCE_OFFSET)[0] == sequence == record.sequence:
+                if record.magic != HEARTBEAT_MAGIC or record.version != HEARTBEAT_VERSION:
+                    return None
+                return record
+        return None
@@ -0,0 +1,77 @@
+# -*- encoding: utf-8 -*-
+# Background writer for the SKIMAGE logs:
+#   -The tracking loop hands off the crossings of a finished period (a snapshot)
+#   -A worker thread writes one SKIMAGE log per cut line, then hands them to the uploader
+#   -The event buffers are recycled, so the tracking loop only swaps buffers
+
+import logging
+import queue
+import threading
+from collections import namedtuple
+import crossing_log
+
+writer_logger = logging.getLogger('skimage.log_writer')
+
+# Everything needed to write the SKIMAGE logs of one period
+#   filenames: one SKIMAGE log file per cut line
+#   total_row: 'date', 'time' and 'cut_period' of the total line
+PeriodSnapshot = namedtuple('PeriodSnapshot', ['sensor_id', 'filenames', 'total_row', 'events'])
+
+
+class LogWriter:
+    def __init__(self, upload, max_pending=4):
+        # upload: called by the worker with the list of written files (e.g. FtpSpool.enqueue),
+        #         returns a message describing the outcome of the upload
+        self.upload = upload
+        self.pending = queue.Queue(maxsize=max_pending)
+        self.free_buffers = queue.Queue()
+        self.thread = threading.Thread(target=self.run, name='skimage_log_writer', daemon=True)
+        self.thread.start()
+
+    def new_buffer(self):
+        # Returns an empty event store, recycled from a period already written if possible
+        try:
+            return self.free_buffers.get_nowait()
+        except queue.Empty:
+            return crossing_log.CrossingEvents()
+
+    def submit(self, snapshot):
+        # Hands off a period to the worker, only blocks if max_pending periods are already waiting
+        try:
+            self.pending.put_nowait(snapshot)
+        except queue.Full:
+            writer_logger.warning('SKIMAGE log writer is falling behind, '
+                                  + str(self.pending.qsize()) + ' periods waiting to be written')
+            self.pending.put(snapshot)
+
+    def close(self, timeout=30):
+        # Writes the periods still waiting, then stops the worker
+        self.pending.put(None)
+        self.thread.join(timeout)
+        if self.thread.is_alive():
+            writer_logger.warning('SKIMAGE log writer did not finish within ' + str(timeout) + ' seconds')
+
+    def write(self, snapshot):
+        total_row = dict(snapshot.total_row)
+        totals = snapshot.events.counts(len(snapshot.filenames))
+        for ii, filename in enumerate(snapshot.filenames):
+            total_row['skiers_passed'] = totals[ii]
+            crossing_log.write_skimage_log(filename,
+                                           snapshot.sensor_id,
+                                           snapshot.events.timestamps_of(ii),
+                                           total_row)
+
+    def run(self):
+        while True:
+            snapshot = self.pending.get()
+            if snapshot is None:
+                break
+            try:
+                self.write(snapshot)
+                infoStr = self.upload(snapshot.filenames)
+                writer_logger.info('SKIMAGE logs of sensor ' + str(snapshot.sensor_id) + ' written' + infoStr)
+            except Exception:
+                writer_logger.exception('Failed to write the SKIMAGE logs of sensor ' + str(snapshot.sensor_id))
+            finally:
+                snapshot.events.clear()
+                self.free_buffers.put(snapshot.events)
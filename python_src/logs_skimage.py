@@ -6,34 +6,36 @@ from pathlib import Path
 
 # create logger
 logger = logging.getLogger('skimage')
-logger.setLevel(logging.DEBUG)
 
-# create file handler which logs to file
-logfile_dir = Path.cwd() / 'Logs_program'
-if not logfile_dir.is_dir():
-    os.mkdir(logfile_dir)
-logfile_name = logfile_dir / (
-                    'Skimage_program-'
-                    + datetime.now().strftime("%Y_%m_%d-%H_%M_%S")
-                    + '.log')
 
-fh = logging.FileHandler(logfile_name)
-fh.setLevel(logging.DEBUG)
+def setup_logging():
+    # Logs of the program to the console and to a new file of Logs_program,
+    # called once by skimage_edge (importing this module has no side effect)
+    logger.setLevel(logging.DEBUG)
 
-# create console handler
-ch = logging.StreamHandler()
-ch.setLevel(logging.DEBUG)
+    # create file handler which logs to file
+    logfile_dir = Path.cwd() / 'Logs_program'
+    if not logfile_dir.is_dir():
+        os.mkdir(logfile_dir)
+    logfile_name = logfile_dir / (
+                        'Skimage_program-'
+                        + datetime.now().strftime("%Y_%m_%d-%H_%M_%S")
+                        + '.log')
 
+    fh = logging.FileHandler(logfile_name)
+    fh.setLevel(logging.DEBUG)
 
-# create formatter and add it to the handlers
-formatter = logging.Formatter(
-    '%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-fh.setFormatter(formatter)
-ch.setFormatter(formatter)
-
-# add the handlers to the logger
-logger.addHandler(fh)
-logger.addHandler(ch)
+    # create console handler
+    ch = logging.StreamHandler()
+    ch.setLevel(logging.DEBUG)
 
 
+    # create formatter and add it to the handlers
+    formatter = logging.Formatter(
+        '%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    fh.setFormatter(formatter)
+    ch.setFormatter(formatter)
 
+    # add the handlers to the logger
+    logger.addHandler(fh)
+    logger.addHandler(ch)
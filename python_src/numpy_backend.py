@@ -0,0 +1,364 @@
+# -*- encoding: utf-8 -*-
+# Reference detection/tracking backend written with NumPy.
+#
+# NumpyDetectAndTrack implements the DetectAndTrack interface used by CameraCore, so that
+# Skimage runs without the compiled Detect_and_Track module (e.g. for offline reprocessing
+# of recorded video on a development machine):
+#   -Background subtraction: running mean and variance of every pixel, learned over
+#    Background_History frames. A pixel is foreground when its squared distance to the
+#    background exceeds Background_Contrast times the variance (like the varThreshold of
+#    OpenCV's MOG2 subtractor). Detect_Shadows is not supported.
+#   -Filtering: majority filter of size Filter_Size on the foreground mask
+#   -Blobs: connected components (4-connectivity) built from the runs of each row,
+#    kept when their area is between Min_Blob_Size and Max_Blob_Size
+#   -Tracking: greedy nearest neighbour between the predicted track positions and the
+#    blobs, within Max_Distance. Tracks without a match are predicted (not valid) and
+#    removed after Still_Valid_Max_Frames missed frames.
+# Frames are read with OpenCV if it is installed, or taken from any iterable of images.
+# With setup_crop, only the bounding box of the ROI (with a margin for the filter) is
+# processed, the blobs are found exactly as on the full frame and the tracks are reported
+# in full frame coordinates.
+
+import itertools
+import logging
+import numpy as np
+import parameter_parser
+import tracks
+
+numpy_backend_logger = logging.getLogger('skimage.numpy_backend')
+
+# Initial, minimum and maximum variance of the background model (grey levels squared)
+INIT_VARIANCE = 15.0**2
+MIN_VARIANCE = 4.0
+MAX_VARIANCE = 75.0**2
+
+
+def to_gray(frame):
+    # Grey levels as float32, frames in colour are expected in BGR order (OpenCV)
+    if frame.ndim == 3:
+        return np.dot(frame[..., :3], np.array([0.114, 0.587, 0.299], np.float32)).astype(np.float32)
+    return frame.astype(np.float32)
+
+
+def polygon_mask(polygon, width, height):
+    # Boolean mask of the pixels whose center is inside the polygon (normalized coordinates)
+    xs = ((np.arange(width) + 0.5) / width)[np.newaxis, :]
+    ys = ((np.arange(height) + 0.5) / height)[:, np.newaxis]
+    inside = np.zeros((height, width), bool)
+    polygon = np.asarray(polygon, np.float64).reshape(-1, 2)
+    for (x1, y1), (x2, y2) in zip(polygon, np.roll(polygon, -1, axis=0)):
+        if y1 == y2:
+            continue
+        crosses_row = (y1 > ys) != (y2 > ys)
+        x_intersect = x1 + (ys - y1) * (x2 - x1) / (y2 - y1)
+        inside ^= crosses_row & (xs < x_intersect)
+    return inside
+
+
+def majority_filter(mask, size):
+    # True where more than half of the size x size window around the pixel is True
+    if size <= 1:
+        return mask
+    height, width = mask.shape
+    radius = size // 2
+    integral = np.zeros((height + 1, width + 1), np.int32)
+    np.cumsum(np.cumsum(mask, axis=0, dtype=np.int32), axis=1, out=integral[1:, 1:])
+    y0 = np.clip(np.arange(height) - radius, 0, height)
+    y1 = np.clip(np.arange(height) + radius + 1, 0, height)
+    x0 = np.clip(np.arange(width) - radius, 0, width)
+    x1 = np.clip(np.arange(width) + radius + 1, 0, width)
+    sums = (integral[y1][:, x1] - integral[y0][:, x1]
+            - integral[y1][:, x0] + integral[y0][:, x0])
+    areas = (y1 - y0)[:, np.newaxis] * (x1 - x0)[np.newaxis, :]
+    return 2 * sums > areas
+
+
+def find_blobs(mask, x0=0, y0=0):
+    # Connected components of a boolean mask, returns an (n, 3) array of x, y (centroid) and area
+    # x0, y0: coordinates of the first pixel of the mask in the frame
+    height, width = mask.shape
+    padded = np.zeros((height, width + 2), np.int8)
+    padded[:, 1:-1] = mask
+    edges = np.diff(padded, axis=1)
+    # Runs of True pixels in each row, [run_starts, run_stops), in row major order
+    rows, run_starts = np.nonzero(edges == 1)
+    _, run_stops = np.nonzero(edges == -1)
+    n_runs = rows.size
+    if n_runs == 0:
+        return np.zeros((0, 3), np.float32)
+
+    # Link the runs of consecutive rows that overlap: for a run of row r + 1 the overlapping
+    # runs of row r are contiguous, found by searching keys that sort runs by (row, column)
+    row_length = width + 2
+    start_keys = rows * row_length + run_starts
+    stop_keys = rows * row_length + run_stops
+    above = (rows - 1) * row_length
+    first = np.searchsorted(stop_keys, above + run_starts, side='right')
+    last = np.searchsorted(start_keys, above + run_stops, side='left')
+    n_links = np.maximum(last - first, 0)
+    lower = np.repeat(np.arange(n_runs), n_links)
+    upper = (np.repeat(first - np.cumsum(n_links) + n_links, n_links) + np.arange(lower.size))
+
+    # Connected components of the run graph: propagate the smallest label until stable
+    labels = np.arange(n_runs)
+    while True:
+        previous = labels.copy()
+        np.minimum.at(labels, lower, labels[upper])
+        np.minimum.at(labels, upper, labels[lower])
+        labels = labels[labels]
+        if np.array_equal(labels, previous):
+            break
+
+    _, labels = np.unique(labels, return_inverse=True)
+    lengths = run_stops - run_starts
+    areas = np.bincount(labels, weights=lengths)
+    sum_x = np.bincount(labels, weights=lengths * (run_starts + run_stops - 1 + 2 * x0) / 2)
+    sum_y = np.bincount(labels, weights=lengths * (rows + y0))
+    return np.column_stack((sum_x / areas, sum_y / areas, areas)).astype(np.float32)
+
+
+class NumpyTrack:
+    __slots__ = ('uuid', 'states', 'valids', 'records', 'length', 'misses')
+
+    def __init__(self, uuid, x, y, size, capacity=64):
+        self.uuid = uuid
+        self.states = np.zeros((capacity, 5), np.float32)  # x, y, vx, vy, size
+        self.valids = np.zeros(capacity, bool)
+        self.records = np.zeros(capacity, tracks.TRACK_DTYPE)  # history in the layout of the bulk export
+        self.length = 0
+        self.misses = 0
+        self.append(x, y, 0, 0, size, True)
+
+    def append(self, x, y, vx, vy, size, valid):
+        if self.length == self.valids.size:
+            self.states = np.concatenate((self.states, np.zeros_like(self.states)))
+            self.valids = np.concatenate((self.valids, np.zeros_like(self.valids)))
+            self.records = np.concatenate((self.records, np.zeros_like(self.records)))
+        self.states[self.length] = (x, y, vx, vy, size)
+        self.valids[self.length] = valid
+        self.records[self.length] = (x, y, size, valid)
+        self.length += 1
+
+    def predicted(self):
+        x, y, vx, vy, _ = self.states[self.length - 1]
+        return x + vx, y + vy
+
+
+class NumpyDetectAndTrack:
+    def __init__(self, parameters, frames=None):
+        self.parameters = parameters
+        self.width = parameters['Width_Image']
+        self.height = parameters['Height_Image']
+        self.history = max(int(parameters['Background_History']), 1)
+        self.contrast = float(parameters['Background_Contrast'])
+        self.filter_size = int(parameter_parser.get_optional(parameters, 'Filter_Size', 1))
+        self.min_blob_size = parameters['Min_Blob_Size']
+        self.max_blob_size = parameters['Max_Blob_Size']
+        self.max_distance = parameters['Max_Distance']
+        self.still_valid_max_frames = parameters['Still_Valid_Max_Frames']
+
+        # Frames come from the iterable if given, else from OpenCV
+        self.frames = iter(frames) if frames is not None else None
+        self.capture = None
+
+        self.isValidHardware = True
+        self.skiers_passed = []
+        self.roi_mask = None
+        self.crop = None  # (x0, y0, x1, y1) processed part of the frames, None for the full frame
+        self.crop_mask = None
+        self.background = None
+        self.variance = None
+        self.n_learned = 0
+        self.tracks = []
+        self.next_uuid = 0
+        self.table = tracks.TrackTable()
+
+    # ****** Setup ******
+    def setup_RoI(self, roi):
+        if roi:
+            self.roi_mask = polygon_mask(roi, self.width, self.height)
+            # A new ROI with the same bounding box keeps the crop, but not its mask
+            if self.crop is not None:
+                x0, y0, x1, y1 = self.crop
+                self.crop_mask = self.roi_mask[y0:y1, x0:x1]
+
+    def setup_crop(self, box):
+        # Processes only the box (x0, y0, x1, y1) of the frames, which must hold the ROI.
+        # The box is enlarged by the size of the majority filter, so that the filter sees the
+        # same neighbourhood as on the full frame for every pixel that can be foreground
+        x0, y0, x1, y1 = box
+        margin = self.filter_size if self.filter_size > 1 else 0
+        self.crop = (max(x0 - margin, 0), max(y0 - margin, 0),
+                     min(x1 + margin, self.width), min(y1 + margin, self.height))
+        x0, y0, x1, y1 = self.crop
+        self.crop_mask = self.roi_mask[y0:y1, x0:x1] if self.roi_mask is not None else None
+        # The background of the new box is learned again, fast at first as after the start
+        self.background = None
+        self.n_learned = 0
+
+    def set_skiers_passed(self, skiers_passed):
+        self.skiers_passed = list(skiers_passed)
+
+    def initialize_camera(self):
+        # Returns [status, width, height, fps] like the compiled backend:
+        # status is 0 on success, -1 if the stream cannot be opened, -2 if its format is unexpected
+        if self.frames is not None:
+            first_frame = next(self.frames, None)
+            if first_frame is None:
+                return [-1, 0, 0, 0]
+            self.frames = itertools.chain([first_frame], self.frames)
+            height, width = first_frame.shape[:2]
+            fps = self.parameters['FPS']
+        else:
+            try:
+                import cv2
+            except ImportError:
+                numpy_backend_logger.critical('OpenCV is needed to read ' + str(self.parameters['Camera_Path']))
+                return [-1, 0, 0, 0]
+            self.capture = cv2.VideoCapture(self.parameters['Camera_Path'])
+            if not self.capture.isOpened():
+                return [-1, 0, 0, 0]
+            width = int(self.capture.get(cv2.CAP_PROP_FRAME_WIDTH))
+            height = int(self.capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
+            fps = int(round(self.capture.get(cv2.CAP_PROP_FPS)))
+
+        if width != self.width or height != self.height:
+            return [-2, width, height, fps]
+        return [0, width, height, fps]
+
+    def frame_count(self):
+        # Number of frames of a video file, None when unknown (see CameraCore.make_clock)
+        if self.capture is None:
+            return None
+        import cv2
+        n_frames = int(self.capture.get(cv2.CAP_PROP_FRAME_COUNT))
+        return n_frames if n_frames > 0 else None
+
+    def initialize_videowriter(self):
+        # Writing the processed video is not supported by this backend
+        return -1
+
+    # ****** Per frame ******
+    def read_frame(self):
+        if self.frames is not None:
+            return next(self.frames, None)
+        if self.capture is None:
+            return None
+        ok, frame = self.capture.read()
+        return frame if ok else None
+
+    def skip_frame(self):
+        # Reads the next frame without processing it, returns 1 when no more frames are available
+        if self.frames is not None:
+            return 0 if next(self.frames, None) is not None else 1
+        if self.capture is None:
+            return 1
+        return 0 if self.capture.grab() else 1
+
+    def set_still_valid_max_frames(self, still_valid_max_frames):
+        # Number of processed frames a track survives without detection, see CameraCore.set_frame_decimation
+        self.still_valid_max_frames = still_valid_max_frames
+
+    def set_max_distance(self, max_distance):
+        # Association gate in pixels between two processed frames, see CameraCore.set_frame_decimation
+        self.max_distance = max_distance
+
+    def subtract_background(self, gray):
+        # Returns the foreground mask and updates the background model
+        if self.background is None:
+            self.background = gray.copy()
+            self.variance = np.full(gray.shape, INIT_VARIANCE, np.float32)
+
+        diff = gray - self.background
+        distance = diff * diff
+        foreground = distance > self.contrast * self.variance
+
+        # Learn faster until Background_History frames have been seen
+        self.n_learned = min(self.n_learned + 1, self.history)
+        alpha = np.float32(1 / self.n_learned)
+        diff *= alpha
+        self.background += diff
+        distance -= self.variance
+        distance *= alpha
+        self.variance += distance
+        np.clip(self.variance, MIN_VARIANCE, MAX_VARIANCE, out=self.variance)
+        return foreground
+
+    def detect(self, frame):
+        # Returns the blobs of the frame as an (n, 3) array of x, y and area
+        roi_mask = self.roi_mask
+        x0 = y0 = 0
+        if self.crop is not None:
+            x0, y0, x1, y1 = self.crop
+            frame = frame[y0:y1, x0:x1]
+            roi_mask = self.crop_mask
+        foreground = self.subtract_background(to_gray(frame))
+        if roi_mask is not None:
+            foreground &= roi_mask
+        foreground = majority_filter(foreground, self.filter_size)
+        blobs = find_blobs(foreground, x0, y0)
+        keep = (blobs[:, 2] >= self.min_blob_size) & (blobs[:, 2] <= self.max_blob_size)
+        return blobs[keep]
+
+    def update_tracks(self, blobs):
+        matched_tracks = set()
+        matched_blobs = set()
+        if self.tracks and blobs.shape[0]:
+            predicted = np.array([track.predicted() for track in self.tracks], np.float32)
+            distances = np.hypot(predicted[:, 0, np.newaxis] - blobs[np.newaxis, :, 0],
+                                 predicted[:, 1, np.newaxis] - blobs[np.newaxis, :, 1])
+            # Greedy assignment, closest pairs first
+            for flat_idx in np.argsort(distances, axis=None).tolist():
+                track_idx, blob_idx = divmod(flat_idx, blobs.shape[0])
+                if distances[track_idx, blob_idx] > self.max_distance:
+                    break
+                if track_idx in matched_tracks or blob_idx in matched_blobs:
+                    continue
+                matched_tracks.add(track_idx)
+                matched_blobs.add(blob_idx)
+                track = self.tracks[track_idx]
+                x0, y0 = track.states[track.length - 1, :2]
+                x, y, area = blobs[blob_idx]
+                track.append(x, y, x - x0, y - y0, area, True)
+                track.misses = 0
+
+        live_tracks = []
+        for track_idx, track in enumerate(self.tracks):
+            if track_idx not in matched_tracks:
+                track.misses += 1
+                if track.misses > self.still_valid_max_frames:
+                    continue
+                x, y = track.predicted()
+                _, _, vx, vy, size = track.states[track.length - 1]
+                track.append(x, y, vx, vy, size, False)
+            live_tracks.append(track)
+
+        for blob_idx in range(blobs.shape[0]):
+            if blob_idx not in matched_blobs:
+                x, y, area = blobs[blob_idx]
+                live_tracks.append(NumpyTrack(self.next_uuid, x, y, area))
+                self.next_uuid += 1
+        self.tracks = live_tracks
+
+    def process_frame(self):
+        # Returns 0 when a frame was processed, 1 when no more frames are available
+        frame = self.read_frame()
+        if frame is None:
+            return 1
+        self.update_tracks(self.detect(frame))
+        return 0
+
+    def get_multitracker_states(self):
+        return [track.states[:track.length] for track in self.tracks]
+
+    def get_multitracker_valids(self):
+        return [track.valids[:track.length] for track in self.tracks]
+
+    def get_multitracker_uuids(self):
+        return [track.uuid for track in self.tracks]
+
+    def get_multitracker_export(self):
+        # Bulk export in TRACK_DTYPE layout, see tracks.export_tracks: one copy of the
+        # histories into buffers reused from frame to frame
+        return self.table.fill([track.records[:track.length] for track in self.tracks],
+                               [track.uuid for track in self.tracks]).export()
@@ -1,16 +1,34 @@
 # -*- encoding: utf-8 -*-
-import pandas
+# pandas and str2bool are imported by the functions using them: with the parameter cache,
+# the startup of Skimage does not read the spreadsheet
 from pathlib import Path
 import numpy as np
 import logging
-from str2bool import str2bool
 import sys
 from datetime import datetime
 import pickle
 import os
+import hashlib
+import struct
+import re
+import threading
+import time
 
 param_logger = logging.getLogger('skimage.parameter_parser')
 
+# Compiled parameter cache, see write_parameter_cache
+PARAMETER_CACHE_MAGIC = b'SKPC'
+PARAMETER_CACHE_VERSION = 2
+PARAMETER_CACHE_HEADER = struct.Struct('<4sH40sI')  # magic, version, content hash, index size
+
+# Lists of points of the spreadsheet, e.g. [[0, 0.5], [1, 0.45]], see parse_list_of_points
+POINT_FIELDS = ['ROI', 'Cut_Line1', 'Cut_Line2', 'Cut_Line3', 'Cut_Line4']
+NUMBER_PATTERN = r'[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?'
+POINT_PATTERN = r'\[\s*' + NUMBER_PATTERN + r'\s*,\s*' + NUMBER_PATTERN + r'\s*\]'
+LIST_OF_POINTS_RE = re.compile(r'\s*\[\s*(?:' + POINT_PATTERN + r'\s*(?:,\s*' + POINT_PATTERN + r'\s*)*,?\s*)?\]\s*$')
+NUMBER_RE = re.compile(NUMBER_PATTERN)
+LIST_OF_TIMES_RE = re.compile(r'\s*\[\s*(?:([\'"])\d\d?:\d\d\1\s*(?:,\s*([\'"])\d\d?:\d\d\2\s*)*,?\s*)?\]\s*$')
+
 class param_type_error(BaseException):
     pass
 
@@ -23,6 +41,7 @@ def checkvalid_boolean(var_str):
     # valid inputs see https://github.com/symonsoft/str2bool) the function
     # returns nothing and does not throw an exception.
     if var_str:
+        from str2bool import str2bool
         var_str = str(var_str)
         try:
             var = str2bool(var_str.lower())
@@ -68,52 +87,81 @@ def checkvalid_float(var_str):
     else:
         return var_str
 
-def check_valid_list_of_points(var_str):
-
-    # Helper function to verify that the input string can be evaluated as a list of 
-    # two element lists, each defining a point of boundary of the RoI in 
-    # normalized image coordinates
-    if var_str:
-        try:
-            var = eval(var_str)
+def is_empty_cell(value):
+    # Empty cells are read as NaN, or as None or '' once converted
+    if value is None:
+        return True
+    if isinstance(value, str):
+        return not value.strip()
+    return isinstance(value, float) and np.isnan(value)
+
+def parse_list_of_points(var_str):
+    # Parses a list of two element lists "[[x1, y1], [x2, y2], etc.]" without eval, and
+    # returns the points as a float array of shape (n, 2), with no point for an empty cell.
+    # Raises ValueError if it is not a list of points. Points already parsed (arrays or
+    # lists) are only checked for their shape
+    if is_empty_cell(var_str):
+        return np.zeros((0, 2))
+    if isinstance(var_str, str):
+        if LIST_OF_POINTS_RE.match(var_str) is None:
+            raise ValueError('"' + var_str + '" does not have the form [[x1, y1], [x2, y2], etc.]')
+        return np.array(NUMBER_RE.findall(var_str), np.float64).reshape(-1, 2)
+    points = np.asarray(var_str, np.float64)
+    if points.size == 0:
+        return np.zeros((0, 2))
+    if points.ndim != 2 or points.shape[1] != 2:
+        raise ValueError(str(var_str) + ' is not a list of points [x, y]')
+    return points
+
+def format_list_of_points(points):
+    # Inverse of parse_list_of_points, to write the points back to the spreadsheet
+    if points is None or isinstance(points, str):
+        return points
+    return str(np.asarray(points).tolist()) if len(points) else None
+
+def parse_points_fields(parameters_all):
+    # Parses the ROI and cut lines of all the rows of the spreadsheet, then checks in one
+    # pass over the points of the whole fleet that they are in normalized image coordinates
+    fields = []
+    for params in parameters_all:
+        for key in POINT_FIELDS:
+            if key not in params:
+                continue
             try:
-                if not type(var) == list:
-                    raise param_type_error
-                for item in var:
-                    if not (type(item) == list and len(item) == 2):
-                        raise param_type_error
-        
-            except param_type_error as e1:
-                param_logger.exception(e1)
-                param_logger.exception(var_str + ' is not a valid input')
-                param_logger.exception('Verify that the ROI parameter in the spreadsheet'
-                                       'has the form: [[x1, y1], [x2, y2], etc. ]')
-                exit(1)
-        except param_type_error as e:
-            param_logger.exception(e)
-            param_logger.exception(var_str + ' is not a valid input for eval')
-            param_logger.exception('Verify that the ROI parameter in the spreadsheet'
-                                   'has the form: [[x1, y1], [x2, y2], etc.]')
-            exit(1)
-        
-        return var_str
+                params[key] = parse_list_of_points(params[key])
+            except ValueError as e:
+                param_logger.critical(key + ' of sensor ' + str(params.get('Sensor_ID')) + ': ' + str(e) + '\n'
+                                      'Verify the parameter in the spreadsheet, quitting skimage')
+                sys.exit(1)
+            fields.append((params.get('Sensor_ID'), key, params[key]))
+    if not fields:
+        return parameters_all
+
+    points = np.concatenate([points for _, _, points in fields])
+    field_of_points = np.repeat(np.arange(len(fields)), [len(points) for _, _, points in fields])
+    outside = ~np.all((points >= 0) & (points <= 1), axis=1)
+    invalid_fields = np.unique(field_of_points[outside])
+    for idx in invalid_fields.tolist():
+        sensor_id, key, field_points = fields[idx]
+        param_logger.critical(key + ' of sensor ' + str(sensor_id) + ': ' + format_list_of_points(field_points)
+                              + ' has points outside of the image, the coordinates must be between 0 and 1')
+    if invalid_fields.size:
+        param_logger.critical('Verify the parameters in the spreadsheet, quitting skimage')
+        sys.exit(1)
+    return parameters_all
 
 def checkvalid_list_of_times(var_str):
-    # Helper function to verify that string evaluates to list of valid times
+    # Helper function to verify that string is a list of valid times
     # If string is empty we continue
     if var_str:
         try:
-            var = eval(var_str)
-            try:
-                assert type(var) == list
-                for item in var:
-                    datetime.strptime(item, '%H:%M')
-                return var_str
-            except ValueError:
-                param_logger.exception(var_str + ' does not evaluate to a list of times of the form "HH:MM"')
-
-        except Exception:
-            param_logger.exception(var_str + ' is not a valid input for eval')
+            if LIST_OF_TIMES_RE.match(var_str) is None:
+                raise ValueError(var_str + ' is not a list of times')
+            for item in re.findall(r'\d\d?:\d\d', var_str):
+                datetime.strptime(item, '%H:%M')
+            return var_str
+        except ValueError:
+            param_logger.exception(var_str + ' is not a list of times of the form "HH:MM"')
             param_logger.exception('Verify that the list of times in the spreadsheet \n'
                                    'has the form: [\'%H:%M\', \'%H:%M\']')
     else:
@@ -123,6 +171,28 @@ def checkvalid_string(var_str):
     var_str = str(var_str)
     return var_str
 
+def get_optional(params, key, default):
+    # Returns an optional parameter, or its default value if the column is absent
+    # from the spreadsheet or the cell is empty
+    value = params.get(key)
+    if value is None or value == '':
+        return default
+    try:
+        if np.isnan(value):
+            return default
+    except TypeError:
+        pass
+    return value
+
+def get_roi_bounding_box(params):
+    # Returns the bounding box of the ROI in pixels, (x0, y0, x1, y1) with x1, y1 excluded
+    width = params['Width_Image']
+    height = params['Height_Image']
+    roi = np.asarray(params['ROI'], np.float64).reshape(-1, 2) * [width, height]
+    x0, y0 = np.clip(np.floor(roi.min(axis=0)), 0, [width, height]).astype(int)
+    x1, y1 = np.clip(np.ceil(roi.max(axis=0)), 0, [width, height]).astype(int)
+    return int(x0), int(y0), int(x1), int(y1)
+
 def compose_camera_url(params):
     root_url = params['Camera_Path']
 
@@ -143,7 +213,6 @@ def compose_camera_url(params):
             params['Local_File'] = 1
             params['Tracking_Start_Daily'] = 0 # Override if local file
             params['Tracking_Stop_Daily'] = 25
-            params['Period_Skimage_Log'] = 99999 # Do not log
     except:
         full_url = f'{root_url}?resolution={w_im}x{h_im}&fps={fps}'
 
@@ -195,22 +264,17 @@ def dimensionalize_parameters(params):
         return valid_min_frames
 
     def get_roi(params):
-        # Returns list of two element lists, each defining a point of boundary of the RoI in 
-        # normalized image coordinates
-        if params['ROI']:
-            roi_list = eval(params['ROI'])
-        else:
-            roi_list = [[0,0], [0,1], [1,1], [1,0]]
-        return roi_list
-        
+        # Returns the (n, 2) array of the points of boundary of the RoI in
+        # normalized image coordinates (already parsed when read from the spreadsheet)
+        roi = parse_list_of_points(params['ROI'])
+        if not len(roi):
+            roi = np.array([[0,0], [0,1], [1,1], [1,0]], np.float64)
+        return roi
+
     def get_cut_line(params, cut_line_string ):
-        # Returns list of two element lists, each defining a point of boundary of the RoI in 
-        # normalized image coordinates
-        if params[cut_line_string]:
-            cut_line = eval(params[cut_line_string])
-        else:
-            cut_line = []
-        return cut_line
+        # Returns the (n, 2) array of the points of the cut line in
+        # normalized image coordinates, empty if there is no such cut line
+        return parse_list_of_points(params[cut_line_string])
 
     still_valid_max_frames = get_still_valid_max_frames(params)
     params.update({'Still_Valid_Max_Frames': still_valid_max_frames})
@@ -254,12 +318,7 @@ def get_parameters_all(param_filename):
                        'Width_Image': checkvalid_int,
                        'Height_Image': checkvalid_int,
                        'FPS': checkvalid_int,
-                       #Region of interest and counting lines
-                       'ROI': check_valid_list_of_points,
-                       'Cut_Line1': check_valid_list_of_points,
-                       'Cut_Line2': check_valid_list_of_points,
-                       'Cut_Line3': check_valid_list_of_points,
-                       'Cut_Line4': check_valid_list_of_points,
+                       # Region of interest and counting lines are parsed below, see parse_points_fields
                        #  Logging parameters
                        'Tracking_Start_Daily': checkvalid_int,
                        'Tracking_Stop_Daily': checkvalid_int,
@@ -279,55 +338,175 @@ def get_parameters_all(param_filename):
 
     # Load spreadsheet, ref:
     # https://pandas.pydata.org/pandas-docs/stable/generated/pandas.read_excel.html
+    # The workbook is loaded once, both reads below parse it from memory
+    import pandas
+    with pandas.ExcelFile(param_filename) as workbook:
+
+        # First we need to find the last row of the list of active sensors
+        # Read in first column of spreadsheet:
+        df_first_column = workbook.parse(sheet_name=0,
+                                         squeeze=True,
+                                         header=0,
+                                         usecols=[0,0])
+
+        # Find the row where 'END' is in the first column, if not found stop, throw error
+        try:
+            cutoff = df_first_column[df_first_column == 'END'].index[0]
+        except Exception as e:
+            param_logger.critical(str(e) + '\n' +
+                                  ' Attention, "END" not found in the first column of the parameter spreadsheet. \n'
+                                  ' Please open the spreadsheet and write "END" in the first column on the row after'
+                                  ' the last sensor that will be monitored by SKIMAGE \n'
+                                  ' Exiting the program \n')
+            sys.exit(0)
 
+        df = workbook.parse(sheet_name='All',
+                            header=0,
+                            usecols=None,
+                            nrows=cutoff,
+                            squeeze=False,
+                            dtype=None,
+                            converters=converters_dict,
+                            true_values=None,
+                            false_values=None,
+                            skiprows=0,
+                            na_values=None,
+                            parse_dates=False,
+                            date_parser=None,
+                            thousands=None,
+                            comment=None,
+                            skipfooter=0,
+                            convert_float=True
+                            )
 
+    parameters_all = df.to_dict(orient='records')
+    parameters_all = parse_points_fields(parameters_all)
 
-    # First we need to find the last row of the list of active sensors
-    # Read in first column of spreadsheet:
-    df_first_column = pandas.read_excel(param_filename,
-                                        sheet_name=0,
-                                        squeeze=True,
-                                        header=0,
-                                        usecols=[0,0])
+    return parameters_all
 
-    # Find the row where 'END' is in the first column, if not found stop, throw error
-    try:
-        cutoff = df_first_column[df_first_column == 'END'].index[0] 
-    except Exception as e:
-        param_logger.critical(str(e) + '\n' +
-                              ' Attention, "END" not found in the first column of the parameter spreadsheet. \n'
-                              ' Please open the spreadsheet and write "END" in the first column on the row after'
-                              ' the last sensor that will be monitored by SKIMAGE \n'
-                              ' Exiting the program \n')
+def read_sensor_ids(id_filename='data/my_id.txt'):
+    # Returns the list of the sensor IDs found in the ID file: one ID, or several separated
+    # by commas or spaces when the Odroid serves several cameras
+    if not Path(id_filename).is_file():
+        param_logger.critical('ID file "' + id_filename + '" not found, quitting skimage')
         sys.exit(0)
 
-    df = pandas.read_excel(param_filename,
-                           sheet_name='All',
-                           header=0,
-                           usecols=None,
-                           nrows=cutoff,
-                           squeeze=False,
-                           dtype=None,
-                           engine=None,
-                           converters=converters_dict,
-                           true_values=None,
-                           false_values=None,
-                           skiprows=0,
-                           na_values=None,
-                           parse_dates=False,
-                           date_parser=None,
-                           thousands=None,
-                           comment=None,
-                           skipfooter=0,
-                           convert_float=True
-                           )
+    with open(id_filename, 'r') as f:
+        content = f.read()
+        if content.lower().startswith('master'):
+            param_logger.info('Master odroid, quitting skimage.')
+            sys.exit(0)
+        try:
+            sensor_ids = [int(x) for x in content.replace(',', ' ').split()]
+            if not sensor_ids:
+                raise ValueError('no sensor ID')
 
-    parameters_all = df.to_dict(orient='records')
+        except ValueError:
+            param_logger.critical('Could not load a valid sensor ID from "' + id_filename + '". \n'
+                                'Make sure this file only contains numeric values separated by commas. \n'
+                                'Quitting skimage')
+            sys.exit(0)
+    return sensor_ids
 
-    return parameters_all
+def select_sensor_parameters(parameters_all, sensor_id):
+    # Returns the row of the parameter spreadsheet of the sensor
+    for params in parameters_all:
+        if params['Sensor_ID'] == sensor_id:
+            return params
+    param_logger.critical('No set of parameters were found that match the sensor ID: ' 
+                           + str(sensor_id) + ' \n'
+                           + 'Please confirm that "data/my_id.txt" contains one of the Sensor_ID\'s found in the "data/skimage_parameters.xlsx" spreadsheet.\n'
+                          'Quitting skimage')
+    sys.exit(0)
+
+def hash_file(filename):
+    # Content hash of a file, unlike its modification time it does not depend on the clocks
+    # of the machines the file was copied through
+    digest = hashlib.sha1()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 16), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def write_parameter_cache(param_cache_filename, content_hash, parameters_all):
+    # Compiles the rows of the spreadsheet into the cache file:
+    #   -header: magic, version, content hash of the spreadsheet, size of the index
+    #   -index: pickled dict Sensor_ID -> (offset, size) of the row after the index
+    #   -rows: one pickle per sensor, so loading a sensor does not unpickle the others
+    index = {}
+    rows = b''
+    for params in parameters_all:
+        row = pickle.dumps(params, pickle.HIGHEST_PROTOCOL)
+        index[params['Sensor_ID']] = (len(rows), len(row))
+        rows += row
+    index = pickle.dumps(index, pickle.HIGHEST_PROTOCOL)
+    header = PARAMETER_CACHE_HEADER.pack(PARAMETER_CACHE_MAGIC, PARAMETER_CACHE_VERSION,
+                                         content_hash.encode('ascii'), len(index))
+    # Written aside then renamed, a Skimage starting meanwhile never reads half a cache
+    tmp_filename = str(param_cache_filename) + '.' + str(os.getpid()) + '.tmp'
+    try:
+        with open(tmp_filename, 'wb') as f:
+            f.write(header + index + rows)
+        os.replace(tmp_filename, param_cache_filename)
+    except OSError:
+        param_logger.exception('Could not write the parameter cache ' + str(param_cache_filename))
+
+def read_parameter_cache(param_cache_filename, content_hash, sensor_ids):
+    # Returns the rows of the sensors from the cache, or None if the cache is missing, was
+    # compiled from another spreadsheet or by another version of Skimage, or lacks a sensor
+    try:
+        with open(param_cache_filename, 'rb') as f:
+            magic, version, cached_hash, index_size = PARAMETER_CACHE_HEADER.unpack(f.read(PARAMETER_CACHE_HEADER.size))
+            if (magic != PARAMETER_CACHE_MAGIC or version != PARAMETER_CACHE_VERSION
+                    or cached_hash != content_hash.encode('ascii')):
+                return None
+            index = pickle.loads(f.read(index_size))
+            rows_start = PARAMETER_CACHE_HEADER.size + index_size
+            rows = []
+            for sensor_id in sensor_ids:
+                if sensor_id not in index:
+                    return None
+                offset, size = index[sensor_id]
+                f.seek(rows_start + offset)
+                rows.append(pickle.loads(f.read(size)))
+            return rows
+    except FileNotFoundError:
+        return None
+    except Exception:
+        # Truncated or corrupted cache: rebuilt from the spreadsheet
+        param_logger.warning('Parameter cache ' + str(param_cache_filename) + ' cannot be read, rebuilding it', exc_info=True)
+        return None
+
+def load_sensor_parameters(sensor_ids, param_filename, param_cache_filename):
+    # Rows of the spreadsheet of the sensors, from the cache when it was compiled from the
+    # same spreadsheet, else read from the spreadsheet and cached for the next start
+    content_hash = hash_file(param_filename)
+    rows = read_parameter_cache(param_cache_filename, content_hash, sensor_ids)
+    if rows is not None:
+        param_logger.info('Loading cached parameters of ' + param_filename)
+        return rows
+
+    param_logger.info(str(param_cache_filename) + ' missing or out of date, loading parameters from ' + param_filename)
+    parameters_all = get_parameters_all(param_filename)
+    write_parameter_cache(param_cache_filename, content_hash, parameters_all)
+    return [select_sensor_parameters(parameters_all, sensor_id) for sensor_id in sensor_ids]
+
+def get_parameters_list(sensor_ids, param_filename = 'data/skimage_parameters.xlsx',
+                        param_cache_filename = 'data/skimage_parameters.cache'):
+    # Parameters of several sensors served by the same Odroid, read from the spreadsheet
+    if not Path(param_filename).is_file():
+        param_logger.critical('Parameters file "' + param_filename + '" not found, quitting skimage')
+        sys.exit(0)
+
+    parameters_list = []
+    for parameters in load_sensor_parameters(sensor_ids, param_filename, param_cache_filename):
+        parameters = compose_camera_url(parameters)
+        parameters = dimensionalize_parameters(parameters)
+        parameters_list.append(parameters)
+    return parameters_list
 
 def get_parameters(param_filename = 'data/skimage_parameters.xlsx',
-                  param_pickled_filename = 'data/skimage_parameters.pickle',
+                  param_cache_filename = 'data/skimage_parameters.cache',
                   get_all_params = False):
 
     # First, check that the parameter file exists
@@ -341,69 +520,87 @@ def get_parameters(param_filename = 'data/skimage_parameters.xlsx',
         parameters_all = get_parameters_all(param_filename)
         return parameters_all
     
-    # Fast loader, returns parameters from pickled file if the pickled file was saved
-    # at a later time than the spreadsheet. Skips loading from spreadsheet
-    if Path(param_pickled_filename).exists():
-        pickled_params_mtime = Path(param_pickled_filename).stat().st_mtime
-        params_mtime = Path(param_filename).stat().st_mtime
-        myID_mtime = Path('data/my_id.txt').stat().st_mtime
-        if (pickled_params_mtime > params_mtime) & (pickled_params_mtime > myID_mtime):
-            param_logger.info('Loading pickled parameters from previous session')
-            with open(param_pickled_filename, 'rb') as f:
-                parameters = pickle.load(f)
-
-            return parameters
-        else:
-            param_logger.info('Parameters or my_ID were recently saved, so parameters will be loaded from this file')
-    else:
-        param_logger.info(param_pickled_filename + 
-                          ' not found, loading parameters from '
-                          + param_filename)
-
-    
     # First, check that we have a vaild my_id.txt file and read in the id
-    if not Path('data/my_id.txt').is_file():
-        param_logger.critical('ID file "data/my_id.txt" not found, quitting skimage')
-        sys.exit(0)
+    # (the first one if the Odroid serves several cameras, see get_parameters_list)
+    my_id = read_sensor_ids()[0]
 
-    with open('data/my_id.txt', 'r') as f:
-        content = f.read()
-        if content.lower().startswith('master'):
-            param_logger.info('Master odroid, quitting skimage.')
-            sys.exit(0)
-        try:
-            my_id = int(content)
-
-        except ValueError:
-            param_logger.critical('Could not load a valid sensor ID from "data/my_id.txt". \n'
-                                'Make sure this file only contains a numeric value. \n'
-                                'Quitting skimage')
-            sys.exit(0)
-
-    # Now get all the parameters
-    parameters_all = get_parameters_all(param_filename)
-
-    # Select the parameters corresponding to my_id
-    parameters = {}
-    for params in parameters_all:
-        if params['Sensor_ID'] == my_id:
-            parameters = params
-            break
-    if not parameters:
-        param_logger.critical('No set of parameters were found that match the sensor ID: ' 
-                               + str(my_id) + ' \n'
-                               + 'Please confirm that "data/my_id.txt" contains one of the Sensor_ID\'s found in the "data/skimage_parameters.xlsx" spreadsheet.\n'
-                              'Quitting skimage')
-        sys.exit(0)
+    # Fast loader, the row of my_id comes from the compiled cache unless the content of
+    # the spreadsheet changed, else all the parameters are read from the spreadsheet
+    parameters = load_sensor_parameters([my_id], param_filename, param_cache_filename)[0]
 
     parameters = compose_camera_url(parameters)
     parameters = dimensionalize_parameters(parameters)
 
-    with open(param_pickled_filename, 'wb') as f:
-        pickle.dump(parameters, f)
-
     return parameters
 
+def same_value(value1, value2):
+    # Equality of two parameters: lists of points are arrays, empty cells are NaN
+    if isinstance(value1, np.ndarray) or isinstance(value2, np.ndarray):
+        return np.array_equal(np.asarray(value1), np.asarray(value2))
+    if is_empty_cell(value1) and is_empty_cell(value2):
+        return True
+    return bool(value1 == value2)
+
+class ParameterWatcher:
+    # Watches the parameter file of a running sensor. check() compares the modification time
+    # and size of the file every CHECK_PERIOD seconds; when they change, the parameters of
+    # the sensor are reloaded in a background thread (through the parameter cache), so the
+    # tracking loop never waits for the spreadsheet. take() returns them once loaded, if the
+    # content of the file changed. A parameter file that cannot be loaded is ignored.
+    CHECK_PERIOD = 10
+
+    def __init__(self, sensor_id,
+                 param_filename = 'data/skimage_parameters.xlsx',
+                 param_cache_filename = 'data/skimage_parameters.cache'):
+        self.sensor_id = sensor_id
+        self.param_filename = param_filename
+        self.param_cache_filename = param_cache_filename
+        self.file_stat = self.stat()
+        self.content_hash = hash_file(param_filename) if self.file_stat is not None else None
+        self.next_check = time.monotonic() + self.CHECK_PERIOD
+        self.thread = None
+        self.loaded = None
+
+    def stat(self):
+        try:
+            file_stat = os.stat(self.param_filename)
+        except OSError:
+            return None
+        return file_stat.st_mtime_ns, file_stat.st_size
+
+    def check(self):
+        now = time.monotonic()
+        if now < self.next_check or self.thread is not None:
+            return
+        self.next_check = now + self.CHECK_PERIOD
+        file_stat = self.stat()
+        if file_stat is None or file_stat == self.file_stat:
+            return
+        self.file_stat = file_stat
+        self.thread = threading.Thread(target=self.load, name='parameter_watcher', daemon=True)
+        self.thread.start()
+
+    def load(self):
+        try:
+            content_hash = hash_file(self.param_filename)
+            if content_hash == self.content_hash:
+                return
+            param_logger.info('Parameter file ' + self.param_filename + ' changed, reloading the parameters')
+            parameters = load_sensor_parameters([self.sensor_id], self.param_filename, self.param_cache_filename)[0]
+            self.loaded = dimensionalize_parameters(compose_camera_url(parameters))
+            self.content_hash = content_hash
+        except (Exception, SystemExit):
+            param_logger.exception('Could not reload the parameters from ' + self.param_filename
+                                   + ', the current parameters are kept')
+
+    def take(self):
+        # The reloaded parameters, None if there are none (yet)
+        if self.thread is None or self.thread.is_alive():
+            return None
+        self.thread = None
+        loaded, self.loaded = self.loaded, None
+        return loaded
+
 if __name__ == '__main__':
     param_filename = '/home/data/skimage_parameters.xlsx'
     parameters = get_parameters(param_filename)
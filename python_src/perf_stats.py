@@ -0,0 +1,178 @@
+# -*- encoding: utf-8 -*-
+# Always-on latency statistics for the stages of the tracking loop:
+#   -Fixed, log-spaced buckets, so adding a sample is a bisect and an increment
+#   -p50/p95/p99 and max summarized once per SKIMAGE log period
+#   -The histograms of every period are appended to a compact binary file, one file per
+#    day (<name>_YYYYMMDD.bin) like the SKIMAGE logs, the last KEEP_DAYS files are kept
+#
+# Binary file layout (little endian):
+#   header: b'SKLH', version (uint16), n_buckets (uint16), n_stages (uint16),
+#           bucket upper bounds in ms (n_buckets float32),
+#           stage names (n_stages x 24 bytes, NUL padded)
+#   one record per period: end of period (float64, seconds since the epoch),
+#           then for each stage: n samples (uint32), max in ms (float32),
+#           counts (n_buckets + 1 uint32, the last one counts the samples above the last bound)
+
+import bisect
+import logging
+import os
+import struct
+import time
+from datetime import datetime
+from pathlib import Path
+
+perf_logger = logging.getLogger('skimage.perf_stats')
+
+MAGIC = b'SKLH'
+VERSION = 1
+NAME_LENGTH = 24
+
+# Number of daily latency files kept
+KEEP_DAYS = 30
+
+# Upper bounds of the buckets in milliseconds: 0.05 ms to ~13 s, 4 buckets per octave
+BUCKET_BOUNDS_MS = [0.05 * 2 ** (i / 4) for i in range(73)]
+
+
+class LatencyHistogram:
+    def __init__(self, bounds_ms=BUCKET_BOUNDS_MS):
+        self.bounds = [bound / 1000 for bound in bounds_ms]  # in seconds, to bisect raw samples
+        self.bounds_ms = list(bounds_ms)
+        self.reset()
+
+    def reset(self):
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.n = 0
+        self.max = 0.0
+
+    def add(self, seconds):
+        self.counts[bisect.bisect_left(self.bounds, seconds)] += 1
+        self.n += 1
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, q):
+        # Upper bound (in ms) of the bucket holding the q-th percentile, capped by the max
+        if self.n == 0:
+            return 0.0
+        rank = q / 100 * self.n
+        cumulative = 0
+        for idx, count in enumerate(self.counts):
+            cumulative += count
+            if cumulative >= rank and count:
+                break
+        if idx < len(self.bounds_ms):
+            return min(self.bounds_ms[idx], self.max * 1000)
+        return self.max * 1000
+
+    def summary(self):
+        return ('p50 ' + format(self.percentile(50), '.1f')
+                + ' / p95 ' + format(self.percentile(95), '.1f')
+                + ' / p99 ' + format(self.percentile(99), '.1f')
+                + ' / max ' + format(self.max * 1000, '.1f') + ' ms')
+
+
+class StageTimers:
+    # One histogram per stage of the tracking loop. Each stage is only timed from one
+    # thread; the period summary may race with the producer thread of the pipelined
+    # loop, which at worst misplaces one sample between two periods.
+    # log_dir and name: the histograms of the periods of a day are appended to
+    # log_dir/<name>_YYYYMMDD.bin, nothing is written if log_dir is None
+    def __init__(self, stages, log_dir=None, name='latency'):
+        self.stages = list(stages)
+        self.histograms = {stage: LatencyHistogram() for stage in self.stages}
+        self.log_dir = Path(log_dir) if log_dir is not None else None
+        self.name = name
+        self.filename = None
+
+    def add(self, stage, seconds):
+        self.histograms[stage].add(seconds)
+
+    def header(self):
+        bounds = BUCKET_BOUNDS_MS
+        names = b''.join(stage.encode()[:NAME_LENGTH].ljust(NAME_LENGTH, b'\0') for stage in self.stages)
+        return (MAGIC
+                + struct.pack('<HHH', VERSION, len(bounds), len(self.stages))
+                + struct.pack('<' + str(len(bounds)) + 'f', *bounds)
+                + names)
+
+    def day_filename(self, timestamp):
+        return self.log_dir / (self.name + '_' + datetime.fromtimestamp(timestamp).strftime('%Y%m%d') + '.bin')
+
+    def remove_old_files(self):
+        # The names sort by date
+        for filename in sorted(self.log_dir.glob(self.name + '_????????.bin'))[:-KEEP_DAYS]:
+            try:
+                filename.unlink()
+            except OSError:
+                perf_logger.exception('Could not remove the old latency statistics ' + str(filename))
+
+    def open_file(self):
+        # Keep appending to an existing file only if it was written with the same layout
+        header = self.header()
+        if self.filename.is_file():
+            with open(self.filename, 'rb') as f:
+                if f.read(len(header)) == header:
+                    return
+            os.replace(self.filename, self.filename.with_suffix('.old'))
+        with open(self.filename, 'wb') as f:
+            f.write(header)
+
+    def summary(self):
+        return ', '.join(stage + ' ' + self.histograms[stage].summary()
+                         for stage in self.stages if self.histograms[stage].n)
+
+    def end_period(self, timestamp=None):
+        # Appends the histograms of the period to the file of its day, then resets them
+        if self.log_dir is not None:
+            if timestamp is None:
+                timestamp = time.time()
+            record = struct.pack('<d', timestamp)
+            n_counts = len(BUCKET_BOUNDS_MS) + 1
+            for stage in self.stages:
+                histogram = self.histograms[stage]
+                record += struct.pack('<If' + str(n_counts) + 'I', histogram.n, histogram.max * 1000, *histogram.counts)
+            try:
+                filename = self.day_filename(timestamp)
+                if filename != self.filename:
+                    self.filename = filename
+                    self.open_file()
+                    self.remove_old_files()
+                with open(self.filename, 'ab') as f:
+                    f.write(record)
+            except OSError:
+                perf_logger.exception('Could not write latency statistics to ' + str(self.filename))
+
+        for histogram in self.histograms.values():
+            histogram.reset()
+
+
+def read_latency_file(filename):
+    # Reads a binary latency file back, returns the stage names, the bucket bounds (ms)
+    # and a list of (timestamp, {stage: (n, max_ms, counts)}) records
+    with open(filename, 'rb') as f:
+        data = f.read()
+    if data[:4] != MAGIC:
+        raise ValueError(str(filename) + ' is not a latency statistics file')
+    version, n_buckets, n_stages = struct.unpack_from('<HHH', data, 4)
+    offset = 10
+    bounds = list(struct.unpack_from('<' + str(n_buckets) + 'f', data, offset))
+    offset += 4 * n_buckets
+    stages = []
+    for _ in range(n_stages):
+        stages.append(data[offset:offset + NAME_LENGTH].rstrip(b'\0').decode())
+        offset += NAME_LENGTH
+
+    stage_format = '<If' + str(n_buckets + 1) + 'I'
+    stage_size = struct.calcsize(stage_format)
+    records = []
+    while offset + 8 + n_stages * stage_size <= len(data):
+        timestamp, = struct.unpack_from('<d', data, offset)
+        offset += 8
+        periods = {}
+        for stage in stages:
+            values = struct.unpack_from(stage_format, data, offset)
+            periods[stage] = (values[0], values[1], list(values[2:]))
+            offset += stage_size
+        records.append((timestamp, periods))
+    return stages, bounds, records
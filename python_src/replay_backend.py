@@ -0,0 +1,143 @@
+# -*- encoding: utf-8 -*-
+# Stub detection/tracking backend that replays trajectories instead of processing video.
+#
+# ReplayDetectAndTrack implements the interface that CameraCore uses on the compiled
+# Detect_and_Track_ARM/_x86 modules (process_frame, get_multitracker_states/valids/uuids,
+# set_skiers_passed, setup_RoI, initialize_camera, initialize_videowriter, isValidHardware),
+# so that the Python counting path can be run and benchmarked without a camera. Like the
+# other Python backends it also exports its tracks in bulk (get_multitracker_export).
+#
+# Trajectories are either synthetic (straight noisy tracks crossing the image, with a
+# fixed number of concurrent tracks) or given as a list of Trajectory tuples.
+
+import logging
+from collections import namedtuple
+import numpy as np
+
+import tracks
+
+replay_logger = logging.getLogger('skimage.replay_backend')
+
+# One replayed track:
+#   track_id: UUID reported by get_multitracker_uuids
+#   start_frame: frame at which the track appears
+#   states: (n, 5) array with one row per frame: x, y, vx, vy, size
+#   valids: (n,) boolean array, True where the position is a detection
+Trajectory = namedtuple('Trajectory', ['track_id', 'start_frame', 'states', 'valids'])
+
+
+def synthetic_trajectories(parameters, n_frames, n_tracks, min_length=20, max_length=80,
+                           valid_ratio=0.95, seed=0):
+    # Straight tracks with some jitter between random points of the image, keeping
+    # n_tracks tracks alive at any time: when a track ends the next one starts
+    rng = np.random.default_rng(seed)
+    width = parameters['Width_Image']
+    height = parameters['Height_Image']
+
+    trajectories = []
+    track_id = 0
+    for slot in range(n_tracks):
+        # Stagger the first tracks so that they do not all end on the same frame
+        frame = -int(rng.integers(0, max_length))
+        while frame < n_frames:
+            length = int(rng.integers(min_length, max_length + 1))
+            start = rng.random(2) * [width, height]
+            stop = rng.random(2) * [width, height]
+            t = np.linspace(0, 1, length)[:, np.newaxis]
+            positions = start + (stop - start) * t + rng.normal(0, 1, (length, 2))
+            velocities = np.gradient(positions, axis=0) if length > 1 else np.zeros((length, 2))
+            states = np.empty((length, 5), np.float32)
+            states[:, 0:2] = positions
+            states[:, 2:4] = velocities
+            states[:, 4] = rng.integers(50, 500)
+            valids = rng.random(length) < valid_ratio
+
+            # Tracks that started before the first frame are cut to start on it
+            if frame < 0:
+                states = states[-frame:]
+                valids = valids[-frame:]
+            if states.shape[0]:
+                trajectories.append(Trajectory(track_id, max(frame, 0), states, valids))
+                track_id += 1
+            frame += length
+    return trajectories
+
+
+class ReplayDetectAndTrack:
+    def __init__(self, parameters, trajectories=None, n_frames=1000, n_tracks=20, seed=0):
+        self.parameters = parameters
+        if trajectories is None:
+            trajectories = synthetic_trajectories(parameters, n_frames, n_tracks, seed=seed)
+        else:
+            n_frames = max([t.start_frame + t.states.shape[0] for t in trajectories], default=0)
+        self.n_frames = n_frames
+        self.trajectories = sorted(trajectories, key=lambda t: t.start_frame)
+        # Histories of all the trajectories in the layout of the bulk export (views of one table)
+        records = tracks.TrackTable().load([t.states for t in self.trajectories],
+                                           [t.valids for t in self.trajectories],
+                                           [t.track_id for t in self.trajectories])
+        self.histories = [records.track(idx) for idx in range(len(records))]
+        self.table = tracks.TrackTable()
+
+        self.isValidHardware = True
+        self.skiers_passed = []
+        self.roi = None
+        self.frame = -1
+        self.next_trajectory = 0
+        self.live = []
+
+    # ****** Setup ******
+    def setup_RoI(self, roi):
+        self.roi = roi
+
+    def set_skiers_passed(self, skiers_passed):
+        self.skiers_passed = list(skiers_passed)
+
+    def initialize_camera(self):
+        # Same return value as the compiled backend: [status, width, height, fps]
+        return [0, self.parameters['Width_Image'], self.parameters['Height_Image'], self.parameters['FPS']]
+
+    def initialize_videowriter(self):
+        return 0
+
+    # ****** Per frame ******
+    def process_frame(self):
+        # Returns 0 while frames are available, like the compiled backend
+        self.frame += 1
+        if self.frame >= self.n_frames:
+            return 1
+
+        # Indices of the live trajectories
+        trajectories = self.trajectories
+        self.live = [idx for idx in self.live
+                     if trajectories[idx].start_frame + trajectories[idx].states.shape[0] > self.frame]
+        while (self.next_trajectory < len(trajectories)
+               and trajectories[self.next_trajectory].start_frame <= self.frame):
+            self.live.append(self.next_trajectory)
+            self.next_trajectory += 1
+        return 0
+
+    def skip_frame(self):
+        # The trajectories are known for every frame: a skipped frame only shows as one more
+        # position in the history of the tracks on the next processed frame
+        return self.process_frame()
+
+    def live_trajectories(self):
+        return [self.trajectories[idx] for idx in self.live]
+
+    def get_multitracker_states(self):
+        # Full history of every live track (views, the trajectories are precomputed)
+        return [t.states[:self.frame - t.start_frame + 1] for t in self.live_trajectories()]
+
+    def get_multitracker_valids(self):
+        return [t.valids[:self.frame - t.start_frame + 1] for t in self.live_trajectories()]
+
+    def get_multitracker_uuids(self):
+        return [t.track_id for t in self.live_trajectories()]
+
+    def get_multitracker_export(self):
+        # Bulk export in TRACK_DTYPE layout, see tracks.export_tracks: one copy of the
+        # histories into buffers reused from frame to frame
+        live = self.live_trajectories()
+        return self.table.fill([self.histories[idx][:self.frame - t.start_frame + 1] for idx, t in zip(self.live, live)],
+                               [t.track_id for t in live]).export()
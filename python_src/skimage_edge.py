@@ -1,23 +1,29 @@
 # -*- encoding: utf-8 -*-
 
-# Local skimage modules
-import startup_checks
-import logs_skimage
-import parameter_parser
-# import images_acquisition
-import core
-import argparse
+# Startup profile first, see startup_profile
+import startup_profile
+profile = startup_profile.StartupProfile()
 
-# External modules
-import logging
+with profile.phase('imports'):
+    # Local skimage modules, the heavy external modules are imported by the functions using them
+    import startup_checks
+    import logs_skimage
+    import parameter_parser
+    # import images_acquisition
+    import argparse
+
+    # External modules
+    import logging
 
 # Initialize logger
+with profile.phase('logging setup'):
+    logs_skimage.setup_logging()
 logger = logging.getLogger('skimage')
 logger.info('Starting Skimage v1.3')
 
 # construct the argument parse and parse the arguments
 ap = argparse.ArgumentParser()
-ap.add_argument("-i", "--ID", required=False, help="ID to look for")
+ap.add_argument("-i", "--ID", required=False, help="ID to look for (several IDs separated by commas to serve several cameras)")
 args = vars(ap.parse_args())
 
 if args["ID"]:
@@ -28,17 +34,37 @@ if args["ID"]:
 
 # ****** Start up checks/get parameters ******
 # Check file structure
-file_paths = startup_checks.check_filesystem()
+with profile.phase('filesystem checks'):
+    file_paths = startup_checks.check_filesystem()
+
+# Several sensor IDs: one Odroid serving several cameras
+sensor_ids = parameter_parser.read_sensor_ids()
+if len(sensor_ids) > 1:
+    with profile.phase('parameter load'):
+        parameters_list = parameter_parser.get_parameters_list(sensor_ids)
+    with profile.phase('core import'):
+        import camera_host
+    # The cameras are opened by the processes of the sensors
+    profile.report()
+    camera_host.CameraHost(parameters_list).run()
+    raise SystemExit
 
 # Load parameters
-parameters = parameter_parser.get_parameters()
+with profile.phase('parameter load'):
+    parameters = parameter_parser.get_parameters()
 
 if parameters['Debug_Mode']:
     print('Skimage starting in debug mode')
     
 
 # ****** Start core processing ******
-camera_core = core.CameraCore(parameters)
+with profile.phase('core import'):
+    import core
+with profile.phase('camera init'):
+    # The ROI, cut lines and thresholds edited in the parameter file are applied while running
+    parameter_watcher = parameter_parser.ParameterWatcher(parameters['Sensor_ID'])
+    camera_core = core.CameraCore(parameters, parameter_watcher=parameter_watcher)
+profile.report()
 
 camera_core.camera_tracking_loop()
 
@@ -4,7 +4,6 @@ import logging
 import os
 from datetime import datetime
 import subprocess
-import pingparsing
 import socket
 
 
@@ -20,6 +19,7 @@ def check_filesystem():
 
     file_paths = {'logs_SKIMAGE': logs_SKIMAGE_fp,
                   'logs_program': logs_program_fp,
+                  'logs_tracks': base_fp / 'Logs_tracks',  # only created when tracks are recorded
                   'params': data_fp}
 
     if not logs_program_fp.is_dir():
@@ -49,11 +49,13 @@ def check_filesystem():
 
 # def remove_processed_video():
 
-def skimage_log_filepaths(sensorID):
-    """ SensorID is string, name of sensor"""
+def skimage_log_filepaths(sensorID, nowish=None, reprocessed=False):
+    """ SensorID is string, name of sensor, nowish the date of the logs (default now),
+    reprocessed for the logs of recorded videos, kept apart from the live logs"""
     file_paths = check_filesystem()
 
-    nowish = datetime.now()
+    if nowish is None:
+        nowish = datetime.now()
     month_dir = nowish.strftime('%B')
     day_dir = nowish.strftime('%d')
 
@@ -62,7 +64,8 @@ def skimage_log_filepaths(sensorID):
         if not skimage_log_dir.is_dir():
             os.mkdir(skimage_log_dir)
     else:
-        skimage_log_dir = file_paths['logs_SKIMAGE'] / ('sensorID_' + str(sensorID)) / month_dir / day_dir
+        logs_dir = file_paths['logs_SKIMAGE'] / 'reprocessed' if reprocessed else file_paths['logs_SKIMAGE']
+        skimage_log_dir = logs_dir / ('sensorID_' + str(sensorID)) / month_dir / day_dir
         os.makedirs(skimage_log_dir, exist_ok=True)
 
     module_logger.info('Logs_SKIMAGE filepath valid')
@@ -89,7 +92,8 @@ def check_ping(ip_address):
     # and then check the response...
     if response.returncode == 0:
 
-        # Parse results
+        # Parse results (pingparsing is only needed by the watchdog, imported here)
+        import pingparsing
         ping_parser = pingparsing.PingParsing()
         ping_status = ping_parser.parse(response.stdout).as_dict()
         ping_status.update({'ping_status': True})
@@ -0,0 +1,121 @@
+# -*- encoding: utf-8 -*-
+# Startup profile of Skimage: the time of each phase of the start (imports, logging setup,
+# filesystem checks, parameter load, camera init) is logged once the camera is open and
+# compared with a budget, as the cold start is part of the downtime after every restart.
+#
+# Regression test of the cold start (from the Skimage directory):
+#   python python_src/startup_profile.py --budget 5
+# runs the phases of skimage_edge up to the parameter load in a fresh interpreter (add
+# --camera to open the camera of the sensor as well), prints the time of each phase and
+# the heavy modules imported on the way, and exits with status 1 if the start, interpreter
+# included, exceeds the budget or imports a heavy module. The start is measured with the
+# parameter cache up to date, as after a restart: after a cache miss it is measured again.
+# Only the standard library is imported here, so that the profile starts first.
+
+import argparse
+import json
+import logging
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+
+profile_logger = logging.getLogger('skimage.startup_profile')
+
+# Target cold start of skimage_edge up to the camera being open, in seconds
+STARTUP_BUDGET = 10.0
+
+# Modules only needed off the usual startup path (spreadsheet read, ping, FTP upload)
+HEAVY_MODULES = ('pandas', 'pingparsing', 'ftplib')
+
+
+class StartupProfile:
+    def __init__(self):
+        self.start_time = time.perf_counter()
+        self.phases = []
+
+    @contextmanager
+    def phase(self, name):
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - start_time))
+
+    def total(self):
+        return time.perf_counter() - self.start_time
+
+    def summary(self):
+        return ', '.join(name + ' ' + format(seconds, '.2f') + ' s' for name, seconds in self.phases)
+
+    def report(self, budget=STARTUP_BUDGET):
+        # Logs the phases, returns True if the start is within the budget
+        total = self.total()
+        message = 'Startup: ' + self.summary() + ', total ' + format(total, '.2f') + ' s'
+        if total > budget:
+            profile_logger.warning(message + ', over the budget of ' + format(budget, 'g') + ' s')
+            return False
+        profile_logger.info(message + ' (budget ' + format(budget, 'g') + ' s)')
+        return True
+
+
+def profile_startup(camera=False):
+    # Child process of main: the phases of skimage_edge, without the tracking loop
+    profile = StartupProfile()
+    with profile.phase('imports'):
+        import startup_checks
+        import parameter_parser
+    with profile.phase('filesystem checks'):
+        startup_checks.check_filesystem()
+    with profile.phase('parameter load'):
+        parameters = parameter_parser.get_parameters()
+    if camera:
+        with profile.phase('core import'):
+            import core
+        with profile.phase('camera init'):
+            camera_core = core.CameraCore(parameters, offline=True)
+        camera_core.close()
+    return {'phases': profile.phases,
+            'total': profile.total(),
+            'heavy_modules': [name for name in HEAVY_MODULES if name in sys.modules]}
+
+
+def main():
+    ap = argparse.ArgumentParser(description='Cold start profile of Skimage, checked against a budget')
+    ap.add_argument('--budget', type=float, default=STARTUP_BUDGET, help='Budget of the cold start in seconds')
+    ap.add_argument('--camera', action='store_true', help='Also open the camera of the sensor')
+    ap.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.child:
+        print(json.dumps(profile_startup(args.camera)))
+        return
+
+    # A fresh interpreter, so that nothing is imported yet
+    command = [sys.executable, __file__, '--child'] + (['--camera'] if args.camera else [])
+    for attempt in range(2):
+        start_time = time.perf_counter()
+        output = subprocess.run(command, stdout=subprocess.PIPE, check=True, universal_newlines=True).stdout
+        wall_time = time.perf_counter() - start_time
+        result = json.loads(output.strip().splitlines()[-1])
+        if 'pandas' not in result['heavy_modules']:
+            break
+        print('Parameter cache out of date, the spreadsheet was read: starting again')
+
+    for name, seconds in result['phases']:
+        print('{:<20} {:>8.3f} s'.format(name, seconds))
+    print('{:<20} {:>8.3f} s'.format('interpreter', wall_time - result['total']))
+    print('{:<20} {:>8.3f} s (budget {:g} s)'.format('total', wall_time, args.budget))
+    print('heavy modules imported: ' + (', '.join(result['heavy_modules']) or 'none'))
+
+    failed = wall_time > args.budget
+    if failed:
+        print('FAILED: the cold start exceeds the budget')
+    if result['heavy_modules']:
+        print('FAILED: heavy modules imported on the startup path')
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,311 @@
+# -*- encoding: utf-8 -*-
+# Recording of the tracks of every frame, to recount the crossings without detection.
+#
+# TrackRecorder appends, after each frame, the positions that are new since the previous
+# frame (the whole history for a new track) to an append-only entries file, and the end
+# of the entries of the frame to a frame index file:
+#   <name>.trk: header, then ENTRY_DTYPE records, grouped by frame and by track
+#   <name>.idx: header, then one INDEX_DTYPE record per frame: timestamp (microseconds,
+#               local time, see crossing_log.to_timestamp) and end of the entries of the frame
+# Each header is the magic (4 bytes), the version and the record size (uint32, uint32)
+# and 4 reserved bytes. Tracks without any position are not recorded.
+#
+# TrackRecording reads both files through memory maps. TrackReplay is a detection/tracking
+# backend rebuilding the TrackTable of every recorded frame, so do_recording sees the same
+# tracks as during the recording (use Backend 'tracks' with the .trk file as Camera_Path).
+#
+# Recount with other cut lines (from the Skimage directory):
+#   python python_src/track_recording.py Logs_tracks/sensorID_3_20210214_080000.trk --id 3 \
+#       --cut-line 1 "[[0.1, 0.5], [0.9, 0.55]]" --valid-min-frames-norm 0.5
+
+import argparse
+import logging
+import os
+import struct
+import time
+from datetime import datetime
+from pathlib import Path
+import numpy as np
+
+import crossing_log
+import tracks
+
+recording_logger = logging.getLogger('skimage.track_recording')
+
+ENTRIES_MAGIC = b'SKTR'
+INDEX_MAGIC = b'SKTI'
+VERSION = 1
+HEADER_SIZE = 16
+
+# One position of a track: UUID, length of the history of the track in the backend on
+# this frame, then the TRACK_DTYPE fields
+ENTRY_DTYPE = np.dtype([('uuid', np.int64),
+                        ('length', np.int32),
+                        ('x', np.float32),
+                        ('y', np.float32),
+                        ('size', np.int32),
+                        ('valid', np.bool_)])
+
+INDEX_DTYPE = np.dtype([('timestamp', np.int64),
+                        ('stop', np.int64)])
+
+
+def header(magic, dtype):
+    return magic + struct.pack('<III', VERSION, dtype.itemsize, 0)
+
+
+def recording_filenames(filename):
+    # Entries and frame index files of a recording, from either name (or no suffix)
+    filename = Path(filename)
+    return filename.with_suffix('.trk'), filename.with_suffix('.idx')
+
+
+class TrackRecorder:
+    def __init__(self, filename):
+        self.entries_filename, self.index_filename = recording_filenames(filename)
+        self.entries_file = self.open(self.entries_filename, ENTRIES_MAGIC, ENTRY_DTYPE)
+        self.index_file = self.open(self.index_filename, INDEX_MAGIC, INDEX_DTYPE)
+        self.n_entries = (self.entries_file.tell() - HEADER_SIZE) // ENTRY_DTYPE.itemsize
+        recording_logger.info('Recording tracks to ' + str(self.entries_filename))
+
+    @staticmethod
+    def open(filename, magic, dtype):
+        # Keep appending to an existing recording only if it has the same layout
+        if filename.is_file():
+            with open(filename, 'rb') as f:
+                if f.read(HEADER_SIZE) != header(magic, dtype):
+                    os.replace(filename, filename.with_suffix(filename.suffix + '.old'))
+        f = open(filename, 'ab')
+        if f.tell() == 0:
+            f.write(header(magic, dtype))
+        return f
+
+    def record(self, table, registry, timestamp=None):
+        # Appends the positions of the frame that are new since the previous frame
+        # table, registry: the TrackTable of the frame and the TrackRegistry updated from it
+        if timestamp is None:
+            timestamp = crossing_log.to_timestamp(datetime.now())
+        lengths = table.lengths
+        n_new = np.minimum(registry.steps, lengths)
+        if registry.started:
+            # The whole history of a new track
+            is_new = np.isin(table.uuids, registry.started)
+            n_new[is_new] = lengths[is_new]
+
+        n_records = int(n_new.sum())
+        if n_records:
+            stops = table.offsets[1:]
+            first = np.cumsum(n_new) - n_new
+            positions = (np.repeat(stops - n_new - first, n_new) + np.arange(n_records))
+            records = table.records[positions]
+            entries = np.empty(n_records, ENTRY_DTYPE)
+            entries['uuid'] = np.repeat(table.uuids, n_new)
+            entries['length'] = np.repeat(lengths, n_new)
+            for field in tracks.TRACK_DTYPE.names:
+                entries[field] = records[field]
+            self.entries_file.write(entries.tobytes())
+            self.n_entries += n_records
+
+        self.index_file.write(np.array([(timestamp, self.n_entries)], INDEX_DTYPE).tobytes())
+
+    def flush(self):
+        # The entries first, so that the index never points past the written entries
+        self.entries_file.flush()
+        self.index_file.flush()
+
+    def close(self):
+        self.flush()
+        self.entries_file.close()
+        self.index_file.close()
+
+
+class TrackRecording:
+    # Read-only view of a recording, the frames are indexed from 0
+    def __init__(self, filename):
+        self.entries_filename, self.index_filename = recording_filenames(filename)
+        self.entries = self.map(self.entries_filename, ENTRIES_MAGIC, ENTRY_DTYPE)
+        index = self.map(self.index_filename, INDEX_MAGIC, INDEX_DTYPE)
+        # Frames whose entries were not all written (recording interrupted) are ignored
+        self.index = index[:np.searchsorted(index['stop'], self.entries.size, side='right')]
+
+    @staticmethod
+    def map(filename, magic, dtype):
+        with open(filename, 'rb') as f:
+            if f.read(HEADER_SIZE) != header(magic, dtype):
+                raise ValueError(str(filename) + ' is not a track recording (version ' + str(VERSION) + ')')
+        n_records = (os.path.getsize(filename) - HEADER_SIZE) // dtype.itemsize
+        if n_records == 0:
+            return np.zeros(0, dtype)
+        # Plain ndarray view of the map: slicing a np.memmap is much slower
+        return np.memmap(filename, dtype, mode='r', offset=HEADER_SIZE, shape=(n_records,)).view(np.ndarray)
+
+    def __len__(self):
+        return self.index.size
+
+    def frame(self, idx):
+        # Entries of frame idx
+        start = self.index['stop'][idx - 1] if idx > 0 else 0
+        return self.entries[start:self.index['stop'][idx]]
+
+    def timestamp(self, idx):
+        return int(self.index['timestamp'][idx])
+
+
+class TrackReplay:
+    # Detection/tracking backend replaying a recording, see the interface in replay_backend
+    def __init__(self, parameters, recording=None):
+        self.parameters = parameters
+        self.recording = recording
+        self.isValidHardware = True
+        self.skiers_passed = []
+        self.frame = -1
+        self.timestamp = None  # recording time of the current frame
+        self.histories = {}
+        self.table = tracks.TrackTable()
+
+    # ****** Setup ******
+    def setup_RoI(self, roi):
+        # The ROI was applied by the detection when the tracks were recorded
+        pass
+
+    def set_skiers_passed(self, skiers_passed):
+        self.skiers_passed = list(skiers_passed)
+
+    def initialize_camera(self):
+        # Same return value as the compiled backend: [status, width, height, fps]
+        if self.recording is None:
+            try:
+                self.recording = TrackRecording(self.parameters['Camera_Path'])
+            except (OSError, ValueError) as error:
+                recording_logger.critical(str(error))
+                return [-1, 0, 0, 0]
+        return [0, self.parameters['Width_Image'], self.parameters['Height_Image'], self.parameters['FPS']]
+
+    def initialize_videowriter(self):
+        # There is no video to write
+        return 0
+
+    # ****** Time of the frames, see clock.StreamClock ******
+    def stream_start(self):
+        if len(self.recording) == 0:
+            return time.time()
+        return crossing_log.from_timestamp(self.recording.timestamp(0)).timestamp()
+
+    def frame_timestamp(self):
+        # Recording time of the current frame, in seconds since the epoch
+        return crossing_log.from_timestamp(self.timestamp).timestamp()
+
+    # ****** Per frame ******
+    def process_frame(self):
+        # Returns 0 while frames are available, like the compiled backend
+        self.frame += 1
+        if self.recording is None or self.frame >= len(self.recording):
+            return 1
+        self.timestamp = self.recording.timestamp(self.frame)
+
+        entries = self.recording.frame(self.frame)
+        new_records = np.empty(entries.size, tracks.TRACK_DTYPE)
+        for field in tracks.TRACK_DTYPE.names:
+            new_records[field] = entries[field]
+        # The entries of a track are contiguous, in the order of the tracks of the table
+        uuids = entries['uuid']
+        starts = np.flatnonzero(np.concatenate(([uuids.size > 0], uuids[1:] != uuids[:-1])))
+        stops = np.append(starts[1:], uuids.size)
+        lengths = entries['length'][starts].astype(np.int64)
+        offsets = np.zeros(starts.size + 1, np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+
+        # Each history is the end of the previous one followed by the new positions. Tracks
+        # already running when the recording started are padded with invalid positions
+        records = np.zeros(offsets[-1], tracks.TRACK_DTYPE)
+        histories = {}
+        for track_id, start, stop, offset, end in zip(uuids[starts].tolist(), starts.tolist(), stops.tolist(),
+                                                      offsets[:-1].tolist(), offsets[1:].tolist()):
+            n_new = min(stop - start, end - offset)
+            records[end - n_new:end] = new_records[stop - n_new:stop]
+            n_old = end - offset - n_new
+            history = self.histories.get(track_id)
+            if n_old and history is not None:
+                history = history[-n_old:]
+                records[end - n_new - history.size:end - n_new] = history
+            histories[track_id] = records[offset:end]
+        self.histories = histories
+        self.table.wrap(records, offsets, uuids[starts])
+        return 0
+
+    def get_multitracker_export(self):
+        # Bulk export in TRACK_DTYPE layout, see tracks.export_tracks
+        return self.table.export()
+
+
+def recount(parameters):
+    # Counts the crossings of a recording with the given parameters, returns the CameraCore
+    # whose list_of_crossings holds the crossings, timestamped with the recording times
+    import core
+
+    backend = TrackReplay(parameters)
+    camera_core = core.CameraCore(parameters, backend, offline=True)
+    while not backend.process_frame():
+        camera_core.clock.advance(backend)
+        camera_core.parse_cpp_tracks()
+        camera_core.do_recording()
+    camera_core.close()
+    return camera_core
+
+
+def main():
+    import parameter_parser
+    import batch_reprocess
+
+    ap = argparse.ArgumentParser(description='Recount the crossings of recorded tracks, e.g. with other cut lines')
+    ap.add_argument('recording', help='Track recording (.trk)')
+    ap.add_argument('--id', type=int, required=True, help='Sensor_ID whose parameters are used')
+    ap.add_argument('--cut-line', nargs=2, action='append', default=[], metavar=('N', 'POINTS'),
+                    help='Replaces Cut_LineN by a list of points in normalized coordinates, e.g. "[[0, 0.5], [1, 0.5]]"')
+    ap.add_argument('--valid-min-frames-norm', type=float, help='Replaces Valid_Min_Frames_Norm')
+    ap.add_argument('--output', help='Also write the SKIMAGE logs of the recount to this directory')
+    ap.add_argument('--param-file', default='data/skimage_parameters.xlsx')
+    args = ap.parse_args()
+
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    logging.getLogger('skimage').setLevel(logging.WARNING)
+    recording_logger.setLevel(logging.INFO)
+
+    parameters = None
+    for params in parameter_parser.get_parameters(args.param_file, get_all_params=True):
+        if params['Sensor_ID'] == args.id:
+            parameters = params
+            break
+    if parameters is None:
+        raise SystemExit('No parameters found for Sensor_ID ' + str(args.id) + ' in ' + args.param_file)
+    for n, points in args.cut_line:
+        parameters['Cut_Line' + n] = points
+    if args.valid_min_frames_norm is not None:
+        parameters['Valid_Min_Frames_Norm'] = args.valid_min_frames_norm
+    period = int(parameters['Period_Skimage_Log'])
+    parameters['Camera_Path'] = str(recording_filenames(args.recording)[0])
+    parameters['Backend'] = 'tracks'
+    parameters = parameter_parser.dimensionalize_parameters(parameter_parser.compose_camera_url(parameters))
+    parameters['Period_Skimage_Log'] = 10**9
+
+    start_time = time.perf_counter()
+    camera_core = recount(parameters)
+    events = camera_core.list_of_crossings
+    n_cut_lines = len(camera_core.cut_lines)
+    recording_logger.info(str(camera_core.detect_and_track.frame) + ' frames recounted in '
+                          + format(time.perf_counter() - start_time, '.1f') + ' s, crossings per cut line: '
+                          + '/'.join(str(x) for x in events.counts(n_cut_lines)))
+
+    if args.output:
+        recording = camera_core.detect_and_track.recording
+        output_dir = Path(args.output)
+        os.makedirs(output_dir, exist_ok=True)
+        spans = [(recording.timestamp(0), recording.timestamp(len(recording) - 1))] if len(recording) else []
+        written = batch_reprocess.write_period_logs(output_dir, args.id, period, n_cut_lines,
+                                                    events.timestamps[:events.size], events.cut_lines[:events.size],
+                                                    spans)
+        recording_logger.info(str(len(written)) + ' SKIMAGE logs written to ' + str(output_dir))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,275 @@
+# -*- encoding: utf-8 -*-
+# Bulk export of the tracks of the detection/tracking backend:
+#   -All the tracks of a frame are held in one contiguous structured array
+#   -An offsets index gives the history of each track without per-track copies
+#   -The buffers are reused from frame to frame and only grow when needed
+# Persistent registry of the tracks, keyed by UUID:
+#   -Applies the per-frame deltas (new tracks, appended positions, removed tracks)
+#   -Keeps a bounded window of the history of each track
+
+import numpy as np
+
+# One record per position in the history of a track
+TRACK_DTYPE = np.dtype([('x', np.float32),
+                        ('y', np.float32),
+                        ('size', np.int32),
+                        ('valid', np.bool_)])
+# Same records seen as raw bytes: numpy copies structured arrays field by field,
+# raw records are copied as one block of memory
+RAW_DTYPE = np.dtype((np.void, TRACK_DTYPE.itemsize))
+
+# Number of positions kept in the history of each Tracker of the registry
+HISTORY_WINDOW = 32
+
+
+class TrackTable:
+    # records[offsets[i]:offsets[i+1]] is the history of the track uuids[i], oldest first
+    def __init__(self, capacity=4096, max_tracks=128):
+        self._records = np.zeros(capacity, TRACK_DTYPE)
+        self._offsets = np.zeros(max_tracks + 1, np.int64)
+        self._uuids = np.zeros(max_tracks, np.int64)
+        self.n_tracks = 0
+        self._wrapped = False  # the buffers belong to the backend, see wrap
+
+    def __len__(self):
+        return self.n_tracks
+
+    @property
+    def records(self):
+        return self._records[:self._offsets[self.n_tracks]]
+
+    @property
+    def offsets(self):
+        return self._offsets[:self.n_tracks + 1]
+
+    @property
+    def uuids(self):
+        return self._uuids[:self.n_tracks]
+
+    @property
+    def lengths(self):
+        return np.diff(self.offsets)
+
+    def track(self, idx):
+        # History of track idx (a view, not a copy)
+        return self._records[self._offsets[idx]:self._offsets[idx + 1]]
+
+    def _reserve(self, n_tracks, n_records):
+        if self._wrapped:
+            # Never write to the buffers of the backend
+            self._wrapped = False
+            self._offsets = np.zeros(0, np.int64)
+            self._records = np.zeros(0, TRACK_DTYPE)
+        if n_tracks + 1 > self._offsets.size:
+            self._offsets = np.zeros(max(n_tracks + 1, 2 * self._offsets.size), np.int64)
+            self._uuids = np.zeros(self._offsets.size - 1, np.int64)
+        if n_records > self._records.size:
+            self._records = np.zeros(max(n_records, 2 * self._records.size), TRACK_DTYPE)
+
+    def load(self, states, valids, uuids):
+        # Fills the table from the per-track outputs of get_multitracker_states/valids/uuids
+        # The C++ tracker keeps the states and the valids of a track in lockstep
+        n_tracks = len(uuids)
+        lengths = np.fromiter((len(state) for state in states), np.int64, n_tracks)
+        self._reserve(n_tracks, int(lengths.sum()))
+        self.n_tracks = n_tracks
+        if n_tracks == 0:
+            return self
+
+        self._uuids[:n_tracks] = uuids
+        np.cumsum(lengths, out=self._offsets[1:n_tracks + 1])
+        n_records = self._offsets[n_tracks]
+
+        states = np.concatenate(states)
+        records = self._records[:n_records]
+        records['x'] = states[:, 0]
+        records['y'] = states[:, 1]
+        records['size'] = states[:, 4]
+        records['valid'] = np.concatenate(valids)
+        return self
+
+    def fill(self, histories, uuids):
+        # Fills the table from the histories of the tracks (TRACK_DTYPE arrays, oldest first)
+        # in one copy: the bulk export of the Python backends, see export_tracks
+        n_tracks = len(uuids)
+        lengths = np.fromiter((history.size for history in histories), np.int64, n_tracks)
+        self._reserve(n_tracks, int(lengths.sum()))
+        self.n_tracks = n_tracks
+        if n_tracks == 0:
+            return self
+        self._uuids[:n_tracks] = uuids
+        np.cumsum(lengths, out=self._offsets[1:n_tracks + 1])
+        np.concatenate([history.view(RAW_DTYPE) for history in histories],
+                       out=self._records[:self._offsets[n_tracks]].view(RAW_DTYPE))
+        return self
+
+    def export(self):
+        # Contents of the table in the layout of get_multitracker_export
+        return self.records, self.offsets, self.uuids
+
+    def wrap(self, records, offsets, uuids):
+        # Adopts buffers exported by the backend in TRACK_DTYPE layout, without copying them
+        self._records = np.asarray(records, TRACK_DTYPE)
+        self._offsets = np.asarray(offsets, np.int64)
+        self._uuids = np.asarray(uuids, np.int64)
+        self.n_tracks = self._uuids.size
+        self._wrapped = True
+        return self
+
+    def assign(self, records, offsets, uuids):
+        # Copies tracks exported by the backend in TRACK_DTYPE layout into the buffers of the table
+        n_tracks = len(uuids)
+        n_records = int(offsets[n_tracks]) if n_tracks else 0
+        self._reserve(n_tracks, n_records)
+        self.n_tracks = n_tracks
+        self._records[:n_records].view(RAW_DTYPE)[:] = np.asarray(records[:n_records], TRACK_DTYPE).view(RAW_DTYPE)
+        self._offsets[:n_tracks + 1] = offsets[:n_tracks + 1]
+        self._uuids[:n_tracks] = uuids
+        return self
+
+    def last_steps(self, min_length, n_steps=1, return_lengths=False):
+        # Returns the last steps of the tracks (n_steps per track, a scalar or one value
+        # per track) that could cross a cut line: the track held at least min_length (and at
+        # least two) positions at the end of the step, and both ends of the step are valid.
+        # The steps are returned as (track indices, (n, 2) start points, (n, 2) end points),
+        # in track order and oldest step first within a track, followed by the number of
+        # positions of the track at the end of each step if return_lengths is True
+        offsets = self.offsets
+        lengths = np.diff(offsets)
+        n_steps = np.minimum(n_steps, np.maximum(lengths - 1, 0))
+        candidates = np.repeat(np.arange(self.n_tracks), n_steps)
+
+        # Index of the end point of every step
+        first_steps = np.cumsum(n_steps) - n_steps
+        stops = (np.repeat(offsets[1:] - n_steps, n_steps)
+                 + np.arange(candidates.size) - np.repeat(first_steps, n_steps))
+
+        valid = self._records['valid']
+        step_lengths = stops - offsets[candidates] + 1
+        keep = ((step_lengths >= max(min_length, 2))
+                & valid[stops] & valid[stops - 1])
+        candidates = candidates[keep]
+        stops = stops[keep]
+
+        records = self._records
+        track_starts = np.column_stack((records['x'][stops - 1], records['y'][stops - 1]))
+        track_stops = np.column_stack((records['x'][stops], records['y'][stops]))
+        if return_lengths:
+            return candidates, track_starts, track_stops, step_lengths[keep]
+        return candidates, track_starts, track_stops
+
+
+def export_tracks(detect_and_track, table, copy=False):
+    # Reads all the tracks of the current frame from the backend into table.
+    # Backends that can export their tracks in bulk (get_multitracker_export, returning
+    # records, offsets and uuids buffers in TRACK_DTYPE layout) are read without copies,
+    # unless the table must outlive the next frame (copy=True)
+    if hasattr(detect_and_track, 'get_multitracker_export'):
+        if copy:
+            return table.assign(*detect_and_track.get_multitracker_export())
+        return table.wrap(*detect_and_track.get_multitracker_export())
+
+    return table.load(detect_and_track.get_multitracker_states(),
+                      detect_and_track.get_multitracker_valids(),
+                      detect_and_track.get_multitracker_uuids())
+
+
+class Tracker:
+    # Compact tracker with a bounded history: the last `window` positions are kept in a
+    # ring buffer, n_frames counts all the positions seen since the track started
+    __slots__ = ('UUID', 'color', 'n_frames', 'length', '_history', '_head', '_count')
+
+    def __init__(self, track_id, window, color=(255, 255, 255)):
+        self.UUID = track_id
+        self.color = color
+        self.n_frames = 0
+        self.length = 0  # length of the history of the track in the backend
+        self._history = np.zeros(window, TRACK_DTYPE)
+        self._head = 0  # next slot to write
+        self._count = 0  # number of filled slots
+
+    def extend(self, records):
+        # Appends new positions (TRACK_DTYPE records, oldest first)
+        window = self._history.size
+        records = records[-window:]
+        n = records.size
+        first = min(n, window - self._head)
+        self._history[self._head:self._head + first] = records[:first]
+        self._history[:n - first] = records[first:]
+        self._head = (self._head + n) % window
+        self._count = min(self._count + n, window)
+        self.n_frames += n
+
+    def history(self):
+        # Windowed history, oldest first (a copy)
+        if self._count < self._history.size:
+            return self._history[:self._count].copy()
+        return np.roll(self._history, -self._head)
+
+    @property
+    def Pos(self):
+        history = self.history()
+        return np.array([history['x'], history['y']], np.float32)
+
+    @property
+    def Size(self):
+        return self.history()['size']
+
+    @property
+    def Valid(self):
+        return self.history()['valid']
+
+
+class TrackRegistry:
+    # Trackers that persist from frame to frame, updated from the TrackTable of each frame
+    def __init__(self, window=HISTORY_WINDOW):
+        self.window = window
+        self.trackers = {}
+        self.started = []  # UUIDs of the tracks that appeared on the last update
+        self.ended = []  # UUIDs of the tracks that ended on the last update
+        # Number of steps of each track of the last table that were not tested yet:
+        # one per frame, more if frames were skipped between two updates
+        self.steps = np.zeros(0, np.int64)
+
+    def __len__(self):
+        return len(self.trackers)
+
+    def __contains__(self, track_id):
+        return track_id in self.trackers
+
+    def __iter__(self):
+        return iter(self.trackers.values())
+
+    def update(self, table, n_frames=1):
+        # n_frames: frames since the last update, more than one when the pipeline dropped tables
+        trackers = self.trackers
+        records = table.records
+        uuids = table.uuids.tolist()
+        stops = table.offsets[1:].tolist()
+        lengths = table.lengths.tolist()
+
+        # Removed tracks
+        self.ended = list(trackers.keys() - set(uuids))
+        for track_id in self.ended:
+            del trackers[track_id]
+
+        # New tracks and appended positions
+        self.started = []
+        steps = []
+        for track_id, stop, length in zip(uuids, stops, lengths):
+            tracker = trackers.get(track_id)
+            is_new = tracker is None
+            if is_new:
+                tracker = Tracker(track_id, self.window)
+                trackers[track_id] = tracker
+                self.started.append(track_id)
+            new_positions = length - tracker.length
+            if new_positions <= 0:
+                # The backend keeps a bounded history: only its last position is new
+                new_positions = min(length, 1)
+            tracker.extend(records[stop - new_positions:stop])
+            tracker.length = length
+            # A new track is tested on its steps since the last update, as on any other frame
+            steps.append(n_frames if is_new else new_positions)
+        self.steps = np.array(steps, np.int64)
+        return self
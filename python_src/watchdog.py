@@ -1,15 +1,31 @@
+# Watchdog of Skimage, run in its own container: restarts Skimage through the semaphore
+# when a camera is pingable during business hours but Skimage is stalled. Every sensor of
+# data/my_id.txt is watched, in host mode a stalled camera restarts all of them.
+# The heartbeat published by Skimage (see heartbeat.py) is read every second, so a stall is
+# detected within STALL_SECONDS; the SKIMAGE logs are only checked, every few periods, when
+# there is no heartbeat (Skimage quit, or an older Skimage without heartbeat).
+# Importing this module has no side effect, the watch is started by main()
 import time
 from datetime import datetime
 import glob
 import logging
 import os
 from pathlib import Path
+import heartbeat
 import parameter_parser
 import startup_checks
 
 # create logger
 watchdog_logger = logging.getLogger('watchdog')
 
+# Seconds between two reads of the heartbeat
+HEARTBEAT_CHECK_PERIOD = 1
+
+# Skimage is stalled when no frame was processed for STALL_SECONDS,
+# or when the camera is still not open START_SECONDS after its start (or restart)
+STALL_SECONDS = 5
+START_SECONDS = 60
+
 def setup_logging():
     watchdog_logger.setLevel(logging.DEBUG)
 
@@ -91,77 +107,154 @@ def logs_correct(parameter, nowish):
     return logs_correct
 
 
-# Setup watchdog logs
-setup_logging()
-
-# Get file paths
-file_paths = startup_checks.check_filesystem()
-
-# Load parameters
-parameters = parameter_parser.get_parameters()
+def heartbeat_correct(record, now):
+    # True if Skimage is alive, False if stalled, None if the heartbeat tells nothing (Skimage quit)
+    if record is None or record.state == heartbeat.STOPPED:
+        return None
+    if record.state == heartbeat.RUNNING:
+        return now - record.last_frame_time < STALL_SECONDS
+    if record.state == heartbeat.STARTING:
+        return now - record.start_time < START_SECONDS
+    # Camera released while the station is closed
+    return True
+
+
+def heartbeat_info(record):
+    infoStr = 'FPS ' + format(record.fps, '.1f') + ', ' + str(record.n_frames) + ' frames'
+    if record.queue_size:
+        infoStr += ', queue ' + str(record.queue_depth) + '/' + str(record.queue_size)
+    return infoStr
+
+
+def send_restart_signal(file_paths, nowish):
+    # Check semaphore directory
+    parameters_filepath = file_paths['params']
+    semaphore_dir = parameters_filepath / 'semaphore'  # this should be data/semaphore
+    if not semaphore_dir.is_dir():
+        semaphore_dir.mkdir(parents=True, exist_ok=True)
+
+    semaphore = semaphore_dir / 'semaphore'
+    with open(semaphore, 'a') as f:
+        f.write(str(nowish) + ' : restarting signal \n')
+
+
+class SensorWatch:
+    # Watch of one sensor: its heartbeat is read every second, a full check (business hours,
+    # ping, heartbeat or logs) is done every sleep_time, or as soon as the heartbeat is
+    # stalled (not before hold_until, after a restart or when the camera is not pingable)
+    def __init__(self, parameters, file_paths, sleep_time):
+        self.parameters = parameters
+        self.sleep_time = sleep_time
+        self.heartbeat_reader = heartbeat.HeartbeatReader(heartbeat.heartbeat_filename(file_paths['params'],
+                                                                                       parameters['Sensor_ID']))
+        self.next_full_check = time.monotonic() + sleep_time
+        self.hold_until = time.monotonic()
+
+    def hold(self, seconds):
+        self.hold_until = time.monotonic() + seconds
+
+    def check(self, nowish):
+        # Returns True if Skimage needs to be restarted
+        parameters = self.parameters
+        record = self.heartbeat_reader.read()
+        heartbeat_ok = heartbeat_correct(record, time.time())
+        stalled = heartbeat_ok is False and time.monotonic() >= self.hold_until and in_business(nowish, parameters)
+        if not stalled and time.monotonic() < self.next_full_check:
+            return False
+        self.next_full_check = time.monotonic() + self.sleep_time
+
+        need_to_reboot = False
+        sensor_id = str(parameters['Sensor_ID'])
+        infoStr = ''
+
+        # Is the station open? If so, check the status of the sensor.
+        if in_business(nowish, parameters):
+            infoStr += 'Sensor ' + sensor_id + ' is within business hours'
+
+            #  Is the sensor pingable? If so, check Skimage processes frames
+            if sensor_pingable(parameters):
+                infoStr += ', camera is pingable'
+                # Is the heartbeat recent? If so, everything it is all good for this sensor
+                if heartbeat_ok:
+                    infoStr += ' and Skimage is running (' + heartbeat_info(record) + ')'
+                    need_to_reboot = False
+
+                elif heartbeat_ok is False:
+                    if record.state == heartbeat.STARTING:
+                        infoStr += ' but Skimage did not open the camera in ' + str(START_SECONDS) + ' seconds'
+                    else:
+                        infoStr += (' but Skimage processed no frame for '
+                                    + format(time.time() - record.last_frame_time, '.0f') + ' seconds')
+                    need_to_reboot = True
+
+                #  Without heartbeat, are the logs up to date? If so, everything it is all good for this sensor
+                elif logs_correct(parameters, nowish):
+                    infoStr += ' and logs are up to date'
+                    need_to_reboot = False
+
+                # If we are in business hours and the sensor is pingable but the logs are not up to date there is a
+                # problem, and we need to restart ...
+                # Todo: We can imagine that the sensor is pingable but it is not operating correctly...
+                else:
+                    infoStr += ' but logs are outdated'
+                    need_to_reboot = True
+
+            # If the sensor is not pingable, we don't worry about checking Skimage until the next full check
+            else:
+                infoStr += ' but the camera is not pingable'
+                self.hold_until = self.next_full_check
 
-# Number of cycles between every check (1 cycle ~ 60s)
-sleep_time_periods = 5
+        #  If the station is closed, we don't worry about checking the sensor or the logs
+        else:
+            infoStr += 'Sensor ' + sensor_id + ': station is closed'
 
-# Get initial value of sleep time
-max_period = parameters['Period_Skimage_Log']
-sleep_time = max_period * sleep_time_periods
+        if need_to_reboot:
+            watchdog_logger.warning(infoStr + ': resetting skimage.\n\n')
+        else:
+            watchdog_logger.info(infoStr + ': next check in ' + str(self.sleep_time)
+                                 + ' seconds, heartbeat checked every second.')
+        return need_to_reboot
 
-watchdog_logger.info('Starting watch')
-while True:
-    time.sleep(sleep_time)
 
-    nowish = datetime.now()
-    need_to_reboot = False
-    sensor_id = str(parameters['Sensor_ID'])
-    infoStr = ''
+def main():
+    # Setup watchdog logs
+    setup_logging()
 
-    # Is the station open? If so, check the status of the sensor.
-    if in_business(nowish, parameters):
-        infoStr += 'Sensor ' + sensor_id + ' is within business hours'
+    # Get file paths
+    file_paths = startup_checks.check_filesystem()
 
-        #  Is the sensor pingable? If so, check the logs are up to date
-        if sensor_pingable(parameters):
-            infoStr += ', camera is pingable'
-            #  Are the logs up to date? If so, everything it is all good for this sensor
-            if logs_correct(parameters, nowish):
-                infoStr += ' and logs are up to date'
-                need_to_reboot = False
+    # Load parameters of every sensor of the Odroid (several in host mode, see camera_host.py)
+    parameters_list = parameter_parser.get_parameters_list(parameter_parser.read_sensor_ids())
 
-            # If we are in business hours and the sensor is pingable but the logs are not up to date there is a
-            # problem, and we need to restart ...
-            # Todo: We can imagine that the sensor is pingable but it is not operating correctly...
-            else:
-                infoStr += ' but logs are outdated'
-                need_to_reboot = True
+    # Number of cycles between every full check (1 cycle ~ 60s)
+    sleep_time_periods = 5
 
-        # If the sensor is not pingable, we don't worry about checking the logs
-        else:
-            infoStr += ' but the camera is not pingable'
+    watches = []
+    for parameters in parameters_list:
+        # Get initial value of sleep time
+        max_period = parameters['Period_Skimage_Log']
+        watches.append(SensorWatch(parameters, file_paths, max_period * sleep_time_periods))
 
-    #  If the station is closed, we don't worry about checking the sensor or the logs
-    else:
-        infoStr += 'Station is closed'
+    watchdog_logger.info('Starting watch of sensors ' + ', '.join(str(p['Sensor_ID']) for p in parameters_list))
+    while True:
+        time.sleep(HEARTBEAT_CHECK_PERIOD)
 
-    #  If we need to reboot,
-    if need_to_reboot:
-        infoStr += ': resetting skimage.\n\n'
+        nowish = datetime.now()
+        need_to_reboot = False
+        for watch in watches:
+            need_to_reboot = watch.check(nowish) or need_to_reboot
 
-        # Check semaphore directory
-        parameters_filepath = file_paths['params']
-        semaphore_dir = parameters_filepath / 'semaphore'  # this should be data/semaphore
-        if not semaphore_dir.is_dir():
-            semaphore_dir.mkdir(parents=True, exist_ok=True)
+        #  If we need to reboot, all the sensors are restarted with Skimage
+        if need_to_reboot:
+            send_restart_signal(file_paths, nowish)
+            # Give Skimage the time to restart and open the cameras
+            for watch in watches:
+                watch.hold(START_SECONDS)
 
-        semaphore = semaphore_dir / 'semaphore'
-        with open(semaphore, 'a') as f:
-            f.write(str(nowish) + ' : restarting signal \n')
+            setup_logging() # Change the watchdog log file
+            watchdog_logger.info('Monitoring the newly reset Skimage. Will recheck its heartbeat in '
+                                    + str(START_SECONDS) + ' seconds')
 
-        watchdog_logger.warning(infoStr)
 
-        setup_logging() # Change the watchdog log file
-        watchdog_logger.info('Monitoring the newly reset Skimage. Will recheck in '
-                                + str(sleep_time) + ' seconds')
-    else:
-        infoStr += ': next check in ' + str(sleep_time) + ' seconds.'
-        watchdog_logger.info(infoStr)
\ No newline at end of file
+if __name__ == '__main__':
+    main()
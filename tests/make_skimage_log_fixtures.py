@@ -0,0 +1,76 @@
+# Writes the SKIMAGE logs of the periods of test_skimage_logs.py to tests/fixtures/skimage_logs
+# with the former pandas writer of CameraCore (count_crossings + save_skimage_log). Only needed
+# to regenerate the fixtures, from the repository root:
+#   python tests/make_skimage_log_fixtures.py
+# DataFrame.append was removed in pandas 2, the rows are appended with pd.concat instead.
+
+import pandas as pd
+
+from test_skimage_logs import FIXTURES, N_CUT_LINES, PERIODS, SENSOR_ID, fixture_names
+
+
+def append(frame, row):
+    # DataFrame.append(row, ignore_index=True)
+    return pd.concat([frame, row.to_frame().T], ignore_index=True)
+
+
+def write_period(period):
+    nowish, cut_period, crossings = PERIODS[period]
+
+    # count_crossings
+    list_of_crossings = pd.DataFrame()
+    for crossing_time, idx in crossings:
+        log_dict = {'sensorID': str(SENSOR_ID),
+                    'date': crossing_time.strftime('%d/%m/%Y'),
+                    'time': crossing_time.strftime('%H:%M:%S:%f')[:-3],
+                    'cut_period': 0,
+                    'voltage1': '',
+                    'voltage2': '',
+                    'voltage3': ''
+                    }
+        for i in range(N_CUT_LINES):
+            log_dict['skiers_passed_cutline_' + str(i)] = 1 if i == idx else 0
+        list_of_crossings = append(list_of_crossings, pd.Series(log_dict))
+
+    # save_skimage_log
+    keys = ['skiers_passed_cutline_' + str(ii) for ii in range(N_CUT_LINES)]
+    for ii, name in enumerate(fixture_names(period)):
+        if len(list_of_crossings) == 0:
+            total = 0
+            cutline_list_of_crossings = pd.DataFrame()
+        else:
+            key = 'skiers_passed_cutline_' + str(ii)
+            list_of_crossings['skiers_passed'] = list_of_crossings[key]
+            cutline_list_of_crossings = list_of_crossings[list_of_crossings[key] != 0]
+            cutline_list_of_crossings = cutline_list_of_crossings.drop(columns=keys)
+            total = list_of_crossings[key].sum()
+
+        total_row = pd.Series(
+            {'sensorID': str(SENSOR_ID),
+             'date': nowish.strftime('%d/%m/%Y'),
+             'time': nowish.strftime('%H:%M:%S:%f')[:-3],
+             'cut_period': int(cut_period),
+             'voltage1': '',
+             'voltage2': '',
+             'voltage3': '',
+             'skiers_passed': total
+             })
+        cutline_list_of_crossings = append(cutline_list_of_crossings, total_row)
+
+        cutline_list_of_crossings.to_csv(FIXTURES / name,
+                                         header=0,
+                                         index=False,
+                                         columns=['sensorID',
+                                                  'date',
+                                                  'time',
+                                                  'cut_period',
+                                                  'voltage1',
+                                                  'voltage2',
+                                                  'voltage3',
+                                                  'skiers_passed'])
+
+
+if __name__ == '__main__':
+    FIXTURES.mkdir(parents=True, exist_ok=True)
+    for period in PERIODS:
+        write_period(period)
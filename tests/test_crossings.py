@@ -0,0 +1,137 @@
+# Tests of the batched crossing engine of python_src/crossings.py against the scalar
+# has_crossed() loop that CameraCore ran before it, run with
+#   python -m pytest tests
+
+import sys
+from collections import namedtuple
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'python_src'))
+import crossings  # noqa: E402
+
+WIDTH = 640
+HEIGHT = 360
+
+Point = namedtuple('Point', ['x', 'y'])
+
+
+def has_crossed(a1, b1, cut_line):
+    # The scalar test of CameraCore.has_crossed, kept as the reference
+    def ccw(A, B, C):
+        if (B.x - A.x) * (C.y - A.y) > (B.y - A.y) * (C.x - A.x):
+            counter_clockwise = True
+        else:
+            counter_clockwise = False
+        return counter_clockwise
+
+    crossed_segment = []
+    for ii in range(len(cut_line)-1):
+        a2 = Point(cut_line[ii][0], cut_line[ii][1])
+        b2 = Point(cut_line[ii+1][0], cut_line[ii+1][1])
+        crossed_segment.append(ccw(a1, b1, a2) != ccw(a1, b1, b2) and ccw(a2, b2, a1) != ccw(a2, b2, b1))
+    return any(crossed_segment)
+
+
+def reference_hits(starts, stops, cut_lines):
+    # Hit matrix of the scalar loop, on float32 values as the tracker positions and the cut lines
+    starts = np.asarray(starts, np.float32).reshape(-1, 2)
+    stops = np.asarray(stops, np.float32).reshape(-1, 2)
+    cut_lines = [np.asarray(cut_line, np.float32).reshape(-1, 2) for cut_line in cut_lines]
+    hits = np.zeros((starts.shape[0], len(cut_lines)), bool)
+    for ii in range(starts.shape[0]):
+        a1 = Point(starts[ii, 0], starts[ii, 1])
+        b1 = Point(stops[ii, 0], stops[ii, 1])
+        for jj, cut_line in enumerate(cut_lines):
+            hits[ii, jj] = has_crossed(a1, b1, cut_line)
+    return hits
+
+
+def random_steps(rng, n_tracks, n_frames, lattice=None):
+    # Steps of random walks over (and slightly beyond) the image. On a lattice of
+    # `lattice` pixels the steps often share points with the cut lines or are collinear with them
+    positions = np.cumsum(rng.normal(0, 12, (n_tracks, n_frames, 2)), axis=1)
+    positions += rng.uniform((-20, -20), (WIDTH + 20, HEIGHT + 20), (n_tracks, 1, 2))
+    if lattice:
+        positions = np.round(positions / lattice) * lattice
+    return positions[:, :-1].reshape(-1, 2), positions[:, 1:].reshape(-1, 2)
+
+
+def random_cut_lines(rng, n_cut_lines, n_segments, lattice=None):
+    cut_lines = []
+    for _ in range(n_cut_lines):
+        xs = np.linspace(0, WIDTH, n_segments + 1)
+        ys = rng.uniform(0.2 * HEIGHT, 0.8 * HEIGHT) + rng.normal(0, 15, n_segments + 1)
+        cut_line = np.stack((xs, ys), axis=1)
+        if lattice:
+            cut_line = np.round(cut_line / lattice) * lattice
+        cut_lines.append(cut_line)
+    return cut_lines
+
+
+def engine_hits(starts, stops, cut_lines):
+    # Hit matrices of the dense find_crossings() and of SegmentGrid, which must agree
+    dense = crossings.find_crossings(starts, stops, crossings.stack_segments(cut_lines))
+    grid = crossings.SegmentGrid(cut_lines, WIDTH, HEIGHT).find_crossings(starts, stops)
+    np.testing.assert_array_equal(grid, dense)
+    return dense
+
+
+@pytest.mark.parametrize('n_cut_lines, n_segments', [(1, 1), (3, 8), (4, 16),  # dense path
+                                                     (2, 40), (4, 64)])  # grid path
+@pytest.mark.parametrize('lattice', [None, 8])
+def test_random_tracks(n_cut_lines, n_segments, lattice):
+    rng = np.random.default_rng(n_cut_lines * 1000 + n_segments + (lattice or 0))
+    cut_lines = random_cut_lines(rng, n_cut_lines, n_segments, lattice)
+    starts, stops = random_steps(rng, 40, 50, lattice)
+
+    hits = engine_hits(starts, stops, cut_lines)
+    np.testing.assert_array_equal(hits, reference_hits(starts, stops, cut_lines))
+    assert hits.any()
+
+
+def test_grid_path_is_used():
+    rng = np.random.default_rng(0)
+    grid = crossings.SegmentGrid(random_cut_lines(rng, 2, 40), WIDTH, HEIGHT)
+    assert grid.n_segments > crossings.SegmentGrid.DENSE_MAX_SEGMENTS
+
+
+@pytest.mark.parametrize('n_segments', [4, 80])  # dense and grid paths
+def test_degenerate_steps(n_segments):
+    # Cut line along y = 180 with vertices every WIDTH / n_segments pixels, a zero-length
+    # segment and a single-point cut line
+    xs = np.linspace(0, WIDTH, n_segments + 1)
+    straight = np.stack((xs, np.full_like(xs, 180)), axis=1)
+    repeated = np.array([[100, 50], [200, 50], [200, 50], [300, 100]])
+    cut_lines = [straight, repeated, [[320, 300]]]
+    vertex = straight[1]
+    steps = [
+        # Shared endpoints: steps starting, ending or pivoting on a vertex of the cut line
+        (vertex + (0, -10), vertex), (vertex, vertex + (0, 10)), (vertex + (-5, -5), vertex),
+        (vertex, vertex + (7, 3)), ((200, 40), (200, 50)), ((200, 50), (200, 60)),
+        ((150, 40), (150, 50)), ((320, 290), (320, 300)),
+        # Collinear steps: along the cut line, overlapping it or prolonging it
+        ((10, 180), (50, 180)), ((-30, 180), (10, 180)), ((WIDTH - 5, 180), (WIDTH + 30, 180)),
+        ((0, 50), (100, 50)), ((150, 50), (250, 50)), ((100, 50), (300, 100)),
+        # Zero-length steps: on a vertex, on a segment, beside the cut line
+        (vertex, vertex), ((55, 180), (55, 180)), ((200, 50), (200, 50)), ((320, 300), (320, 300)),
+        ((55, 181), (55, 181)),
+        # Regular crossings and near misses
+        ((55, 170), (55, 190)), ((55, 181), (55, 190)), ((250, 40), (250, 90)), ((-10, 170), (-10, 190)),
+    ]
+    starts = np.array([start for start, _ in steps], np.float32)
+    stops = np.array([stop for _, stop in steps], np.float32)
+
+    hits = engine_hits(starts, stops, cut_lines)
+    np.testing.assert_array_equal(hits, reference_hits(starts, stops, cut_lines))
+    assert not hits[:, 2].any()  # a single point cannot be crossed
+    assert hits[19, 0] and hits[21, 1] and not hits[[20, 22]].any()
+
+
+def test_no_steps_no_cut_lines():
+    cut_lines = [[[0, 180], [WIDTH, 180]]]
+    empty = np.zeros((0, 2), np.float32)
+    assert engine_hits(empty, empty, cut_lines).shape == (0, 1)
+    assert crossings.find_crossings([[0, 0]], [[10, 10]], crossings.stack_segments([])).shape == (1, 0)
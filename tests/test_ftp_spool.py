@@ -0,0 +1,161 @@
+# Tests of the FTP spool of python_src/ftp_spool.py against a fake FTP server, run with
+#   python -m pytest tests
+
+import ftplib
+import json
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'python_src'))
+import ftp_spool  # noqa: E402
+
+
+class FakeFTP:
+    # Stands for ftplib.FTP: the files stored are kept in `stored`, the first `failures`
+    # connections fail, `on_store` is called during every upload
+    stored = []
+    failures = 0
+    connections = 0
+    on_store = None
+
+    def __init__(self, server, username, password, timeout=None):
+        FakeFTP.connections += 1
+        if FakeFTP.failures:
+            FakeFTP.failures -= 1
+            raise ftplib.error_temp('421 Service not available')
+
+    def cwd(self, path):
+        pass
+
+    def voidcmd(self, command):
+        pass
+
+    def storbinary(self, command, fh):
+        if FakeFTP.on_store is not None:
+            FakeFTP.on_store(command)
+        FakeFTP.stored.append((command.split(' ', 1)[1], fh.read()))
+
+    def quit(self):
+        pass
+
+    def close(self):
+        pass
+
+
+@pytest.fixture(autouse=True)
+def fake_ftp(monkeypatch):
+    FakeFTP.stored = []
+    FakeFTP.failures = 0
+    FakeFTP.connections = 0
+    FakeFTP.on_store = None
+    monkeypatch.setattr(ftplib, 'FTP', FakeFTP)
+    return FakeFTP
+
+
+def make_spool(spool_dir, **kwargs):
+    return ftp_spool.FtpSpool(spool_dir, 'ftp.example.com', 'user', 'password', min_backoff=0.05, **kwargs)
+
+
+def write_log(directory, name, content):
+    path = directory / name
+    path.write_bytes(content)
+    return path
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition():
+        if time.time() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def test_files_are_sent_in_order_and_removed(tmp_path):
+    spool = make_spool(tmp_path / 'spool')
+    logs = [write_log(tmp_path, 'log' + str(ii) + '.csv', b'log ' + str(ii).encode()) for ii in range(3)]
+    spool.enqueue(logs)
+    assert wait_for(lambda: len(FakeFTP.stored) == 3)
+    spool.close()
+
+    assert [name for name, _ in FakeFTP.stored] == ['log0.csv', 'log1.csv', 'log2.csv']
+    assert FakeFTP.connections == 1
+    assert sorted(p.name for p in (tmp_path / 'spool').iterdir()) == [ftp_spool.MANIFEST_NAME]
+    assert json.loads((tmp_path / 'spool' / ftp_spool.MANIFEST_NAME).read_text())['pending'] == []
+
+
+def test_unreachable_server_is_retried_with_backoff(tmp_path):
+    FakeFTP.failures = 3
+    spool = make_spool(tmp_path / 'spool')
+    spool.enqueue([write_log(tmp_path, 'log.csv', b'log')])
+    assert wait_for(lambda: FakeFTP.stored)
+    spool.close()
+
+    assert FakeFTP.connections == 4
+    assert spool.backoff == 0
+    assert FakeFTP.stored == [('log.csv', b'log')]
+
+
+def test_backoff_is_capped(tmp_path):
+    FakeFTP.failures = 10**6
+    spool = make_spool(tmp_path / 'spool', max_backoff=0.2)
+    status = spool.enqueue([write_log(tmp_path, 'log.csv', b'log')])
+    assert wait_for(lambda: spool.backoff == 0.2)
+    assert 'server unreachable' in spool.enqueue([write_log(tmp_path, 'log2.csv', b'log2')])
+    spool.close()
+
+    assert status == ' and queued for FTP'
+    assert FakeFTP.stored == []
+    assert json.loads((tmp_path / 'spool' / ftp_spool.MANIFEST_NAME).read_text())['pending'] == ['log.csv', 'log2.csv']
+
+
+def test_spool_is_recovered_after_a_restart(tmp_path):
+    # Files of a previous session, with a corrupted manifest and a file it does not list
+    spool_dir = tmp_path / 'spool'
+    spool_dir.mkdir()
+    write_log(spool_dir, 'b.csv', b'b')
+    write_log(spool_dir, 'a.csv', b'a')
+    write_log(spool_dir, ftp_spool.MANIFEST_NAME + '.tmp', b'{"version"')
+    (spool_dir / ftp_spool.MANIFEST_NAME).write_text('{"version": 1, "pending": ["b.csv"')
+
+    spool = make_spool(spool_dir)
+    assert wait_for(lambda: len(FakeFTP.stored) == 2)
+    spool.close()
+
+    assert sorted(FakeFTP.stored) == [('a.csv', b'a'), ('b.csv', b'b')]
+
+
+def test_manifest_order_is_kept_after_a_restart(tmp_path):
+    spool_dir = tmp_path / 'spool'
+    spool_dir.mkdir()
+    for name in ('a.csv', 'b.csv', 'c.csv'):
+        write_log(spool_dir, name, name.encode())
+    (spool_dir / ftp_spool.MANIFEST_NAME).write_text(json.dumps({'version': ftp_spool.MANIFEST_VERSION,
+                                                                 'pending': ['c.csv', 'a.csv']}))
+
+    spool = make_spool(spool_dir)
+    assert wait_for(lambda: len(FakeFTP.stored) == 3)
+    spool.close()
+
+    assert [name for name, _ in FakeFTP.stored] == ['c.csv', 'a.csv', 'b.csv']
+
+
+def test_file_spooled_again_during_its_upload_is_sent(tmp_path):
+    spool = make_spool(tmp_path / 'spool')
+    (tmp_path / 'new').mkdir()
+    newer = write_log(tmp_path / 'new', 'log.csv', b'newer')
+
+    def spool_newer(command):
+        FakeFTP.on_store = None
+        spool.enqueue([newer])
+
+    FakeFTP.on_store = spool_newer
+    spool.enqueue([write_log(tmp_path, 'log.csv', b'older')])
+    assert wait_for(lambda: len(FakeFTP.stored) == 2)
+    spool.close()
+
+    assert FakeFTP.stored == [('log.csv', b'older'), ('log.csv', b'newer')]
+    assert not (tmp_path / 'spool' / 'log.csv').exists()
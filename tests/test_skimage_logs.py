@@ -0,0 +1,57 @@
+# Tests of the SKIMAGE logs written by python_src/log_writer.py, compared byte for byte with
+# the logs of the former pandas writer of CameraCore (tests/fixtures/skimage_logs, made by
+# tests/make_skimage_log_fixtures.py), run with
+#   python -m pytest tests
+
+import sys
+from datetime import datetime
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'python_src'))
+import crossing_log  # noqa: E402
+import log_writer  # noqa: E402
+
+FIXTURES = Path(__file__).resolve().parent / 'fixtures' / 'skimage_logs'
+
+SENSOR_ID = 7
+N_CUT_LINES = 3
+
+# Logging periods: time of the SKIMAGE log, milliseconds since the previous log, and the
+# crossings counted during the period as (time, index of the cut line crossed)
+PERIODS = {
+    'crossings': (datetime(2026, 1, 31, 23, 59, 59, 999999), 900000, [
+        (datetime(2026, 1, 31, 23, 45, 0, 0), 0),
+        (datetime(2026, 1, 31, 23, 45, 0, 999), 2),
+        (datetime(2026, 1, 31, 23, 47, 12, 345678), 0),
+        (datetime(2026, 1, 31, 23, 50, 3, 1000), 1),
+        (datetime(2026, 1, 31, 23, 50, 3, 1000), 0),
+        (datetime(2026, 1, 31, 23, 58, 9, 999999), 2),
+        (datetime(2026, 1, 31, 23, 59, 59, 999500), 0),
+    ]),
+    'no_crossings': (datetime(2026, 2, 1, 0, 15, 0, 250000), 900250, []),
+}
+
+
+def fixture_names(period):
+    return [period + '_' + str(ii) + '.csv' for ii in range(N_CUT_LINES)]
+
+
+@pytest.mark.parametrize('period', sorted(PERIODS))
+def test_skimage_logs_match_pandas_writer(tmp_path, period):
+    nowish, cut_period, crossings = PERIODS[period]
+    events = crossing_log.CrossingEvents(capacity=2)  # grows while the crossings are stored
+    for crossing_time, cut_line in crossings:
+        events.append(crossing_log.to_timestamp(crossing_time), cut_line)
+    total_row = {'date': crossing_log.format_date(nowish),
+                 'time': crossing_log.format_time(nowish),
+                 'cut_period': cut_period}
+    filenames = [tmp_path / name for name in fixture_names(period)]
+
+    writer = log_writer.LogWriter(lambda filenames: '')
+    writer.submit(log_writer.PeriodSnapshot(SENSOR_ID, filenames, total_row, events))
+    writer.close()
+
+    for filename in filenames:
+        assert filename.read_bytes() == (FIXTURES / filename.name).read_bytes(), filename.name